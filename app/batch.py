@@ -0,0 +1,332 @@
+# app/batch.py
+# Paquetes de licitación (30–80 archivos): un ZIP o varios archivos en una sola petición.
+# Todos los documentos se extraen en paralelo y sus chunks comparten una única cola
+# de llamadas al modelo, así que el tiempo total se acerca al del chunk más lento
+# y no a la suma de los documentos.
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import traceback
+import zipfile
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from app.pipeline import (
+    SUPPORTED_EXTENSIONS,
+    PipelineError,
+    analyze_chunk,
+    build_chunks,
+    check_failed_chunks,
+    chunk_pages,
+    duplicate_index,
+    duplicate_result,
+    extract_document,
+    extraction_report,
+    filter_pages,
+    find_duplicate_chunks,
+    save_upload,
+    strip_boilerplate,
+)
+from app.risk_engine import usage_model
+from app.utils.concurrency import LLM_MAX_CONCURRENCY, map_chunks, run_blocking
+from app.utils.dedup import consolidate_risks
+from app.utils.metrics import StageTimer
+from app.utils.uploads import UPLOAD_BLOCK_SIZE, UploadTooLarge, spool_upload
+from app.utils.usage import TokenBudget, summarize_usage
+
+logger = logging.getLogger("uvicorn.error")
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# Documentos máximos por paquete (sumando los de dentro de los ZIP)
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+# Tamaño descomprimido máximo de los ZIP de una petición (protección contra zip bombs)
+BATCH_MAX_UNZIPPED_MB = float(os.getenv("BATCH_MAX_UNZIPPED_MB", "1000"))
+BATCH_MAX_UNZIPPED_BYTES = int(BATCH_MAX_UNZIPPED_MB * 1024 * 1024)
+# Documentos que se extraen a la vez (la cola del modelo es aparte: LLM_MAX_CONCURRENCY)
+BATCH_PARSE_CONCURRENCY = int(os.getenv("BATCH_PARSE_CONCURRENCY", "4"))
+
+
+def _failed(name: str, error: Dict) -> Dict:
+    return {"filename": name, "status": "failed", "error": error}
+
+
+def _too_many_files() -> PipelineError:
+    return PipelineError(
+        "too_many_files", f"El paquete supera el máximo de {BATCH_MAX_FILES} documentos", 413
+    )
+
+
+# -----------------------------------------
+# 1) SUBIDA: ARCHIVOS SUELTOS Y ZIP
+# -----------------------------------------
+def _expand_zip(zip_path: str, budget_bytes: int) -> Tuple[List[Tuple[str, str]], List[Dict], int]:
+    """
+    Descomprime a temporales los miembros con extensión soportada.
+    Devuelve ([(nombre, ruta)], [miembros omitidos], bytes escritos).
+    Se cuenta lo que realmente se escribe: el tamaño declarado en el ZIP puede mentir.
+    """
+    documents: List[Tuple[str, str]] = []
+    skipped: List[Dict] = []
+    written = 0
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                name = member.filename
+                basename = os.path.basename(name.rstrip("/"))
+                if member.is_dir() or name.startswith("__MACOSX/") or basename.startswith("."):
+                    continue
+                if not basename.lower().endswith(SUPPORTED_EXTENSIONS):
+                    skipped.append({"filename": name, "error_code": "unsupported_format"})
+                    continue
+                if written + member.file_size > budget_bytes:
+                    raise UploadTooLarge()
+
+                suffix = os.path.splitext(basename)[1].lower()
+                fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix)
+                documents.append((name, path))
+                with os.fdopen(fd, "wb") as out, archive.open(member) as src:
+                    while True:
+                        block = src.read(UPLOAD_BLOCK_SIZE)
+                        if not block:
+                            break
+                        written += len(block)
+                        if written > budget_bytes:
+                            raise UploadTooLarge()
+                        out.write(block)
+    except BaseException:
+        for _, path in documents:
+            os.remove(path)
+        raise
+    return documents, skipped, written
+
+
+async def save_batch(
+    files: List[UploadFile], timer: Optional[StageTimer] = None
+) -> Tuple[List[Tuple[str, str]], List[Dict]]:
+    """
+    Vuelca a disco los archivos sueltos y el contenido de los ZIP.
+    Devuelve ([(nombre, ruta)], [omitidos]); quien llama debe pasar cada ruta a extract_document
+    (o borrarla). Formatos no soportados se omiten sin fallar el paquete.
+    """
+    timer = timer or StageTimer()
+    documents: List[Tuple[str, str]] = []
+    skipped: List[Dict] = []
+    unzipped = 0
+    try:
+        for file in files:
+            name = file.filename or ""
+            if name.lower().endswith(".zip"):
+                with timer.stage("upload"):
+                    zip_path = await spool_upload(file)
+                try:
+                    with timer.stage("unzip"):
+                        members, omitted, written = await run_blocking(
+                            _expand_zip, zip_path, BATCH_MAX_UNZIPPED_BYTES - unzipped
+                        )
+                except zipfile.BadZipFile:
+                    skipped.append({"filename": name, "error_code": "invalid_zip"})
+                    continue
+                except UploadTooLarge:
+                    raise PipelineError(
+                        "file_too_large",
+                        f"El contenido descomprimido supera el máximo permitido ({BATCH_MAX_UNZIPPED_MB:g} MB).",
+                        413,
+                    )
+                finally:
+                    os.remove(zip_path)
+                unzipped += written
+                documents.extend(members)
+                skipped.extend(omitted)
+            elif name.lower().endswith(SUPPORTED_EXTENSIONS):
+                _, path = await save_upload(file, timer)
+                documents.append((name, path))
+            else:
+                skipped.append({"filename": name, "error_code": "unsupported_format"})
+            if len(documents) > BATCH_MAX_FILES:
+                raise _too_many_files()
+    except BaseException:
+        for _, path in documents:
+            os.remove(path)
+        raise
+
+    if not documents:
+        raise PipelineError(
+            "empty_batch", "El paquete no contiene documentos soportados (.txt, .pdf o .docx)", 422
+        )
+    return documents, skipped
+
+
+# -----------------------------------------
+# 2) ANÁLISIS DEL PAQUETE
+# -----------------------------------------
+async def analyze_batch(
+    documents: List[Tuple[str, str]],
+    *,
+    context: str,
+    lang: str,
+    longdoc: bool,
+    cache_mode: str,
+    budget: TokenBudget,
+    timer: StageTimer,
+    prefilter: bool = False,
+) -> Dict:
+    """
+    Extrae, trocea y analiza todos los documentos a la vez. Cada documento pasa al modelo
+    en cuanto está extraído, compartiendo con el resto un único límite de LLM_MAX_CONCURRENCY
+    llamadas. Un documento vacío o ilegible se marca como failed sin tumbar el paquete;
+    con budget_mode=abort, agotar el presupuesto sí hace fallar la petición.
+    Los chunks casi idénticos (mismo anexo en varios documentos) se analizan una sola vez.
+    """
+    started = time.perf_counter()
+    parse_slots = asyncio.Semaphore(max(1, BATCH_PARSE_CONCURRENCY))
+    llm_slots = asyncio.Semaphore(max(1, LLM_MAX_CONCURRENCY))
+    index = duplicate_index()
+    # (documento, chunk_id) -> (resultado, páginas) de cada chunk analizado, o None si su
+    # documento falló: las copias de otros documentos lo esperan en vez de volver a pagarlo
+    loop = asyncio.get_running_loop()
+    originals: Dict[Tuple, asyncio.Future] = {}
+
+    def original(key: Tuple) -> asyncio.Future:
+        return originals.setdefault(key, loop.create_future())
+
+    def publish(position: int, chunks: List[Dict], results: Dict[int, Dict]) -> None:
+        for chunk in chunks:
+            future = original((position, chunk["chunk_id"]))
+            if not future.done():
+                result = results.get(chunk["chunk_id"])
+                future.set_result((result, chunk_pages(chunk)) if result is not None else None)
+
+    async def run_document(position: int, name: str, path: str) -> Dict:
+        try:
+            async with parse_slots:
+                pages = await extract_document(path, name.lower(), timer)
+                extraction = extraction_report(pages)
+                pages, boilerplate_report = await run_blocking(strip_boilerplate, pages, timer)
+                pages, prefilter_report = await run_blocking(filter_pages, pages, prefilter, timer)
+                chunks = await run_blocking(build_chunks, pages, longdoc, context, lang, timer)
+                unique, duplicates = await run_blocking(
+                    find_duplicate_chunks, chunks, index, position
+                )
+        except PipelineError as e:
+            return _failed(name, e.to_content())
+        except Exception as e:
+            # Un archivo corrupto no debe tumbar el resto del paquete
+            logger.error(f"Error extrayendo {name} en /analyze/batch: {str(e)}")
+            return _failed(name, {"error_code": "extraction_failed", "message": str(e)})
+
+        queued_at = time.perf_counter()
+
+        def analyze(i: int, chunk: Dict) -> Dict:
+            return analyze_chunk(
+                chunk,
+                filename=name,
+                context=context,
+                lang=lang,
+                cache_mode=cache_mode,
+                queued_at=queued_at,
+                budget=budget,
+            )
+
+        by_id: Dict[int, Dict] = {}
+        try:
+            try:
+                for result in await map_chunks(analyze, unique, semaphore=llm_slots):
+                    by_id[result["_debug"]["chunk_id"]] = result
+            finally:
+                publish(position, unique, by_id)
+
+            # Copias: resultado del original (de este documento o de otro del paquete);
+            # si el documento del original falló, la copia se analiza aquí
+            orphans = []
+            for chunk_id, key in duplicates.items():
+                found = await original(key)
+                if found is None:
+                    orphans.append(chunks[chunk_id - 1])
+                else:
+                    by_id[chunk_id] = duplicate_result(chunks[chunk_id - 1], *found, name)
+            for result in await map_chunks(analyze, orphans, semaphore=llm_slots):
+                by_id[result["_debug"]["chunk_id"]] = result
+            results = [by_id[chunk["chunk_id"]] for chunk in chunks]
+            failed = check_failed_chunks(results)
+        except PipelineError as e:
+            if e.error_code == "token_budget_exceeded":
+                raise
+            return _failed(name, e.to_content())
+        except Exception as e:
+            logger.error(f"Error analizando {name} en /analyze/batch: {str(e)}")
+            logger.error(traceback.format_exc())
+            return _failed(name, {"error_code": "internal_error", "message": str(e)})
+
+        merged = await run_blocking(consolidate_risks, results)
+        return {
+            "filename": name,
+            "status": "done",
+            "pages": len(pages),
+            "extraction": extraction,
+            "prefilter": prefilter_report,
+            "boilerplate": boilerplate_report,
+            "intuitive_risks": merged["intuitive_risks"],
+            "counterintuitive_risks": merged["counterintuitive_risks"],
+            "chunks": results,
+            "failed_chunks": failed,
+            "duplicate_chunks": len(duplicates),
+            "usage": summarize_usage(results, usage_model()),
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        }
+
+    tasks = [
+        asyncio.create_task(run_document(position, name, path))
+        for position, (name, path) in enumerate(documents)
+    ]
+    try:
+        reports = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Los documentos que no llegaron a extraerse siguen en disco
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for _, path in documents:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    # 📋 Registro consolidado del paquete: un riesgo por grupo de casi duplicados entre
+    # todos los documentos, con sus referencias (filename, chunk_id, page)
+    all_results = [result for report in reports for result in report.get("chunks", [])]
+    prefiltered = [r["prefilter"] for r in reports if r.get("prefilter", {}).get("enabled")]
+    units = sum(p["units"] for p in prefiltered)
+    skipped_units = sum(p["skipped_units"] for p in prefiltered)
+    merged = await run_blocking(consolidate_risks, all_results)
+    return {
+        "documents": reports,
+        "intuitive_risks": merged["intuitive_risks"],
+        "counterintuitive_risks": merged["counterintuitive_risks"],
+        "usage": summarize_usage(all_results, usage_model(), budget),
+        "prefilter": {
+            "enabled": prefilter,
+            "units": units,
+            "skipped_units": skipped_units,
+            "skip_ratio": round(skipped_units / units, 3) if units else 0.0,
+        },
+        "boilerplate": {
+            "tokens_saved": sum(r.get("boilerplate", {}).get("tokens_saved", 0) for r in reports),
+        },
+        "_debug": {
+            "documents": len(reports),
+            "duplicate_chunks": sum(r.get("duplicate_chunks", 0) for r in reports),
+            "failed_documents": sum(1 for r in reports if r["status"] == "failed"),
+            "chunks": len(all_results),
+            "slowest_chunk_s": max(
+                (r["_debug"]["timings"]["llm_s"] for r in all_results), default=0.0
+            ),
+            "elapsed_s": round(time.perf_counter() - started, 3),
+            "dedup": merged["_debug"],
+            "timings": timer.timings,
+        },
+    }
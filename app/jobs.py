@@ -0,0 +1,311 @@
+# app/jobs.py
+# Análisis asíncronos: POST /jobs devuelve un id al momento y el pipeline corre en segundo plano
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import traceback
+import uuid
+from typing import Dict, List, Optional
+
+from app.pipeline import (
+    PipelineError,
+    document_page_count,
+    estimated_total_chunks,
+    failed_chunks,
+    iter_document_results,
+    raise_if_all_failed,
+)
+from app.utils.relevance import RELEVANCE_PREFILTER
+from app.utils.concurrency import run_blocking
+from app.utils.usage import TokenBudget
+
+logger = logging.getLogger("uvicorn.error")
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+JOBS_DB_PATH = os.getenv(
+    "JOBS_DB_PATH", os.path.join(tempfile.gettempdir(), "ai_risk_radar_jobs.sqlite3")
+)
+# Nº de trabajos que se ejecutan a la vez (el resto espera en cola)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobStore:
+    """Estado de los trabajos en SQLite: sobrevive a reinicios del worker."""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    worker_pid INTEGER NOT NULL,
+                    total_chunks INTEGER,
+                    total_pages INTEGER,
+                    estimated_chunks INTEGER,
+                    done_chunks INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ("total_pages", "estimated_chunks"):
+                if column not in columns:  # bases creadas antes de estimar el progreso
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} INTEGER")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_chunks (
+                    job_id TEXT NOT NULL,
+                    chunk_id INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (job_id, chunk_id)
+                )
+                """
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _execute(self, sql: str, args: tuple = ()) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(sql, args)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def create(self, job_id: str, filename: str, params: Dict) -> None:
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, filename, params, worker_pid, created, updated) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (job_id, filename, json.dumps(params), os.getpid(), now, now),
+        )
+
+    def set_status(self, job_id: str, status: str, error: Optional[Dict] = None) -> None:
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?",
+            (status, json.dumps(error) if error else None, time.time(), job_id),
+        )
+
+    def set_total(self, job_id: str, total_chunks: int) -> None:
+        self._execute(
+            "UPDATE jobs SET total_chunks = ?, updated = ? WHERE id = ?",
+            (total_chunks, time.time(), job_id),
+        )
+
+    def set_pages(self, job_id: str, total_pages: Optional[int]) -> None:
+        self._execute(
+            "UPDATE jobs SET total_pages = ?, updated = ? WHERE id = ?",
+            (total_pages, time.time(), job_id),
+        )
+
+    def add_chunk(
+        self, job_id: str, chunk_id: int, result: Dict, estimated_chunks: Optional[int] = None
+    ) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_chunks (job_id, chunk_id, result) VALUES (?, ?, ?)",
+                (job_id, chunk_id, json.dumps(result, ensure_ascii=False)),
+            )
+            conn.execute(
+                "UPDATE jobs SET done_chunks = done_chunks + 1, "
+                "estimated_chunks = COALESCE(?, estimated_chunks), updated = ? WHERE id = ?",
+                (estimated_chunks, time.time(), job_id),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def status(self, job_id: str) -> Optional[str]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT status, filename, total_chunks, total_pages, estimated_chunks, "
+                "done_chunks, error, created, updated FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = [
+                json.loads(result)
+                for (result,) in conn.execute(
+                    "SELECT result FROM job_chunks WHERE job_id = ? ORDER BY chunk_id", (job_id,)
+                )
+            ]
+        finally:
+            conn.close()
+
+        status, filename, total, total_pages, estimated, done, error, created, updated = row
+        if total:
+            percent = round(100.0 * done / total, 1)
+        elif estimated:
+            # Aún se está leyendo el documento: progreso sobre el total estimado, sin
+            # llegar al 100 % hasta conocer el real
+            percent = min(99.0, round(100.0 * done / estimated, 1))
+        else:
+            percent = 100.0 if status == "done" else 0.0
+        return {
+            "job_id": job_id,
+            "status": status,
+            "filename": filename,
+            "total_chunks": total,
+            "estimated_chunks": estimated if total is None else total,
+            "total_pages": total_pages,
+            "done_chunks": done,
+            "percent": percent,
+            "error": json.loads(error) if error else None,
+            "created": created,
+            "updated": updated,
+            "chunks": chunks,
+        }
+
+    def mark_interrupted(self) -> int:
+        """
+        Al arrancar: los trabajos activos cuyo proceso ya no existe no se pueden
+        reanudar (su subida se perdió). Se conservan los chunks ya terminados.
+        """
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, worker_pid FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+            ).fetchall()
+            dead = [(time.time(), job_id) for job_id, pid in rows if not _pid_alive(pid)]
+            conn.executemany(
+                "UPDATE jobs SET status = 'interrupted', updated = ? WHERE id = ?", dead
+            )
+            conn.commit()
+            return len(dead)
+        finally:
+            conn.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return False  # mismo pid que el proceso recién arrancado: es un job huérfano
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobManager:
+    """Lanza cada trabajo como tarea asyncio; como máximo JOB_WORKERS a la vez."""
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def submit(self, upload_path: str, filename: str, params: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, filename, params)
+        task = asyncio.create_task(self._run(job_id, upload_path, filename, params))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancela un trabajo activo. Si corre en otro worker de uvicorn,
+        basta con marcarlo: ese worker lo detiene tras el chunk en curso.
+        """
+        if self.store.status(job_id) not in ACTIVE_STATUSES:
+            return False
+        self.store.set_status(job_id, "cancelled")
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        return True
+
+    async def _run(self, job_id: str, upload_path: str, filename: str, params: Dict) -> None:
+        try:
+            async with self._slots:
+                if await run_blocking(self.store.status, job_id) == "cancelled":
+                    return  # cancelado mientras esperaba en cola
+                await run_blocking(self.store.set_status, job_id, "running")
+                # Streaming: total_chunks se conoce al terminar de leer el documento; hasta
+                # entonces el progreso se mide sobre un total estimado con el nº de páginas
+                total_pages = await run_blocking(document_page_count, upload_path, filename)
+                await run_blocking(self.store.set_pages, job_id, total_pages)
+                report: Dict = {}
+                total = None
+                failed: List[Dict] = []
+                results = iter_document_results(
+                    upload_path,
+                    filename,
+                    context=params["context"],
+                    lang=params["lang"],
+                    longdoc=params["longdoc"],
+                    cache_mode=params["cache"],
+                    budget=TokenBudget(params["token_budget"], params["budget_mode"]),
+                    prefilter=params.get("prefilter", RELEVANCE_PREFILTER),
+                    report=report,
+                )
+                try:
+                    async for result in results:
+                        if report["total_chunks"] is not None and total is None:
+                            total = report["total_chunks"]
+                            await run_blocking(self.store.set_total, job_id, total)
+                        await run_blocking(
+                            self.store.add_chunk,
+                            job_id,
+                            result["_debug"]["chunk_id"],
+                            result,
+                            estimated_total_chunks(report, total_pages),
+                        )
+                        failed.extend(failed_chunks([result]))
+                        if await run_blocking(self.store.status, job_id) == "cancelled":
+                            return
+                finally:
+                    await results.aclose()  # cancela los chunks en vuelo
+                await run_blocking(self.store.set_total, job_id, report["total_chunks"])
+                # Como en /analyze: si no se pudo analizar ningún chunk, el trabajo falla
+                raise_if_all_failed(failed, report["total_chunks"])
+                await run_blocking(self.store.set_status, job_id, "done")
+        except asyncio.CancelledError:
+            self.store.set_status(job_id, "cancelled")
+            raise
+        except PipelineError as e:
+            self.store.set_status(job_id, "failed", e.to_content())
+        except Exception as e:
+            logger.error(f"Error en job {job_id}: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.store.set_status(
+                job_id, "failed", {"error_code": "internal_error", "message": str(e)}
+            )
+        finally:
+            # Si se canceló antes de extraer, el temporal sigue ahí
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
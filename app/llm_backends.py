@@ -0,0 +1,475 @@
+# app/llm_backends.py
+# Backends intercambiables para la llamada al modelo (LLM_BACKEND=openai|fake|record|replay)
+
+import abc
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from typing import Dict, Generator, List, Optional, Tuple
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# USE_MOCK=1 (antigua constante de risk_engine) equivale a LLM_BACKEND=fake
+USE_MOCK = os.getenv("USE_MOCK", "").lower() in ("1", "true", "yes")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "fake" if USE_MOCK else "openai").lower()
+LLM_RECORD_DIR = os.getenv("LLM_RECORD_DIR", "llm_recordings")
+
+FAKE_LLM_LATENCY_S = float(os.getenv("FAKE_LLM_LATENCY_S", "0.5"))
+FAKE_LLM_JITTER_S = float(os.getenv("FAKE_LLM_JITTER_S", "0.2"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0.0"))
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED")
+# Límite de peticiones por minuto que simula el backend fake (429 al superarlo; 0 = sin límite)
+FAKE_LLM_RPM = int(os.getenv("FAKE_LLM_RPM", "0"))
+# Fracción de respuestas que el backend fake corta a medias (como un max_tokens agotado)
+FAKE_LLM_TRUNCATE_RATE = float(os.getenv("FAKE_LLM_TRUNCATE_RATE", "0.0"))
+# Tamaño de los fragmentos de la respuesta en streaming del backend fake
+FAKE_STREAM_PIECE_CHARS = 24
+
+
+@dataclass
+class Completion:
+    """Respuesta de un backend: texto generado y uso de tokens (prompt, completion, cached)."""
+
+    content: str
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+class CompletionStream:
+    """
+    Respuesta por fragmentos: se itera para recibir el texto a medida que llega.
+    Al terminar, .content tiene el texto completo y .usage el uso de tokens.
+    """
+
+    def __init__(self, source: Generator[str, None, Dict[str, int]]):
+        self._source = source  # generador de fragmentos que devuelve (return) el uso
+        self._parts: List[str] = []
+        self.usage: Dict[str, int] = {}
+
+    def __iter__(self):
+        while True:
+            try:
+                delta = next(self._source)
+            except StopIteration as stop:
+                self.usage = stop.value or {}
+                return
+            self._parts.append(delta)
+            yield delta
+
+    @property
+    def content(self) -> str:
+        return "".join(self._parts)
+
+
+class LLMTransientError(RuntimeError):
+    """Fallo pasajero del proveedor (timeout, 5xx, 429): la llamada se puede reintentar."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMTransientError):
+    """El proveedor rechazó la llamada por límite de peticiones o tokens (HTTP 429)."""
+
+
+class LLMBackend(abc.ABC):
+    """Interfaz común: recibe mensajes de chat y devuelve un Completion."""
+
+    name = "base"
+
+    @property
+    def cache_namespace(self) -> str:
+        # Los resultados de backends simulados no deben mezclarse con los reales en la caché
+        return ""
+
+    @abc.abstractmethod
+    def complete(
+        self,
+        messages: List[Dict],
+        *,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        json_mode: bool = False,
+    ) -> Completion:
+        """Respuesta completa del modelo (cada backend debe implementarla)."""
+
+    def stream(
+        self,
+        messages: List[Dict],
+        *,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        json_mode: bool = False,
+    ) -> CompletionStream:
+        """Respuesta en streaming; por defecto, la respuesta completa en un solo fragmento."""
+
+        def source():
+            completion = self.complete(
+                messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                json_mode=json_mode,
+            )
+            yield completion.content
+            return completion.usage
+
+        return CompletionStream(source())
+
+    def warm_up(self) -> None:
+        """Prepara lo caro (imports, cliente HTTP) antes de la primera llamada."""
+
+
+# ==========================================
+# 🌐 OpenAI
+# ==========================================
+class OpenAIBackend(LLMBackend):
+    """Cliente oficial de OpenAI; se crea en la primera llamada, no al importar."""
+
+    name = "openai"
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("OPENAI_API_KEY no está definida en .env ni en el entorno.")
+                # Los reintentos los hace LLMScheduler (compartidos por todo el proceso)
+                self._client = OpenAI(api_key=api_key, max_retries=0)
+            return self._client
+
+    def warm_up(self) -> None:
+        self.client  # importa openai y crea el cliente HTTP
+
+    def complete(self, messages, *, model, temperature, max_tokens, json_mode=False) -> Completion:
+        with _translate_errors():
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **_response_format(json_mode),
+            )
+        return Completion(
+            content=response.choices[0].message.content or "", usage=_usage(response.usage)
+        )
+
+    def stream(self, messages, *, model, temperature, max_tokens, json_mode=False) -> CompletionStream:
+        def source():
+            usage = {}
+            with _translate_errors():
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **_response_format(json_mode),
+                    stream=True,
+                    stream_options={"include_usage": True},  # el uso llega en el último evento
+                )
+                for event in response:
+                    if event.usage is not None:
+                        usage = _usage(event.usage)
+                    if event.choices and event.choices[0].delta.content:
+                        yield event.choices[0].delta.content
+            return usage
+
+        return CompletionStream(source())
+
+
+def _response_format(json_mode: bool) -> Dict:
+    # JSON mode: el modelo solo puede devolver un objeto JSON válido (salvo corte por max_tokens)
+    return {"response_format": {"type": "json_object"}} if json_mode else {}
+
+
+def _usage(response_usage) -> Dict[str, int]:
+    if response_usage is None:
+        return {}
+    details = getattr(response_usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": response_usage.prompt_tokens,
+        "completion_tokens": response_usage.completion_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+    }
+
+
+@contextmanager
+def _translate_errors():
+    """Errores reintentables del SDK de OpenAI -> LLMRateLimitError / LLMTransientError."""
+    import openai
+
+    try:
+        yield
+    except openai.RateLimitError as e:
+        if getattr(e, "code", None) == "insufficient_quota":
+            raise  # sin saldo: reintentar no sirve
+        raise LLMRateLimitError(str(e), _retry_after(e.response)) from e
+    except (openai.APIConnectionError, openai.InternalServerError) as e:
+        # APITimeoutError es un APIConnectionError
+        raise LLMTransientError(str(e), _retry_after(getattr(e, "response", None))) from e
+
+
+def _retry_after(response) -> Optional[float]:
+    """Segundos de espera que pide el proveedor (retry-after-ms o retry-after), si los da."""
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass  # retry-after con fecha HTTP: se usa el backoff normal
+    return None
+
+
+# ==========================================
+# 🧪 Fake: latencia, jitter y errores configurables
+# ==========================================
+class FakeBackendError(LLMTransientError):
+    """Error simulado (según FAKE_LLM_ERROR_RATE)."""
+
+
+_FAKE_RISKS = [
+    ("Verzögerung durch Planfeststellungsverfahren", "Einwendungen Dritter verlängern das Verfahren"),
+    ("Retraso en la disponibilidad de cortes de vía", "Las ventanas de corte se asignan con años de antelación"),
+    ("Cost overrun due to unexpected ground conditions", "Limited borehole coverage along the alignment"),
+    ("Conflicto con el suministro de energía de tracción", "Dependencia de obras de terceros no coordinadas"),
+    ("Kostensteigerung bei Stahl und Beton", "Indexierung im Vertrag fehlt"),
+    ("Signalling interface mismatch with ETCS baseline", "Different suppliers on adjacent sections"),
+]
+
+_PAGE_MARKER = re.compile(r"\[Página (\d+)\]")
+
+
+class FakeBackend(LLMBackend):
+    """
+    Backend local sin red: responde JSON válido con el esquema de generate_risks,
+    determinista para un mismo prompt, con latencia, jitter y tasa de error configurables.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_s: float = FAKE_LLM_LATENCY_S,
+        jitter_s: float = FAKE_LLM_JITTER_S,
+        error_rate: float = FAKE_LLM_ERROR_RATE,
+        seed: Optional[str] = FAKE_LLM_SEED,
+        rpm_limit: int = FAKE_LLM_RPM,
+        truncate_rate: float = FAKE_LLM_TRUNCATE_RATE,
+    ):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.error_rate = error_rate
+        self.rpm_limit = rpm_limit
+        self.truncate_rate = truncate_rate
+        self._timing = random.Random(seed)
+        self._calls: List[float] = []  # instantes de las llamadas del último minuto
+        self._lock = threading.Lock()
+
+    @property
+    def cache_namespace(self) -> str:
+        return "fake"
+
+    def _start(self) -> Tuple[float, Optional[float]]:
+        """
+        Aplica el límite RPM simulado y sortea latencia, fallo y corte.
+        Devuelve (latencia, fracción de la respuesta que se entrega o None si va entera).
+        """
+        with self._lock:
+            if self.rpm_limit:
+                now = time.monotonic()
+                self._calls = [t for t in self._calls if now - t < 60]
+                if len(self._calls) >= self.rpm_limit:
+                    raise LLMRateLimitError(
+                        "Límite de peticiones simulado", retry_after=60 - (now - self._calls[0])
+                    )
+                self._calls.append(now)
+            delay = max(0.0, self.latency_s + self._timing.uniform(-self.jitter_s, self.jitter_s))
+            fail = self._timing.random() < self.error_rate
+            cut = self._timing.uniform(0.3, 0.9) if self._timing.random() < self.truncate_rate else None
+        if fail:
+            time.sleep(delay)
+            raise FakeBackendError("Error simulado del backend fake")
+        return delay, cut
+
+    def complete(self, messages, *, model, temperature, max_tokens, json_mode=False) -> Completion:
+        delay, cut = self._start()
+        time.sleep(delay)
+        return self._respond(messages[-1]["content"], cut)
+
+    def stream(self, messages, *, model, temperature, max_tokens, json_mode=False) -> CompletionStream:
+        delay, cut = self._start()
+        completion = self._respond(messages[-1]["content"], cut)
+        pieces = [
+            completion.content[i:i + FAKE_STREAM_PIECE_CHARS]
+            for i in range(0, len(completion.content), FAKE_STREAM_PIECE_CHARS)
+        ] or [""]
+
+        def source():
+            # La latencia se reparte entre los fragmentos, como la generación de tokens
+            for piece in pieces:
+                time.sleep(delay / len(pieces))
+                yield piece
+            return completion.usage
+
+        return CompletionStream(source())
+
+    def _respond(self, prompt: str, cut: Optional[float] = None) -> Completion:
+        # El contenido depende solo del prompt: misma entrada, misma salida
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        pages = [int(n) for n in _PAGE_MARKER.findall(prompt)] or [1]
+        result = {}
+        for list_name in ("intuitive_risks", "counterintuitive_risks"):
+            risks = []
+            for risk, justification in rng.sample(_FAKE_RISKS, rng.randint(0, 3)):
+                risks.append(
+                    {
+                        "risk": risk,
+                        "justification": justification,
+                        "countermeasure": "Plan de contingencia y seguimiento mensual",
+                        "page": rng.choice(pages),
+                        "evidence": prompt[rng.randrange(max(1, len(prompt) - 80)):][:80].strip(),
+                    }
+                )
+            result[list_name] = risks
+
+        content = json.dumps(result, ensure_ascii=False)
+        if cut is not None:
+            content = content[:int(len(content) * cut)]
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        return Completion(content=content, usage=usage)
+
+
+# ==========================================
+# 📼 Record / replay en disco
+# ==========================================
+class ReplayMiss(KeyError):
+    """No hay respuesta grabada para este prompt."""
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    mode="record": llama al backend real y guarda cada respuesta en disco.
+    mode="replay": responde solo con lo grabado (sin red); si falta, ReplayMiss.
+    Las respuestas se indexan por hash de modelo + mensajes + parámetros.
+    """
+
+    def __init__(self, directory: str, mode: str, inner: Optional[LLMBackend] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de grabación no válido: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.name = mode
+        self.inner = inner or OpenAIBackend()
+
+    @staticmethod
+    def prompt_hash(messages, *, model, temperature, max_tokens, json_mode=False) -> str:
+        params = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        if json_mode:
+            params["response_format"] = "json_object"  # sin JSON mode, las grabaciones antiguas siguen valiendo
+        payload = json.dumps(params, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def warm_up(self) -> None:
+        if self.mode == "record":
+            self.inner.warm_up()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load(self, path: str, key: str) -> Completion:
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            raise ReplayMiss(f"No hay respuesta grabada para el prompt {key}")
+        return Completion(content=record["content"], usage=record.get("usage", {}))
+
+    def _save(self, path: str, model: str, completion: Completion) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"model": model, "content": completion.content, "usage": completion.usage},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, path)  # escritura atómica
+
+    def complete(self, messages, *, model, temperature, max_tokens, json_mode=False) -> Completion:
+        params = {"model": model, "temperature": temperature, "max_tokens": max_tokens, "json_mode": json_mode}
+        key = self.prompt_hash(messages, **params)
+        path = self._path(key)
+
+        if self.mode == "replay":
+            return self._load(path, key)
+
+        completion = self.inner.complete(messages, **params)
+        self._save(path, model, completion)
+        return completion
+
+    def stream(self, messages, *, model, temperature, max_tokens, json_mode=False) -> CompletionStream:
+        params = {"model": model, "temperature": temperature, "max_tokens": max_tokens, "json_mode": json_mode}
+        # Se graba la respuesta completa: se reproduce igual con complete() o stream()
+        if self.mode == "replay":
+            return super().stream(messages, **params)
+
+        key = self.prompt_hash(messages, **params)
+        inner = self.inner.stream(messages, **params)
+
+        def source():
+            yield from inner
+            self._save(self._path(key), model, Completion(content=inner.content, usage=inner.usage))
+            return inner.usage
+
+        return CompletionStream(source())
+
+
+# ==========================================
+# 🔌 Selección por entorno
+# ==========================================
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    if name == "openai":
+        return OpenAIBackend()
+    if name == "fake":
+        return FakeBackend()
+    if name in ("record", "replay"):
+        return RecordReplayBackend(LLM_RECORD_DIR, name)
+    raise ValueError(f"LLM_BACKEND no reconocido: {name} (usa openai, fake, record o replay)")
+
+
+def get_backend() -> LLMBackend:
+    """Backend del proceso (uno solo, creado en la primera llamada)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Sustituye el backend del proceso (benchmarks, pruebas de carga)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,180 @@
+# app/llm_scheduler.py
+# Planificador de llamadas al modelo para todo el proceso: límites de peticiones y tokens
+# por minuto (token bucket), Retry-After y reintentos con backoff exponencial con jitter.
+#
+# Las llamadas corren en hilos (run_blocking), así que las esperas son time.sleep:
+# bloquean el hilo del chunk, nunca el event loop.
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+from app.llm_backends import LLMRateLimitError, LLMTransientError
+from app.utils.metrics import Counter, Gauge, Histogram, observe_stage
+
+logger = logging.getLogger("uvicorn.error")
+
+R = TypeVar("R")
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# Límites de la cuenta de OpenAI para el modelo (0 = sin límite)
+LLM_RPM = int(os.getenv("LLM_RPM", "0"))
+LLM_TPM = int(os.getenv("LLM_TPM", "0"))
+# Reintentos ante 429, 5xx y timeouts (además del primer intento)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1.0"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "60"))
+
+QUEUE_DEPTH = Gauge("risk_radar_llm_queue_depth", "Llamadas esperando turno en el planificador")
+THROTTLE_SECONDS = Histogram(
+    "risk_radar_llm_throttle_seconds",
+    "Espera por límite (reason: rpm, tpm, retry_after, backoff)",
+    ("reason",),
+)
+RETRIES_TOTAL = Counter(
+    "risk_radar_llm_retries_total", "Reintentos de llamadas al modelo (reason: rate_limit, transient)", ("reason",)
+)
+
+
+class TokenBucket:
+    """
+    Cubo que se rellena a `per_minute` unidades por minuto, con capacidad de un minuto.
+    try_take devuelve 0 si había saldo (y lo descuenta) o los segundos hasta que lo haya.
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def try_take(self, amount: float) -> float:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Una petición mayor que la capacidad pasaría sola con el cubo lleno
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class LLMScheduler:
+    """
+    Delante de cada llamada: espera a que los cubos de RPM y TPM tengan saldo
+    (y a que pase cualquier Retry-After que haya pedido el proveedor) y reintenta
+    los fallos transitorios. Un 429 con Retry-After pausa a todas las llamadas del proceso.
+    """
+
+    def __init__(
+        self,
+        rpm: int = LLM_RPM,
+        tpm: int = LLM_TPM,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base_s: float = LLM_BACKOFF_BASE_S,
+        backoff_max_s: float = LLM_BACKOFF_MAX_S,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.requests = TokenBucket(rpm, clock) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm, clock) if tpm > 0 else None
+        self.max_retries = max(0, max_retries)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def backoff(self, attempt: int) -> float:
+        """Backoff exponencial con jitter completo: uniforme en [0, min(max, base·2^intento)]."""
+        return self.rng.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+
+    def _wait_turn(self, estimated_tokens: int) -> float:
+        """Bloquea hasta poder enviar; devuelve los segundos esperados."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                reason, delay = "retry_after", self.paused_until - self.clock()
+                if delay <= 0:
+                    reason, delay = "rpm", self.requests.try_take(1) if self.requests else 0.0
+                    if delay <= 0 and self.tokens:
+                        reason, delay = "tpm", self.tokens.try_take(estimated_tokens)
+                        if delay > 0 and self.requests:
+                            self.requests.tokens += 1  # devolver el turno de RPM ya descontado
+            if delay <= 0:
+                return waited
+            THROTTLE_SECONDS.observe(delay, reason=reason)
+            self.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def call(self, fn: Callable[[], R], estimated_tokens: int = 0) -> R:
+        """
+        Ejecuta fn() respetando los límites. `estimated_tokens` es lo que el proveedor
+        descuenta del TPM al recibir la petición (entrada + max_tokens de salida).
+        """
+        attempt = 0
+        while True:
+            QUEUE_DEPTH.inc()
+            try:
+                waited = self._wait_turn(estimated_tokens)
+            finally:
+                QUEUE_DEPTH.dec()
+            if waited:
+                observe_stage("llm_throttle", waited)
+
+            try:
+                return fn()
+            except LLMTransientError as e:
+                if attempt >= self.max_retries:
+                    raise
+                rate_limited = isinstance(e, LLMRateLimitError)
+                RETRIES_TOTAL.inc(reason="rate_limit" if rate_limited else "transient")
+                if e.retry_after is not None:
+                    delay = e.retry_after
+                    if rate_limited:
+                        # El límite es de la cuenta: que esperen también las demás llamadas
+                        self.pause(delay)
+                        delay = 0.0
+                else:
+                    delay = self.backoff(attempt)
+                attempt += 1
+                logger.warning(
+                    f"Llamada al modelo fallida ({e}); reintento {attempt}/{self.max_retries}"
+                    + (f" en {delay:.1f}s" if delay else "")
+                )
+                if delay:
+                    THROTTLE_SECONDS.observe(delay, reason="backoff")
+                    self.sleep(delay)
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Planificador del proceso (compartido por todas las peticiones)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+
+def set_scheduler(scheduler: Optional[LLMScheduler]) -> None:
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
@@ -1,110 +1,251 @@
+import asyncio
+import json
 import logging
+import time
 import traceback
+from contextlib import asynccontextmanager
+from typing import List
 from fastapi import FastAPI, File, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-# 📄 Parsers existentes para PDF, DOCX y TXT
-from app.parsers import (
-    extract_text_from_pdf,
-    extract_text_from_docx,
-    extract_text_from_txt,
+from app.utils.analysis_cache import CACHE_MODES
+
+# 🧩 Pasos del pipeline: extracción, chunks con páginas y análisis por chunk
+from app.pipeline import (
+    PipelineError,
+    analyze_chunk,
+    build_chunks,
+    check_failed_chunks,
+    copies_of,
+    duplicate_index,
+    empty_document_error,
+    extraction_report,
+    failed_chunks,
+    filter_pages,
+    find_duplicate_chunks,
+    iter_document_results,
+    load_document,
+    save_upload,
+    strip_boilerplate,
+)
+
+# 🗂️ Trabajos asíncronos con estado persistente
+from app.jobs import JOBS_DB_PATH, JobManager, JobStore
+
+# 🧬 Fusión de riesgos casi duplicados entre chunks
+from app.utils.dedup import consolidate_risks
+
+# ⚡ Ejecución concurrente de chunks sin bloquear el event loop
+from app.utils.concurrency import iter_chunks_as_completed, run_blocking
+
+# 📦 Subidas volcadas a disco por bloques, con tamaño máximo
+from app.utils.uploads import (
+    FORM_OVERHEAD_BYTES,
+    MAX_BATCH_UPLOAD_BYTES,
+    UploadLimitMiddleware,
+    batch_too_large_content,
+)
+
+# ⏱️ Latencia por etapa (histogramas Prometheus en /metrics)
+from app.utils.metrics import REQUEST_SECONDS, StageTimer, observe_stage, render_metrics
+
+# 🎟️ Tokens, coste y presupuesto por petición
+from app.risk_engine import usage_model
+from app.utils.usage import (
+    BUDGET_MODES,
+    REQUEST_TOKEN_BUDGET,
+    TokenBudget,
+    get_usage_store,
+    summarize_usage,
 )
 
-# 🧠 Función que manda texto al modelo (ya existente)
-from app.risk_engine import generate_risks
+# 🔎 Prefiltro local de páginas sin riesgos (portadas, índices, firmas...)
+from app.utils.relevance import RELEVANCE_PREFILTER
+
+# 🔁 Re-análisis incremental de revisiones de un proyecto
+from app.revisions import REVISIONS_DB_PATH, RevisionStore, analyze_revision
+
+# 📦 Paquetes de licitación: ZIP o varios archivos con una cola LLM compartida
+from app.batch import analyze_batch, save_batch
+
+# 🔥 Arranque en frío rápido: imports diferidos y pre-calentamiento opcional
+from app.warmup import Warmup
 
-# 🧩 NUEVO: función modular de chunking
-from app.utils.chunking import split_into_chunks  
 logging.basicConfig(
     level=logging.INFO,  # Cambia a DEBUG si quieres más detalle
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger("uvicorn.error")
-app = FastAPI(debug=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    store = JobStore(JOBS_DB_PATH)
+    interrupted = store.mark_interrupted()
+    if interrupted:
+        logger.warning(f"{interrupted} job(s) interrumpidos por un reinicio anterior")
+    app.state.jobs = JobManager(store)
+    app.state.revisions = RevisionStore(REVISIONS_DB_PATH)
+    # 🔥 Carga en segundo plano (WARMUP=1) de tokenizer, cliente LLM y parsers
+    app.state.warmup = Warmup()
+    app.state.warmup.start()
+    yield
+
+
+app = FastAPI(debug=True, lifespan=lifespan)
+# 📦 Los paquetes traen decenas de archivos: su propio límite total (cada archivo, MAX_UPLOAD_MB)
+app.add_middleware(
+    UploadLimitMiddleware,
+    path_limits={
+        "/analyze/batch": (MAX_BATCH_UPLOAD_BYTES + FORM_OVERHEAD_BYTES, batch_too_large_content())
+    },
+)
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/ready")
+def ready():
+    """200 cuando el pre-calentamiento terminó (o está desactivado); 503 mientras tanto."""
+    warmup = app.state.warmup
+    return JSONResponse(
+        content={"ready": warmup.ready, "warmup": warmup.to_dict()},
+        status_code=200 if warmup.ready else 503,
+    )
+
 @app.get("/")
 def root():
     return {"message": "AI Risk Radar API is running"}
 
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/usage")
+async def usage(days: int = 30):
+    """Tokens y coste estimado por día (UTC) y modelo."""
+    rows = await run_blocking(get_usage_store().daily, max(1, days))
+    return {"days": rows}
+
+
+def _check_cache_mode(cache: str) -> None:
+    if cache not in CACHE_MODES:
+        raise PipelineError(
+            "invalid_cache_mode",
+            f"Modo de caché no válido (usa {', '.join(CACHE_MODES)})",
+            400,
+        )
+
+
+def _check_budget_mode(budget_mode: str) -> None:
+    if budget_mode not in BUDGET_MODES:
+        raise PipelineError(
+            "invalid_budget_mode",
+            f"Modo de presupuesto no válido (usa {', '.join(BUDGET_MODES)})",
+            400,
+        )
+
+
 @app.post("/analyze")
 async def analyze_document(
     file: UploadFile = File(...),
     context: str = Form(""),
     lang: str = Form("es"),
     longdoc: bool = Form(False),  # 🆕 Nuevo flag para activar modo long doc
+    cache: str = Form("use"),  # 💾 use | bypass | refresh
+    token_budget: int = Form(REQUEST_TOKEN_BUDGET),  # 🎟️ tokens máx. de la petición (0 = sin límite)
+    budget_mode: str = Form("degrade"),  # degrade | abort
+    prefilter: bool = Form(RELEVANCE_PREFILTER),  # 🔎 true = no enviar portadas, índices ni firmas
 ):
+    timer = StageTimer()
     try:
-        filename = (file.filename or "").lower()
-        file_bytes = await file.read()
+        _check_cache_mode(cache)
+        _check_budget_mode(budget_mode)
+        budget = TokenBudget(token_budget, budget_mode)
 
         # -----------------------------------------
-        # 1) EXTRACCIÓN DE TEXTO (ya lo tienes)
+        # 1) EXTRACCIÓN + 2) ANÁLISIS DE RIESGOS (en streaming)
         # -----------------------------------------
-        if filename.endswith(".pdf"):
-            text_per_page = extract_text_from_pdf(file_bytes)
-            joined_text = "\n---\n".join(
-                [f"[Página {p['page']}]\n{p['text']}" for p in text_per_page]
-            )
-        elif filename.endswith(".docx"):
-            joined_text = extract_text_from_docx(file_bytes)
-        elif filename.endswith(".txt"):
-            joined_text = extract_text_from_txt(file_bytes)
-        else:
-            return JSONResponse(
-                content={
-                    "error_code": "unsupported_format",
-                    "message": "Formato no soportado (usa .txt, .pdf o .docx)",
-                },
-                status_code=400,
-            )
+        filename, upload_path = await save_upload(file, timer)
 
-        if not joined_text or len(joined_text) < 100:
-            return JSONResponse(
-                content={
-                    "error_code": "empty_or_too_short",
-                    "message": "El archivo se leyó vacío o muy corto. Revisa el parser o prueba otro archivo.",
-                },
-                status_code=422,
+        # 🆕 MODO LONG DOC: chunks de 3000 tokens. MODO NORMAL: todo el documento
+        # en una llamada si cabe en el modelo (si no, en los chunks que hagan falta).
+        # Las páginas pasan del parser a los chunks y al modelo sin cargar el documento
+        # entero; las copias casi idénticas (anexos, tablas) se analizan una sola vez.
+        report: dict = {}
+        results = [
+            result
+            async for result in iter_document_results(
+                upload_path,
+                filename,
+                context=context,
+                lang=lang,
+                longdoc=longdoc,
+                cache_mode=cache,
+                budget=budget,
+                prefilter=prefilter,
+                report=report,
+                timer=timer,
             )
+        ]
+        if not results:
+            raise empty_document_error()  # nada que analizar tras limpiar el documento
+        results.sort(key=lambda result: result["_debug"]["chunk_id"])
+        prefilter_report = report["prefilter"]
+        boilerplate_report = report["boilerplate"]
+        usage_summary = summarize_usage(results, usage_model(), budget)
+        # Un chunk fallido no tumba la petición: se informa en failed_chunks
+        failed = check_failed_chunks(results)
 
-        # -----------------------------------------
-        # 2) ANÁLISIS DE RIESGOS
-        # -----------------------------------------
-
-        if longdoc:
-            # 🆕 MODO LONG DOC: dividir en chunks de 3000 tokens
-            chunks = split_into_chunks(joined_text, max_tokens=3000)
-
-            results = []
-            for i, chunk in enumerate(chunks):
-                result = generate_risks(chunk, context=context, lang=lang)
-                result["_debug"] = {
+        if longdoc or len(results) > 1:
+            # 🧬 Consolidación: un riesgo por grupo de casi duplicados, con todas sus páginas
+            merged = await run_blocking(consolidate_risks, results)
+            final_result = {
+                "intuitive_risks": merged["intuitive_risks"],
+                "counterintuitive_risks": merged["counterintuitive_risks"],
+                "chunks": results,
+                "failed_chunks": failed,
+                "usage": usage_summary,
+                "extraction": report["extraction"],
+                "prefilter": prefilter_report,
+                "boilerplate": boilerplate_report,
+                "_debug": {
                     "filename": filename,
-                    "chunk_id": i + 1,
-                    "chunk_chars": len(chunk),
-                }
-                results.append(result)
-
-            final_result = {"chunks": results}
+                    "duplicate_chunks": report["duplicate_chunks"],
+                    "dedup": merged["_debug"],
+                    "timings": timer.timings,
+                },
+            }
 
         else:
             # 🔁 MODO NORMAL (igual que antes)
-            result = generate_risks(joined_text, context=context, lang=lang)
+            result = results[0]
+            debug = result["_debug"]
             result["_debug"] = {
                 "filename": filename,
-                "chars": len(joined_text),
+                "chars": debug["chunk_chars"],
+                "page_start": debug["page_start"],
+                "page_end": debug["page_end"],
+                "cache": debug["cache"],
+                "timings": {**timer.timings, **debug["timings"]},
             }
+            result["usage"] = usage_summary
+            result["extraction"] = report["extraction"]
+            result["prefilter"] = prefilter_report
+            result["boilerplate"] = boilerplate_report
             final_result = result
 
         # -----------------------------------------
         # 3) RESPUESTA FINAL
         # -----------------------------------------
-        return JSONResponse(content=final_result)
+        with timer.stage("serialize"):
+            response = JSONResponse(content=final_result)
+        REQUEST_SECONDS.observe(timer.elapsed(), endpoint="/analyze")
+        return response
 
+    except PipelineError as e:
+        return JSONResponse(content=e.to_content(), status_code=e.status_code)
     except Exception as e:
         logger.error(f"Error en /analyze: {str(e)}")
         logger.error(traceback.format_exc())
@@ -115,3 +256,373 @@ async def analyze_document(
             },
             status_code=500,
         )
+
+
+@app.post("/analyze/batch")
+async def analyze_package(
+    files: List[UploadFile] = File(...),  # un ZIP, varios archivos, o ambos
+    context: str = Form(""),
+    lang: str = Form("es"),
+    longdoc: bool = Form(False),
+    cache: str = Form("use"),
+    token_budget: int = Form(REQUEST_TOKEN_BUDGET),  # presupuesto para todo el paquete
+    budget_mode: str = Form("degrade"),
+    prefilter: bool = Form(RELEVANCE_PREFILTER),
+):
+    """
+    Analiza un paquete de licitación: resultados por documento (documents) y un registro
+    de riesgos consolidado de todo el paquete (intuitive_risks / counterintuitive_risks).
+    Los documentos se extraen en paralelo y todos sus chunks comparten la cola del modelo.
+    """
+    timer = StageTimer()
+    try:
+        _check_cache_mode(cache)
+        _check_budget_mode(budget_mode)
+        documents, skipped = await save_batch(files, timer)
+        final_result = await analyze_batch(
+            documents,
+            context=context,
+            lang=lang,
+            longdoc=longdoc,
+            cache_mode=cache,
+            budget=TokenBudget(token_budget, budget_mode),
+            timer=timer,
+            prefilter=prefilter,
+        )
+        final_result["skipped"] = skipped
+
+        with timer.stage("serialize"):
+            response = JSONResponse(content=final_result)
+        REQUEST_SECONDS.observe(timer.elapsed(), endpoint="/analyze/batch")
+        return response
+
+    except PipelineError as e:
+        return JSONResponse(content=e.to_content(), status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"Error en /analyze/batch: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(
+            content={"error_code": "internal_error", "message": str(e)},
+            status_code=500,
+        )
+
+
+def _ndjson(event: dict) -> bytes:
+    started = time.perf_counter()
+    line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+    observe_stage("serialize", time.perf_counter() - started)
+    return line
+
+
+@app.post("/analyze/stream")
+async def analyze_document_stream(
+    file: UploadFile = File(...),
+    context: str = Form(""),
+    lang: str = Form("es"),
+    longdoc: bool = Form(False),
+    cache: str = Form("use"),
+    token_budget: int = Form(REQUEST_TOKEN_BUDGET),
+    budget_mode: str = Form("degrade"),
+    stream_risks: bool = Form(False),  # ⚡ un evento por riesgo, según lo genera el modelo
+    prefilter: bool = Form(RELEVANCE_PREFILTER),
+):
+    """
+    Variante en streaming de /analyze (NDJSON, un evento JSON por línea):
+      - {"event": "start", ...}   nº total de chunks
+      - {"event": "risk", ...}    con stream_risks: cada riesgo en cuanto el modelo lo cierra
+      - {"event": "chunk", ...}   riesgos de cada chunk en cuanto termina
+      - {"event": "summary", ...} tiempos totales y riesgos consolidados (sin duplicados)
+      - {"event": "error", ...}   si algo falla a mitad del análisis
+    Los errores de validación (formato, tamaño, texto vacío) se devuelven como en /analyze.
+    """
+    timer = StageTimer()
+    try:
+        _check_cache_mode(cache)
+        _check_budget_mode(budget_mode)
+        budget = TokenBudget(token_budget, budget_mode)
+        filename, pages = await load_document(file, timer)
+        extraction = extraction_report(pages)
+        pages, boilerplate_report = await run_blocking(strip_boilerplate, pages, timer)
+        pages, prefilter_report = await run_blocking(filter_pages, pages, prefilter, timer)
+        chunks = await run_blocking(build_chunks, pages, longdoc, context, lang, timer)
+        unique, duplicates = await run_blocking(find_duplicate_chunks, chunks, duplicate_index())
+    except PipelineError as e:
+        return JSONResponse(content=e.to_content(), status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"Error en /analyze/stream: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(
+            content={"error_code": "internal_error", "message": str(e)},
+            status_code=500,
+        )
+
+    async def events():
+        started = time.perf_counter()
+        first_chunk_s = None
+        first_risk_s = None
+        total_risks = 0
+        yield _ndjson(
+            {
+                "event": "start",
+                "filename": filename,
+                "total_chunks": len(chunks),
+                "extraction": extraction,
+                "prefilter": prefilter_report,
+                "boilerplate": boilerplate_report,
+                "timings": timer.timings,
+            }
+        )
+
+        # Los riesgos llegan desde los hilos de los chunks; los chunks terminados, desde
+        # iter_chunks_as_completed. Todo pasa por una cola para emitirlo en orden de llegada.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+
+        def risk_callback(chunk: dict):
+            if not stream_risks:
+                return None
+
+            def on_risk(list_name: str, risk: dict) -> None:
+                loop.call_soon_threadsafe(queue.put_nowait, ("risk", chunk, list_name, risk))
+
+            return on_risk
+
+        async def produce():
+            try:
+                async for result in iter_chunks_as_completed(
+                    lambda i, chunk: analyze_chunk(
+                        chunk,
+                        filename=filename,
+                        context=context,
+                        lang=lang,
+                        cache_mode=cache,
+                        queued_at=started,
+                        budget=budget,
+                        on_risk=risk_callback(chunk),
+                    ),
+                    unique,
+                ):
+                    queue.put_nowait(("chunk", result))
+                    # Las copias casi idénticas de este chunk salen con su mismo resultado
+                    for duplicate in copies_of(result, chunks, duplicates, filename):
+                        queue.put_nowait(("chunk", duplicate))
+            except Exception as e:
+                queue.put_nowait(("error", e))
+            else:
+                queue.put_nowait(("end", None))
+
+        producer = asyncio.create_task(produce())
+        try:
+            done = 0
+            results = []
+            while True:
+                item = await queue.get()
+                if item[0] == "end":
+                    break
+                if item[0] == "error":
+                    raise item[1]
+                if item[0] == "risk":
+                    _, chunk, list_name, risk = item
+                    if first_risk_s is None:
+                        first_risk_s = round(time.perf_counter() - started, 3)
+                    yield _ndjson(
+                        {
+                            "event": "risk",
+                            "chunk_id": chunk["chunk_id"],
+                            "list": list_name,
+                            "elapsed_s": round(time.perf_counter() - started, 3),
+                            "risk": risk,
+                        }
+                    )
+                    continue
+
+                result = item[1]
+                done += 1
+                results.append(result)
+                debug = result["_debug"]
+                if first_chunk_s is None:
+                    first_chunk_s = round(time.perf_counter() - started, 3)
+                total_risks += len(result.get("intuitive_risks", [])) + len(
+                    result.get("counterintuitive_risks", [])
+                )
+                yield _ndjson(
+                    {
+                        "event": "chunk",
+                        "chunk_id": debug["chunk_id"],
+                        "page_start": debug["page_start"],
+                        "page_end": debug["page_end"],
+                        "done": done,
+                        "total_chunks": len(chunks),
+                        "cache": debug["cache"],
+                        "timings": debug["timings"],
+                        "usage": debug["usage"],
+                        **({"error": debug["error"]} if "error" in debug else {}),
+                        **{k: v for k, v in result.items() if k != "_debug"},
+                    }
+                )
+            merged = await run_blocking(consolidate_risks, results)
+        except PipelineError as e:
+            yield _ndjson({"event": "error", **e.to_content()})
+            return
+        except Exception as e:
+            logger.error(f"Error en /analyze/stream: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield _ndjson({"event": "error", "error_code": "internal_error", "message": str(e)})
+            return
+        finally:
+            producer.cancel()  # el cliente se desconectó o hubo un error: se paran los chunks
+
+        yield _ndjson(
+            {
+                "event": "summary",
+                "filename": filename,
+                "total_chunks": len(chunks),
+                "total_risks": total_risks,
+                "time_to_first_chunk_s": first_chunk_s,
+                "time_to_first_risk_s": first_risk_s,
+                "elapsed_s": round(time.perf_counter() - started, 3),
+                "intuitive_risks": merged["intuitive_risks"],
+                "counterintuitive_risks": merged["counterintuitive_risks"],
+                "dedup": merged["_debug"],
+                "duplicate_chunks": len(duplicates),
+                "failed_chunks": failed_chunks(results),
+                "usage": summarize_usage(results, usage_model(), budget),
+            }
+        )
+        REQUEST_SECONDS.observe(timer.elapsed(), endpoint="/analyze/stream")
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+# ==========================================
+# 🗂️ Trabajos asíncronos: POST /jobs, GET/DELETE /jobs/{id}
+# ==========================================
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    context: str = Form(""),
+    lang: str = Form("es"),
+    longdoc: bool = Form(False),
+    cache: str = Form("use"),
+    token_budget: int = Form(REQUEST_TOKEN_BUDGET),
+    budget_mode: str = Form("degrade"),
+    prefilter: bool = Form(RELEVANCE_PREFILTER),
+):
+    """Mismos campos que /analyze; devuelve el id del trabajo sin esperar al análisis."""
+    try:
+        _check_cache_mode(cache)
+        _check_budget_mode(budget_mode)
+        filename, upload_path = await save_upload(file)
+    except PipelineError as e:
+        return JSONResponse(content=e.to_content(), status_code=e.status_code)
+
+    params = {
+        "context": context,
+        "lang": lang,
+        "longdoc": longdoc,
+        "cache": cache,
+        "token_budget": token_budget,
+        "budget_mode": budget_mode,
+        "prefilter": prefilter,
+    }
+    job_id = app.state.jobs.submit(upload_path, filename, params)
+    return JSONResponse(content={"job_id": job_id, "status": "queued"}, status_code=202)
+
+
+def _job_not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(
+        content={"error_code": "job_not_found", "message": f"No existe el trabajo {job_id}"},
+        status_code=404,
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado, % de chunks terminados y resultados parciales."""
+    job = await run_blocking(app.state.jobs.store.get, job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    job["usage"] = summarize_usage(job["chunks"], usage_model())
+    job["failed_chunks"] = failed_chunks(job["chunks"])
+    if job["status"] == "done":
+        merged = await run_blocking(consolidate_risks, job["chunks"])
+        job["intuitive_risks"] = merged["intuitive_risks"]
+        job["counterintuitive_risks"] = merged["counterintuitive_risks"]
+        job["dedup"] = merged["_debug"]
+    return JSONResponse(content=job)
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    status = await run_blocking(app.state.jobs.store.status, job_id)
+    if status is None:
+        return _job_not_found(job_id)
+    if not app.state.jobs.cancel(job_id):
+        return JSONResponse(
+            content={
+                "error_code": "job_finished",
+                "message": f"El trabajo ya terminó (estado: {status})",
+            },
+            status_code=409,
+        )
+    return JSONResponse(content={"job_id": job_id, "status": "cancelled"})
+
+
+# ==========================================
+# 🔁 Revisiones: POST/GET /projects/{project}/revisions
+# ==========================================
+@app.post("/projects/{project}/revisions")
+async def create_revision(
+    project: str,
+    file: UploadFile = File(...),
+    revision: str = Form(""),  # p. ej. "B"; vacío = rev1, rev2...
+    context: str = Form(""),
+    lang: str = Form("es"),
+    cache: str = Form("use"),
+    token_budget: int = Form(REQUEST_TOKEN_BUDGET),
+    budget_mode: str = Form("degrade"),
+):
+    """
+    Analiza una nueva revisión del documento del proyecto (siempre en modo longdoc).
+    Solo los chunks que cambiaron respecto a la última revisión van al modelo; cada
+    riesgo lleva change = new | unchanged y removed_risks lista los que desaparecieron.
+    """
+    timer = StageTimer()
+    try:
+        _check_cache_mode(cache)
+        _check_budget_mode(budget_mode)
+        filename, pages = await load_document(file, timer)
+        extraction = extraction_report(pages)
+        # Sin el bloque de revisión repetido en cada página, las páginas sin cambios
+        # conservan su hash y sus chunks no se vuelven a analizar
+        pages, boilerplate_report = await run_blocking(strip_boilerplate, pages, timer)
+        final_result = await analyze_revision(
+            app.state.revisions,
+            project=project,
+            revision=revision.strip() or None,
+            filename=filename,
+            pages=pages,
+            context=context,
+            lang=lang,
+            cache_mode=cache,
+            budget=TokenBudget(token_budget, budget_mode),
+            timer=timer,
+        )
+        final_result["extraction"] = extraction
+        final_result["boilerplate"] = boilerplate_report
+        return JSONResponse(content=final_result)
+    except PipelineError as e:
+        return JSONResponse(content=e.to_content(), status_code=e.status_code)
+    except Exception as e:
+        logger.error(f"Error en /projects/{project}/revisions: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JSONResponse(
+            content={"error_code": "internal_error", "message": str(e)},
+            status_code=500,
+        )
+
+
+@app.get("/projects/{project}/revisions")
+async def list_revisions(project: str):
+    revisions = await run_blocking(app.state.revisions.list, project)
+    return {"project": project, "revisions": revisions}
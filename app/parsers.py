@@ -1,7 +1,63 @@
 # app/parsers.py
 from io import BytesIO
-from typing import Union, List, Dict
+from collections import deque
+import contextlib
+import logging
+from typing import BinaryIO, Union, List, Dict, Iterator, Optional
+import mmap
+import multiprocessing
+import os
 import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.metrics import Counter, observe_stage
+
+logger = logging.getLogger("uvicorn.error")
+
+# ==========================================
+# ⚙️ Extracción PDF en paralelo (por entorno)
+# ==========================================
+# Nº de procesos para extraer páginas (0 = nº de CPUs; 1 = siempre en proceso)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or (os.cpu_count() or 1)
+# Por debajo de este nº de páginas no compensa arrancar el pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+# hybrid: PyPDF2 (rápido) y pdfplumber solo en las páginas que PyPDF2 lee mal
+# pdfplumber: análisis de layout de pdfplumber en todas las páginas (más lento)
+PDF_ENGINE = os.getenv("PDF_ENGINE", "hybrid").lower()
+PDF_ENGINES = ("hybrid", "pdfplumber")
+
+# Heurísticas de calidad del texto de PyPDF2 (una pasada de regex por página)
+FAST_MIN_CHARS = 20  # menos = página vacía (escaneada, o fuentes que PyPDF2 no sabe leer)
+FAST_MAX_GARBLED_RATIO = 0.02  # glifos sin mapear: \ufffd, uso privado, (cid:N), controles
+FAST_MAX_WORD_CHARS = 12  # longitud media de palabra por encima = faltan espacios
+FAST_MAX_GLUED_RATIO = 0.05  # "palabraPalabra" por palabra: espacios perdidos entre palabras
+
+# Cambiarla al modificar la extracción (limpieza, tolerancias...): invalida la caché de extracción
+PARSER_VERSION = "2"
+
+PDF_PAGES_TOTAL = Counter(
+    "risk_radar_pdf_pages_total",
+    "Páginas de PDF extraídas (engine: pypdf2, pdfplumber; reason: ok o motivo de fallback)",
+    ("engine", "reason"),
+)
+
+# Los parsers aceptan bytes, un fichero abierto o una ruta en disco
+# (lo más barato en memoria: la subida ya está volcada a un temporal)
+Source = Union[bytes, BytesIO, BinaryIO, str, os.PathLike]
+
+
+def _is_path(source: Source) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def _as_stream(source: Source):
+    """Ruta o fichero tal cual; bytes envueltos en BytesIO."""
+    return BytesIO(source) if isinstance(source, bytes) else source
+
 
 # ==========================================
 # 🧹 Limpieza mínima (solo espacios/saltos)
@@ -13,31 +69,229 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
-# 1) PDF: usa pdfplumber
-def extract_text_from_pdf(file_bytes: Union[bytes, BytesIO]) -> List[Dict]:
+# 1) PDF: PyPDF2 con fallback por página a pdfplumber (ver PDF_ENGINE)
+_GARBLED = re.compile(r"\(cid:\d+\)|[\ufffd\ue000-\uf8ff\x00-\x08\x0b\x0e-\x1f]")
+# Minúscula, cifra o puntuación pegada a mayúscula: "dieOberbau", "4.1Schwellen", "Pos.Menge"
+_GLUED = re.compile(r"[a-zäöüßàáéèíóúñç\d.,;:)][A-ZÄÖÜÀÁÉÈÍÓÚÑÇ]")
+
+
+def fast_text_problem(text: str) -> Optional[str]:
+    """
+    Motivo para repetir la página con pdfplumber ("empty", "garbled", "no_spaces"),
+    o None si el texto de PyPDF2 sirve tal cual.
+    """
+    stripped = text.strip()
+    if len(stripped) < FAST_MIN_CHARS:
+        return "empty"
+    garbled = sum(len(match) for match in _GARBLED.findall(stripped))
+    if garbled > len(stripped) * FAST_MAX_GARBLED_RATIO:
+        return "garbled"
+    words = stripped.split()
+    if (
+        sum(map(len, words)) > len(words) * FAST_MAX_WORD_CHARS
+        # un "iPhone" o un "60E1" sueltos no cuentan
+        or len(_GLUED.findall(stripped)) > max(2, len(words) * FAST_MAX_GLUED_RATIO)
+    ):
+        return "no_spaces"
+    return None
+
+
+def _extract_page(page, number: int) -> Dict:
+    started = time.perf_counter()
+    page_text = page.extract_text(x_tolerance=1.5, y_tolerance=1.5) or ""
+    # extract_s se mide aquí (también en los procesos del pool) y se registra en el padre
+    return {
+        "page": number,
+        "text": clean_text(page_text),
+        "engine": "pdfplumber",
+        "extract_s": time.perf_counter() - started,
+    }
+
+
+def _observe_page(page: Dict) -> Dict:
+    observe_stage("extract_page", page.pop("extract_s"))
+    PDF_PAGES_TOTAL.inc(engine=page["engine"], reason=page.pop("fallback", "ok"))
+    return page
+
+
+def _open_source(source: Source):
+    """Fichero abierto para PyPDF2: con una ruta lee bajo demanda en vez de cargar el PDF entero."""
+    return open(source, "rb") if _is_path(source) else contextlib.nullcontext(_as_stream(source))
+
+
+def _iter_page_range(source: Source, start: int, end: int, engine: str) -> Iterator[Dict]:
+    """Extrae las páginas [start, end) con el motor indicado (en proceso o en el pool)."""
+    import pdfplumber
+
+    if engine == "pdfplumber":
+        with pdfplumber.open(_as_stream(source)) as pdf:
+            for i in range(start, end):
+                page = pdf.pages[i]
+                yield _extract_page(page, i + 1)
+                page.close()  # libera la caché de objetos de la página
+        return
+
+    from PyPDF2 import PdfReader
+
+    plumber = None  # solo se abre si alguna página lo necesita
+    try:
+        with _open_source(source) as stream:
+            reader = PdfReader(stream)
+            for i in range(start, end):
+                started = time.perf_counter()
+                try:
+                    text = clean_text(reader.pages[i].extract_text() or "")
+                    problem = fast_text_problem(text)
+                except Exception:  # PyPDF2 es menos tolerante con PDFs mal formados
+                    problem = "error"
+                if problem is None:
+                    yield {
+                        "page": i + 1,
+                        "text": text,
+                        "engine": "pypdf2",
+                        "extract_s": time.perf_counter() - started,
+                    }
+                    continue
+                if plumber is None:
+                    plumber = pdfplumber.open(_as_stream(source))
+                page = _extract_page(plumber.pages[i], i + 1)
+                plumber.pages[i].close()
+                page["extract_s"] = time.perf_counter() - started
+                page["fallback"] = problem
+                yield page
+    finally:
+        if plumber is not None:
+            plumber.close()
+
+
+def _extract_page_range(path: str, start: int, end: int, engine: str) -> List[Dict]:
+    """Trabajo de un proceso del pool: abre el PDF desde disco y extrae [start, end)."""
+    return list(_iter_page_range(path, start, end, engine))
+
+
+def _page_count(source: Source, engine: str) -> int:
+    if engine == "pdfplumber":
+        import pdfplumber
+
+        with pdfplumber.open(_as_stream(source)) as pdf:
+            return len(pdf.pages)
+    from PyPDF2 import PdfReader
+
+    with _open_source(source) as stream:
+        return len(PdfReader(stream).pages)
+
+
+def pdf_page_count(file_bytes: Source) -> int:
+    """Nº de páginas del PDF sin extraer su texto."""
+    return _page_count(file_bytes, PDF_ENGINE)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Un único pool por proceso, reutilizado entre requests.
+    # forkserver evita hacer fork de un proceso de uvicorn con hilos activos.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method)
+            )
+        return _pool
+
+
+def _page_ranges(n_pages: int, workers: int) -> List[tuple]:
+    # Varios tramos por proceso para repartir mejor páginas de coste desigual
+    n_ranges = min(n_pages, workers * 4)
+    size, extra = divmod(n_pages, n_ranges)
+    ranges, start = [], 0
+    for r in range(n_ranges):
+        end = start + size + (1 if r < extra else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def extract_text_from_pdf(
+    file_bytes: Source, workers: Optional[int] = None, engine: Optional[str] = None
+) -> List[Dict]:
     """
-    Devuelve una lista de dicts: { "page": n, "text": "..." }
+    Devuelve una lista de dicts: { "page": n, "text": "...", "engine": "pypdf2" | "pdfplumber" }
     Útil para trazabilidad de riesgos por página.
+    Con PDFs grandes reparte las páginas entre `workers` procesos (por defecto PDF_WORKERS).
+    """
+    return list(iter_text_from_pdf(file_bytes, workers, engine))
+
+
+def iter_text_from_pdf(
+    file_bytes: Source, workers: Optional[int] = None, engine: Optional[str] = None
+) -> Iterator[Dict]:
     """
+    Igual que extract_text_from_pdf, pero entrega las páginas en orden según se extraen.
+    En memoria solo están las páginas de los tramos en curso (como mucho 2 por proceso),
+    no el documento entero: sirve igual para 50 que para 5.000 páginas.
+    """
+    engine = engine or PDF_ENGINE
+    if engine not in PDF_ENGINES:
+        raise ValueError(f"PDF_ENGINE desconocido: {engine} (usa {' | '.join(PDF_ENGINES)})")
     try:
         import pdfplumber
     except ImportError:
         raise ImportError("Falta pdfplumber. Instala con: pip install pdfplumber")
+    if engine == "hybrid":
+        try:
+            import PyPDF2
+        except ImportError:
+            raise ImportError(
+                "Falta PyPDF2. Instala con: pip install PyPDF2 (o usa PDF_ENGINE=pdfplumber)"
+            )
 
-    bio = BytesIO(file_bytes) if isinstance(file_bytes, bytes) else file_bytes
-    pages = []
+    workers = PDF_WORKERS if workers is None else workers
 
-    with pdfplumber.open(bio) as pdf:
-        for i, page in enumerate(pdf.pages):
-            page_text = page.extract_text(x_tolerance=1.5, y_tolerance=1.5) or ""
-            cleaned = clean_text(page_text)
-            pages.append({"page": i + 1, "text": cleaned})
+    n_pages = _page_count(file_bytes, engine)
+    # Documentos pequeños: en proceso, sin coste de arranque del pool
+    if workers <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+        yield from map(_observe_page, _iter_page_range(file_bytes, 0, n_pages, engine))
+        return
 
-    return pages
+    # Los procesos abren el PDF desde disco (no se copian los bytes a cada uno);
+    # si no viene ya como ruta, se vuelca a un fichero temporal
+    if _is_path(file_bytes):
+        path, owned = os.fspath(file_bytes), False
+    else:
+        stream = _as_stream(file_bytes)
+        stream.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            while True:
+                block = stream.read(1024 * 1024)
+                if not block:
+                    break
+                tmp.write(block)
+            path, owned = tmp.name, True
+    workers = min(workers, PDF_WORKERS)
+    ranges = _page_ranges(n_pages, workers)
+    futures: deque = deque()
+    try:
+        pool = _get_pool()
+        for start, end in ranges:
+            # Ventana de 2 tramos por proceso: el resto no se encarga hasta que se consuma
+            if len(futures) >= workers * 2:
+                yield from map(_observe_page, futures.popleft().result())
+            futures.append(pool.submit(_extract_page_range, path, start, end, engine))
+        while futures:  # en orden de página
+            yield from map(_observe_page, futures.popleft().result())
+    finally:
+        for future in futures:
+            future.cancel()
+        if owned:
+            os.remove(path)
 
 
 # 2) DOCX
-def extract_text_from_docx(file_bytes: Union[bytes, BytesIO]) -> str:
+def extract_text_from_docx(file_bytes: Source) -> str:
     """
     Extrae texto plano de documentos .docx (Word).
     """
@@ -46,27 +300,38 @@ def extract_text_from_docx(file_bytes: Union[bytes, BytesIO]) -> str:
     except ImportError:
         raise ImportError("Falta python-docx. Instala con: pip install python-docx")
 
-    bio = BytesIO(file_bytes) if isinstance(file_bytes, bytes) else file_bytes
-    doc = Document(bio)
+    doc = Document(_as_stream(file_bytes))
     paragraphs = [p.text for p in doc.paragraphs if p.text.strip()]
     joined = "\n".join(paragraphs).strip()
     return clean_text(joined)
 
 
 # 3) TXT
-def extract_text_from_txt(file_bytes: Union[bytes, BytesIO]) -> str:
+def _decode(buffer) -> str:
+    try:
+        return str(buffer, "utf-8")
+    except UnicodeDecodeError:
+        return str(buffer, "latin-1", errors="ignore")
+
+
+def extract_text_from_txt(file_bytes: Source) -> str:
     """
     Extrae texto de archivos planos .txt codificados como UTF-8.
+    Si recibe una ruta, decodifica directamente desde el fichero mapeado en memoria.
     """
-    if not isinstance(file_bytes, bytes):
-        file_bytes = file_bytes.read()
-
-    try:
-        text = file_bytes.decode("utf-8")
-    except UnicodeDecodeError:
-        text = file_bytes.decode("latin-1", errors="ignore")
+    if _is_path(file_bytes):
+        with open(file_bytes, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                text = ""
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    text = _decode(mm)
+    else:
+        if not isinstance(file_bytes, bytes):
+            file_bytes = file_bytes.read()
+        text = _decode(file_bytes)
 
-    # Debug en logs de Render
-    print(f"DEBUG · TXT length={len(text)} preview={text[:200]!r}")
+    # Solo la longitud: el contenido de los documentos no va a los logs
+    logger.debug(f"TXT length={len(text)}")
 
     return clean_text(text)
\ No newline at end of file
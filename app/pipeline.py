@@ -0,0 +1,689 @@
+# app/pipeline.py
+# Pasos del análisis compartidos por /analyze, /analyze/stream y /jobs
+
+import copy
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+# 📄 Parsers existentes para PDF, DOCX y TXT
+from app.parsers import (
+    PARSER_VERSION,
+    PDF_ENGINE,
+    extract_text_from_docx,
+    extract_text_from_txt,
+    iter_text_from_pdf,
+    pdf_page_count,
+)
+
+# 🧠 Función que manda texto al modelo (con caché) y presupuesto de tokens del modelo
+from app.llm_backends import LLMTransientError
+from app.risk_engine import OnRisk, RiskParseError, generate_risks_cached, input_token_budget
+
+# 🧩 Chunking por páginas y tokens
+from app.utils.chunking import iter_pages_into_chunks, split_pages_into_chunks
+
+from app.utils.concurrency import iter_lazy_as_completed, run_blocking
+from app.utils.dedup import RISK_LISTS
+from app.utils.extraction_cache import extraction_key, file_hash, get_extraction_cache
+from app.utils.metrics import StageTimer, observe_stage
+from app.utils.boilerplate import strip_repeated_lines
+from app.utils.near_duplicates import CHUNK_DEDUP, CHUNK_DUP_MAX_ENTRIES, MinHashIndex
+from app.utils.relevance import disabled_report, prefilter_pages
+from app.utils.usage import TokenBudget, TokenBudgetExhausted, empty_usage
+from app.utils.uploads import UploadTooLarge, spool_upload, too_large_content
+
+logger = logging.getLogger("uvicorn.error")
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+LONGDOC_MAX_TOKENS = 3000
+MIN_TEXT_CHARS = 100
+# Páginas que se limpian juntas (cabeceras, prefiltro) en el análisis en streaming
+PAGE_WINDOW = int(os.getenv("PAGE_WINDOW", "64"))
+
+
+class PipelineError(Exception):
+    """Error de validación que se devuelve al cliente con su código y status HTTP."""
+
+    def __init__(self, error_code: str, message: str, status_code: int):
+        super().__init__(message)
+        self.error_code = error_code
+        self.message = message
+        self.status_code = status_code
+
+    def to_content(self) -> dict:
+        return {"error_code": self.error_code, "message": self.message}
+
+
+# -----------------------------------------
+# 1) EXTRACCIÓN DE TEXTO
+# -----------------------------------------
+async def save_upload(file: UploadFile, timer: Optional[StageTimer] = None) -> Tuple[str, str]:
+    """
+    Valida el formato y vuelca la subida a un temporal en disco.
+    Devuelve (filename, ruta); quien llama debe pasar la ruta a extract_document.
+    """
+    timer = timer or StageTimer()
+    filename = (file.filename or "").lower()
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise PipelineError(
+            "unsupported_format", "Formato no soportado (usa .txt, .pdf o .docx)", 400
+        )
+
+    # Volcado a disco por bloques: se rechaza en cuanto supera MAX_UPLOAD_MB
+    try:
+        with timer.stage("upload"):
+            upload_path = await spool_upload(file)
+    except UploadTooLarge:
+        content = too_large_content()
+        raise PipelineError(content["error_code"], content["message"], 413)
+    return filename, upload_path
+
+
+def _parse_pages(upload_path: str, filename: str) -> Iterator[Dict]:
+    if filename.endswith(".pdf"):
+        return iter_text_from_pdf(upload_path)
+    if filename.endswith(".docx"):
+        return iter([{"page": None, "text": extract_text_from_docx(upload_path)}])
+    return iter([{"page": None, "text": extract_text_from_txt(upload_path)}])
+
+
+def iter_document_pages(upload_path: str, filename: str) -> Iterator[Dict]:
+    """
+    Páginas del archivo según se extraen. Si ya se extrajo antes (mismo contenido y
+    PARSER_VERSION), salen de la caché de extracción sin volver a pasar por el parser;
+    si no, se guardan en ella mientras pasan.
+    """
+    cache = get_extraction_cache()
+    if cache is None:
+        yield from _parse_pages(upload_path, filename)
+        return
+
+    kind = os.path.splitext(filename)[1]
+    # El motor PDF cambia el texto: hybrid y pdfplumber no comparten entradas
+    version = f"{PARSER_VERSION}-{PDF_ENGINE}" if kind == ".pdf" else PARSER_VERSION
+    key = extraction_key(file_hash(upload_path), kind, version)
+    n_pages = cache.page_count(key)
+    if n_pages is None:
+        yield from cache.store_pages(key, _parse_pages(upload_path, filename))
+        return
+
+    served = 0
+    for page in cache.iter_pages(key):
+        served += 1
+        yield page
+    if served < n_pages:
+        # Otro worker lo expulsó mientras se leía: el resto sale del parser
+        yield from itertools.islice(_parse_pages(upload_path, filename), served, None)
+
+
+def document_page_count(upload_path: str, filename: str) -> Optional[int]:
+    """
+    Nº de páginas que saldrán del documento (DOCX y TXT son una). None si el PDF no se
+    puede abrir: el error se informa al extraerlo.
+    """
+    if not filename.endswith(".pdf"):
+        return 1
+    try:
+        return pdf_page_count(upload_path)
+    except Exception:
+        return None
+
+
+def _note_engine(report: Dict, page: Dict) -> None:
+    if "engine" in page:  # DOCX y TXT no llevan motor
+        report["engines"].setdefault(page["engine"], []).append(page["page"])
+
+
+def extraction_report(pages: Iterable[Dict]) -> Dict:
+    """Qué motor extrajo cada página del PDF: {mode, engines: {pypdf2: [1, 2], pdfplumber: [3]}}."""
+    report = {"mode": PDF_ENGINE, "engines": {}}
+    for page in pages:
+        _note_engine(report, page)
+    return report
+
+
+def _track_engines(pages: Iterable[Dict], report: Dict) -> Iterator[Dict]:
+    """extraction_report según pasan las páginas (en report["extraction"])."""
+    report["extraction"] = extraction_report([])
+    for page in pages:
+        _note_engine(report["extraction"], page)
+        yield page
+
+
+def _extract_pages(upload_path: str, filename: str) -> List[Dict]:
+    return list(iter_document_pages(upload_path, filename))
+
+
+async def extract_document(
+    upload_path: str, filename: str, timer: Optional[StageTimer] = None
+) -> List[Dict]:
+    """
+    Extrae el texto del temporal (y lo borra en cuanto se ha leído).
+    Devuelve páginas [{page, text}]; DOCX y TXT son una sola "página" con page=None.
+    """
+    timer = timer or StageTimer()
+    try:
+        with timer.stage("extract"):
+            pages = await run_blocking(_extract_pages, upload_path, filename)
+    finally:
+        os.remove(upload_path)
+
+    require_text(pages)
+    return pages
+
+
+def require_text(pages: Iterable[Dict]) -> None:
+    """empty_or_too_short si las páginas no suman MIN_TEXT_CHARS."""
+    if sum(len(page["text"]) for page in pages) < MIN_TEXT_CHARS:
+        raise empty_document_error()
+
+
+def empty_document_error() -> PipelineError:
+    return PipelineError(
+        "empty_or_too_short",
+        "El archivo se leyó vacío o muy corto. Revisa el parser o prueba otro archivo.",
+        422,
+    )
+
+
+async def load_document(
+    file: UploadFile, timer: Optional[StageTimer] = None
+) -> Tuple[str, List[Dict]]:
+    """save_upload + extract_document. Devuelve (filename, páginas)."""
+    filename, upload_path = await save_upload(file, timer)
+    return filename, await extract_document(upload_path, filename, timer)
+
+
+def strip_boilerplate(
+    pages: List[Dict], timer: Optional[StageTimer] = None
+) -> Tuple[List[Dict], Dict]:
+    """
+    Quita cabeceras, pies y números de página repetidos en muchas páginas (ver
+    app/utils/boilerplate.py). Devuelve (páginas, informe con tokens_saved).
+    Si no queda texto (todas las líneas se repetían), empty_or_too_short.
+    """
+    timer = timer or StageTimer()
+    with timer.stage("boilerplate"):
+        pages, report = strip_repeated_lines(pages)
+    require_text(pages)
+    return pages, report
+
+
+def filter_pages(
+    pages: List[Dict], enabled: bool, timer: Optional[StageTimer] = None
+) -> Tuple[List[Dict], Dict]:
+    """
+    Prefiltro local de relevancia: quita portadas, índices, firmas y leyendas antes de trocear.
+    Devuelve (páginas, informe con skip_ratio); con enabled=False no toca nada.
+    """
+    if not enabled:
+        return pages, disabled_report()
+    timer = timer or StageTimer()
+    with timer.stage("prefilter"):
+        return prefilter_pages(pages, min_chars=MIN_TEXT_CHARS)
+
+
+# -----------------------------------------
+# 2) CHUNKS CON RANGO DE PÁGINAS
+# -----------------------------------------
+def build_chunks(
+    pages: List[Dict],
+    longdoc: bool,
+    context: str = "",
+    lang: str = "es",
+    timer: Optional[StageTimer] = None,
+    anchor_every: int = 0,
+) -> List[Dict]:
+    """
+    Lista de chunks {chunk_id, text, page_start, page_end, segments}.
+    En longdoc, chunks de LONGDOC_MAX_TOKENS; si no, el máximo que admite el modelo
+    (normalmente un único chunk). Todo el texto se envía, y solo una vez.
+    anchor_every > 0 fija cortes por contenido (revisiones: ver split_pages_into_chunks).
+    """
+    timer = timer or StageTimer()
+    with timer.stage("chunking"):
+        max_tokens = LONGDOC_MAX_TOKENS if longdoc else input_token_budget(context, lang)
+        chunks = split_pages_into_chunks(pages, max_tokens=max_tokens, anchor_every=anchor_every)
+    for i, chunk in enumerate(chunks):
+        chunk["chunk_id"] = i + 1
+    return chunks
+
+
+# -----------------------------------------
+# 3) ANÁLISIS DE UN CHUNK
+# -----------------------------------------
+def analyze_chunk(
+    chunk: Dict,
+    *,
+    filename: str,
+    context: str,
+    lang: str,
+    cache_mode: str,
+    queued_at: Optional[float] = None,
+    budget: Optional[TokenBudget] = None,
+    on_risk: Optional[OnRisk] = None,
+) -> dict:
+    """
+    Manda un chunk al modelo y añade el bloque _debug con páginas, caché, tiempos y tokens.
+    Si el presupuesto de tokens se agotó: en modo degrade el chunk se devuelve vacío
+    (cache="skipped"); en modo abort falla la petición.
+    Con `on_risk`, la respuesta llega en streaming y cada riesgo se entrega según llega.
+    Si el chunk falla (modelo caído tras los reintentos, JSON irrecuperable...), se devuelve
+    vacío con cache="failed" y _debug.error: el resto de chunks de la petición siguen adelante.
+    """
+    started = time.perf_counter()
+    error = None
+    queue_s = 0.0
+    if queued_at is not None:
+        queue_s = started - queued_at
+        observe_stage("llm_queue", queue_s)
+    try:
+        result, cache_status, usage = generate_risks_cached(
+            chunk["text"],
+            context=context,
+            lang=lang,
+            cache_mode=cache_mode,
+            budget=budget,
+            on_risk=on_risk,
+        )
+    except TokenBudgetExhausted as e:
+        if budget is None or budget.mode == "abort":
+            raise PipelineError("token_budget_exceeded", str(e), 422)
+        budget.skip()
+        result = {"intuitive_risks": [], "counterintuitive_risks": []}
+        cache_status, usage = "skipped", empty_usage()
+    except Exception as e:
+        logger.error(f"Chunk {chunk['chunk_id']} de {filename} fallido: {str(e)[:300]}")
+        if isinstance(e, RiskParseError):
+            error_code = "invalid_model_output"
+        elif isinstance(e, LLMTransientError):
+            error_code = "llm_unavailable"
+        else:
+            error_code = "chunk_failed"
+        error = {"error_code": error_code, "message": str(e)[:500]}
+        result = {"intuitive_risks": [], "counterintuitive_risks": []}
+        cache_status, usage = "failed", getattr(e, "usage", None) or empty_usage()
+    finished = time.perf_counter()
+    result["_debug"] = {
+        "filename": filename,
+        "chunk_id": chunk["chunk_id"],
+        "chunk_chars": len(chunk["text"]),
+        "page_start": chunk["page_start"],
+        "page_end": chunk["page_end"],
+        "cache": cache_status,
+        "timings": {
+            "queue_s": round(queue_s, 3),
+            "llm_s": round(finished - started, 3),
+        },
+        "usage": usage,
+    }
+    if error is not None:
+        result["_debug"]["error"] = error
+    return result
+
+
+def failed_chunks(results: List[Dict]) -> List[Dict]:
+    """Chunks que fallaron, para informar en la respuesta: [{chunk_id, page_start, page_end, error_code, message}]."""
+    return [
+        {
+            "chunk_id": debug["chunk_id"],
+            "page_start": debug["page_start"],
+            "page_end": debug["page_end"],
+            **debug["error"],
+        }
+        for debug in ((result.get("_debug") or {}) for result in results)
+        if "error" in debug
+    ]
+
+
+def check_failed_chunks(results: List[Dict]) -> List[Dict]:
+    """
+    Los chunks fallidos se informan sin tumbar la petición; solo si fallaron todos
+    no hay nada que devolver (502 analysis_failed).
+    """
+    failed = failed_chunks(results)
+    raise_if_all_failed(failed, len(results))
+    return failed
+
+
+def raise_if_all_failed(failed: List[Dict], total: int) -> None:
+    """analysis_failed (502) si fallaron los `total` chunks (failed = salida de failed_chunks)."""
+    if failed and len(failed) == total:
+        raise PipelineError(
+            "analysis_failed", f"No se pudo analizar ningún fragmento: {failed[0]['message']}", 502
+        )
+
+
+def chunk_pages(chunk: Dict) -> List:
+    """Números de página del chunk, en orden y sin repetir."""
+    pages = []
+    for segment in chunk["segments"]:
+        if not pages or pages[-1] != segment["page"]:
+            pages.append(segment["page"])
+    return pages
+
+
+def remap_risk_pages(result: Dict, old_pages: List, new_pages: List) -> Dict:
+    """Traslada el campo page de cada riesgo de las páginas de un chunk a las de otro, por posición."""
+    mapping = {str(old): new for old, new in zip(old_pages, new_pages) if old != new}
+    if not mapping:
+        return result
+    for list_name in RISK_LISTS:
+        for risk in result.get(list_name) or []:
+            if isinstance(risk, dict) and str(risk.get("page", "")).strip() in mapping:
+                risk["page"] = mapping[str(risk["page"]).strip()]
+    return result
+
+
+def reuse_result(
+    previous: Dict, previous_pages: List, chunk: Dict, *, filename: str, cache: str
+) -> Dict:
+    """
+    Resultado de otro chunk con el mismo texto (revisión anterior, copia en el paquete...)
+    aplicado a `chunk`: riesgos con sus páginas, _debug propio y sin consumo de tokens.
+    """
+    result = remap_risk_pages(
+        copy.deepcopy({k: v for k, v in previous.items() if k != "_debug"}),
+        previous_pages,
+        chunk_pages(chunk),
+    )
+    result["_debug"] = {
+        "filename": filename,
+        "chunk_id": chunk["chunk_id"],
+        "chunk_chars": len(chunk["text"]),
+        "page_start": chunk["page_start"],
+        "page_end": chunk["page_end"],
+        "cache": cache,
+        "timings": {"queue_s": 0.0, "llm_s": 0.0},
+        "usage": empty_usage(),
+    }
+    return result
+
+
+# -----------------------------------------
+# 4) CHUNKS CASI DUPLICADOS
+# -----------------------------------------
+def duplicate_index() -> Optional[MinHashIndex]:
+    """Índice de casi duplicados para una petición o un paquete (None con CHUNK_DEDUP=0)."""
+    return MinHashIndex() if CHUNK_DEDUP else None
+
+
+def find_duplicate_chunks(
+    chunks: List[Dict], index: Optional[MinHashIndex], document: Hashable = 0
+) -> Tuple[List[Dict], Dict[int, Tuple]]:
+    """
+    Separa los chunks que son casi copia de otro ya indexado (en este documento o, con un
+    índice compartido, en otro del paquete). Devuelve (chunks a analizar,
+    {chunk_id: (documento, chunk_id) del original}); con index=None se analizan todos.
+    """
+    if index is None:
+        return chunks, {}
+    unique, duplicates = [], {}
+    for chunk in chunks:
+        original = index.find_or_add((document, chunk["chunk_id"]), chunk["text"])
+        if original is None:
+            unique.append(chunk)
+        else:
+            duplicates[chunk["chunk_id"]] = original
+    return unique, duplicates
+
+
+def duplicate_result(chunk: Dict, original: Dict, original_pages: List, filename: str) -> Dict:
+    """Resultado del original repartido a su copia; si el original falló, la copia también."""
+    result = reuse_result(original, original_pages, chunk, filename=filename, cache="duplicate")
+    debug = original["_debug"]
+    result["_debug"]["duplicate_of"] = {"filename": debug["filename"], "chunk_id": debug["chunk_id"]}
+    if "error" in debug:
+        result["_debug"]["error"] = debug["error"]
+    return result
+
+
+def fan_out_duplicates(
+    chunks: List[Dict], results: List[Dict], duplicates: Dict[int, Tuple], filename: str
+) -> List[Dict]:
+    """
+    Resultados de todos los chunks en orden de chunk_id: los analizados tal cual y cada
+    copia con el resultado de su original (del mismo documento).
+    """
+    by_id = {result["_debug"]["chunk_id"]: result for result in results}
+    chunk_by_id = {chunk["chunk_id"]: chunk for chunk in chunks}
+    ordered = []
+    for chunk in chunks:
+        original = duplicates.get(chunk["chunk_id"])
+        if original is None:
+            ordered.append(by_id[chunk["chunk_id"]])
+        else:
+            _, original_id = original
+            ordered.append(
+                duplicate_result(
+                    chunk, by_id[original_id], chunk_pages(chunk_by_id[original_id]), filename
+                )
+            )
+    return ordered
+
+
+def copies_of(
+    original: Dict, chunks: List[Dict], duplicates: Dict[int, Tuple], filename: str
+) -> List[Dict]:
+    """Resultados de las copias de un chunk recién analizado, para entregarlos a la vez que él."""
+    original_id = original["_debug"]["chunk_id"]
+    copy_ids = [chunk_id for chunk_id, (_, of) in duplicates.items() if of == original_id]
+    if not copy_ids:
+        return []
+    chunk_by_id = {chunk["chunk_id"]: chunk for chunk in chunks}
+    return [
+        duplicate_result(
+            chunk_by_id[chunk_id], original, chunk_pages(chunk_by_id[original_id]), filename
+        )
+        for chunk_id in copy_ids
+    ]
+
+
+# -----------------------------------------
+# 5) DOCUMENTO EN STREAMING (memoria acotada)
+# -----------------------------------------
+def _timed(items: Iterable[Dict], stages: Dict[str, float], stage: str) -> Iterator[Dict]:
+    """
+    Acumula en stages[stage] el tiempo que se tarda en obtener cada elemento, sin contar
+    el de las etapas anteriores (que se acumula en las suyas mientras esta espera).
+    """
+    iterator = iter(items)
+    while True:
+        before = sum(stages.values())
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            inner = sum(stages.values()) - before
+            stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started - inner
+        yield item
+
+
+def estimated_total_chunks(report: Dict, total_pages: Optional[int]) -> Optional[int]:
+    """
+    total_chunks mientras se lee el documento en streaming: los chunks ya cortados,
+    escalados a las páginas que faltan por leer. None si aún no se ha leído ninguna.
+    """
+    if report.get("total_chunks") is not None:
+        return report["total_chunks"]
+    if not total_pages or not report.get("pages_read") or not report.get("chunks_read"):
+        return None
+    scaled = round(report["chunks_read"] * total_pages / report["pages_read"])
+    return max(report["chunks_read"], scaled)
+
+
+def _require_text(pages: Iterable[Dict]) -> Iterator[Dict]:
+    """Deja pasar las páginas; al final, si no sumaban MIN_TEXT_CHARS, empty_or_too_short."""
+    chars = 0
+    for page in pages:
+        chars += len(page["text"])
+        yield page
+    if chars < MIN_TEXT_CHARS:
+        raise empty_document_error()
+
+
+def iter_clean_pages(
+    pages: Iterable[Dict], prefilter: bool, report: Dict, stages: Dict[str, float]
+) -> Iterator[Dict]:
+    """
+    strip_boilerplate + filter_pages por tramos de PAGE_WINDOW páginas: en memoria solo
+    está el tramo en curso. Las cabeceras aprendidas en un tramo se siguen quitando en
+    los siguientes. Los informes acumulados quedan en report["boilerplate"] y report["prefilter"];
+    el tiempo de todos los tramos, en stages["boilerplate"] y stages["prefilter"], y las
+    páginas ya entregadas al troceado, en report["pages_read"].
+    """
+    known: set = set()
+    report["boilerplate"] = {"patterns": 0, "lines_removed": 0, "tokens_saved": 0}
+    report["prefilter"] = disabled_report()
+    totals = {"units": 0, "skipped_units": 0, "chars_in": 0, "chars_out": 0}
+    skipped_pages: List = []
+
+    def clean(window: List[Dict]) -> List[Dict]:
+        started = time.perf_counter()
+        window, stripped = strip_repeated_lines(window, known=known)
+        stages["boilerplate"] = stages.get("boilerplate", 0.0) + time.perf_counter() - started
+        for key, value in stripped.items():
+            report["boilerplate"][key] += value
+        if not prefilter:
+            return window
+
+        chars_in = sum(len(page["text"]) for page in window)
+        # El mínimo de texto solo protege mientras no se haya conservado nada
+        min_chars = MIN_TEXT_CHARS if totals["chars_out"] < MIN_TEXT_CHARS else 0
+        started = time.perf_counter()
+        window, filtered = prefilter_pages(window, min_chars=min_chars)
+        stages["prefilter"] = stages.get("prefilter", 0.0) + time.perf_counter() - started
+        totals["units"] += filtered["units"]
+        totals["skipped_units"] += filtered["skipped_units"]
+        totals["chars_in"] += chars_in
+        totals["chars_out"] += sum(len(page["text"]) for page in window)
+        skipped_pages.extend(filtered.get("skipped_pages", []))
+        report["prefilter"] = {
+            "enabled": True,
+            "unit": filtered["unit"],
+            "threshold": filtered["threshold"],
+            "units": totals["units"],
+            **({"skipped_pages": skipped_pages} if filtered["unit"] == "page" else {}),
+            "skipped_units": totals["skipped_units"],
+            "skip_ratio": round(totals["skipped_units"] / max(totals["units"], 1), 3),
+            "skipped_chars_ratio": round(1 - totals["chars_out"] / max(totals["chars_in"], 1), 3),
+        }
+        return window
+
+    window: List[Dict] = []
+    report["pages_read"] = 0
+    for page in pages:
+        window.append(page)
+        if len(window) >= PAGE_WINDOW:
+            report["pages_read"] += len(window)
+            yield from clean(window)
+            window = []
+    if window:
+        report["pages_read"] += len(window)
+        yield from clean(window)
+
+
+async def iter_document_results(
+    upload_path: str,
+    filename: str,
+    *,
+    context: str,
+    lang: str,
+    longdoc: bool,
+    cache_mode: str,
+    budget: Optional[TokenBudget],
+    prefilter: bool,
+    report: Dict,
+    timer: Optional[StageTimer] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Análisis de un documento en streaming: páginas del parser (o de la caché de extracción)
+    -> limpieza por tramos -> chunks según se cierran -> modelo, con como máximo
+    LLM_MAX_CONCURRENCY chunks en vuelo. Entrega cada resultado en cuanto termina (orden de
+    finalización), así que la memoria no crece con el nº de páginas.
+    En `report` quedan extraction, boilerplate, prefilter, total_chunks (None hasta que se
+    ha leído todo el documento; mientras, ver estimated_total_chunks) y duplicate_chunks.
+    Los tiempos de extract, boilerplate, prefilter y chunking se observan una vez al terminar.
+    Borra el temporal al terminar.
+    """
+    timer = timer or StageTimer()
+    index = duplicate_index()
+    max_tokens = LONGDOC_MAX_TOKENS if longdoc else input_token_budget(context, lang)
+    report.update({"total_chunks": None, "chunks_read": 0, "duplicate_chunks": 0})
+    stages: Dict[str, float] = {}
+    queued_at: Dict[int, float] = {}  # la espera en cola empieza cuando el chunk está listo
+
+    # Copias casi idénticas: se resuelven con el resultado de su original (que sigue en
+    # vuelo -> waiting, o ya terminó -> ready). Los originales terminados se recuerdan
+    # tanto como el índice de duplicados (CHUNK_DUP_MAX_ENTRIES).
+    in_flight: Dict[int, List] = {}  # chunk_id -> páginas
+    finished: "OrderedDict[int, Tuple[Dict, List]]" = OrderedDict()
+    waiting: Dict[int, List[Dict]] = {}
+    ready: List[Dict] = []
+
+    def originals(chunks: Iterator[Dict]) -> Iterator[Dict]:
+        chunk_id = 0
+        for chunk_id, chunk in enumerate(chunks, start=1):
+            chunk["chunk_id"] = chunk_id
+            report["chunks_read"] = chunk_id
+            found = index.find_or_add((0, chunk_id), chunk["text"]) if index is not None else None
+            original_id = found[1] if found is not None else None
+            if original_id in finished:
+                ready.append(duplicate_result(chunk, *finished[original_id], filename))
+            elif original_id in in_flight:
+                waiting.setdefault(original_id, []).append(chunk)
+            else:
+                in_flight[chunk_id] = chunk_pages(chunk)
+                queued_at[chunk_id] = time.perf_counter()
+                yield chunk
+                continue
+            report["duplicate_chunks"] += 1
+        report["total_chunks"] = chunk_id
+
+    pages = _track_engines(
+        _timed(iter_document_pages(upload_path, filename), stages, "extract"), report
+    )
+    # El mínimo de texto se comprueba tras quitar cabeceras y prefiltrar: un documento
+    # hecho solo de líneas repetidas se queda sin nada que enviar al modelo
+    clean_pages = _require_text(iter_clean_pages(pages, prefilter, report, stages))
+    chunks = originals(
+        _timed(iter_pages_into_chunks(clean_pages, max_tokens), stages, "chunking")
+    )
+    try:
+        async for result in iter_lazy_as_completed(
+            lambda i, chunk: analyze_chunk(
+                chunk,
+                filename=filename,
+                context=context,
+                lang=lang,
+                cache_mode=cache_mode,
+                queued_at=queued_at.pop(chunk["chunk_id"]),
+                budget=budget,
+            ),
+            chunks,
+        ):
+            chunk_id = result["_debug"]["chunk_id"]
+            pages_of = in_flight.pop(chunk_id)
+            finished[chunk_id] = (result, pages_of)
+            while len(finished) > CHUNK_DUP_MAX_ENTRIES:
+                finished.popitem(last=False)
+            yield result
+            for duplicate in waiting.pop(chunk_id, []):
+                yield duplicate_result(duplicate, result, pages_of, filename)
+            while ready:
+                yield ready.pop(0)
+        while ready:
+            yield ready.pop(0)
+    finally:
+        for stage, seconds in stages.items():
+            timer.add(stage, seconds)
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
@@ -0,0 +1,356 @@
+# app/revisions.py
+# Re-análisis incremental de revisiones (B, C, D...) de un mismo documento de proyecto:
+# solo se envían al modelo los chunks que cambiaron; el resto se arrastra de la revisión anterior
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from app.pipeline import (
+    PipelineError,
+    analyze_chunk,
+    build_chunks,
+    check_failed_chunks,
+    chunk_pages,
+    reuse_result,
+)
+from app.risk_engine import PROMPT_VERSION, usage_model
+from app.utils.analysis_cache import cache_key, normalize_text
+from app.utils.chunking import PAGE_SEPARATOR
+from app.utils.concurrency import map_chunks, run_blocking
+from app.utils.dedup import DEDUP_THRESHOLD, RISK_LISTS, consolidate_risks, tfidf_vectors
+from app.utils.metrics import StageTimer
+from app.utils.usage import TokenBudget, summarize_usage
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+REVISIONS_DB_PATH = os.getenv(
+    "REVISIONS_DB_PATH", os.path.join(tempfile.gettempdir(), "ai_risk_radar_revisions.sqlite3")
+)
+# Una página de cada N (por contenido) cierra chunk: así los cortes no se desplazan entre revisiones
+REVISION_ANCHOR_EVERY = int(os.getenv("REVISION_ANCHOR_EVERY", "3"))
+
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def chunk_content_hash(chunk: Dict, context: str, lang: str) -> str:
+    """
+    Identidad de un chunk entre revisiones: su texto sin los números de página
+    (insertar una página no invalida los chunks siguientes) + lo que determina la respuesta.
+    """
+    text = PAGE_SEPARATOR.join(segment["text"] for segment in chunk["segments"])
+    return cache_key(text, context, lang, usage_model(), PROMPT_VERSION)
+
+
+class RevisionStore:
+    """Hashes de página y resultados por chunk de cada revisión, por proyecto (SQLite)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS revisions (
+                    project TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (project, revision)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS revision_pages (
+                    project TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    page INTEGER,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (project, revision, position)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS revision_chunks (
+                    project TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    chunk_id INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    pages TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    PRIMARY KEY (project, revision, chunk_id)
+                )
+                """
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def latest(self, project: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT revision, seq FROM revisions WHERE project = ? ORDER BY seq DESC LIMIT 1",
+                (project,),
+            ).fetchone()
+            return {"revision": row[0], "seq": row[1]} if row else None
+        finally:
+            conn.close()
+
+    def exists(self, project: str, revision: str) -> bool:
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT 1 FROM revisions WHERE project = ? AND revision = ?", (project, revision)
+            ).fetchone() is not None
+        finally:
+            conn.close()
+
+    def list(self, project: str) -> List[Dict]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT r.revision, r.filename, r.created, COUNT(c.chunk_id) "
+                "FROM revisions r LEFT JOIN revision_chunks c "
+                "ON c.project = r.project AND c.revision = r.revision "
+                "WHERE r.project = ? GROUP BY r.revision ORDER BY r.seq",
+                (project,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"revision": revision, "filename": filename, "created": created, "total_chunks": total}
+            for revision, filename, created, total in rows
+        ]
+
+    def page_hashes(self, project: str, revision: str) -> List[Dict]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT page, hash FROM revision_pages WHERE project = ? AND revision = ? "
+                "ORDER BY position",
+                (project, revision),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{"page": page, "hash": digest} for page, digest in rows]
+
+    def chunks(self, project: str, revision: str) -> List[Dict]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT chunk_id, content_hash, pages, result FROM revision_chunks "
+                "WHERE project = ? AND revision = ? ORDER BY chunk_id",
+                (project, revision),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "chunk_id": chunk_id,
+                "content_hash": content_hash,
+                "pages": json.loads(pages),
+                "result": json.loads(result),
+            }
+            for chunk_id, content_hash, pages, result in rows
+        ]
+
+    def save(
+        self, project: str, revision: str, filename: str, pages: List[Dict], chunks: List[Dict]
+    ) -> None:
+        """Guarda la revisión completa en una sola transacción (IntegrityError si ya existe)."""
+        conn = self._connect()
+        try:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM revisions WHERE project = ?", (project,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO revisions (project, revision, seq, filename, created) VALUES (?, ?, ?, ?, ?)",
+                (project, revision, seq, filename, time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO revision_pages (project, revision, position, page, hash) VALUES (?, ?, ?, ?, ?)",
+                [(project, revision, i, p["page"], p["hash"]) for i, p in enumerate(pages)],
+            )
+            conn.executemany(
+                "INSERT INTO revision_chunks (project, revision, chunk_id, content_hash, pages, result) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        project,
+                        revision,
+                        c["chunk_id"],
+                        c["content_hash"],
+                        json.dumps(c["pages"]),
+                        json.dumps(c["result"], ensure_ascii=False),
+                    )
+                    for c in chunks
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# ==========================================
+# 🔍 Diferencias entre revisiones
+# ==========================================
+def diff_pages(previous: List[Dict], current: List[Dict]) -> Dict:
+    """Páginas nuevas/modificadas, eliminadas y sin cambios (por contenido, no por número)."""
+    previous_hashes = {p["hash"] for p in previous}
+    current_hashes = {p["hash"] for p in current}
+    return {
+        "unchanged": sum(1 for p in current if p["hash"] in previous_hashes),
+        "changed_or_added": [p["page"] for p in current if p["hash"] not in previous_hashes],
+        "removed": sum(1 for p in previous if p["hash"] not in current_hashes),
+    }
+
+
+def flag_risk_changes(previous: Dict, current: Dict, threshold: float = DEDUP_THRESHOLD) -> Dict:
+    """
+    Marca cada riesgo consolidado de `current` con change = "new" | "unchanged" según
+    tenga un equivalente (misma similitud que la deduplicación) en `previous`.
+    Devuelve los riesgos de `previous` sin equivalente (eliminados), por lista.
+    """
+    removed = {}
+    for list_name in RISK_LISTS:
+        old = previous.get(list_name) or []
+        new = current.get(list_name) or []
+        if not old or not new:
+            for risk in new:
+                risk["change"] = "new"
+            removed[list_name] = list(old)
+            continue
+        vectors = tfidf_vectors([r.get("risk", "") for r in new] + [r.get("risk", "") for r in old])
+        sims = vectors[: len(new)] @ vectors[len(new):].T
+        for risk, row in zip(new, sims):
+            risk["change"] = "unchanged" if row.max() >= threshold else "new"
+        matched = sims.max(axis=0) >= threshold
+        removed[list_name] = [risk for risk, hit in zip(old, matched.tolist()) if not hit]
+    return removed
+
+
+# ==========================================
+# 🧠 Análisis de una revisión
+# ==========================================
+async def analyze_revision(
+    store: RevisionStore,
+    *,
+    project: str,
+    revision: Optional[str],
+    filename: str,
+    pages: List[Dict],
+    context: str,
+    lang: str,
+    cache_mode: str,
+    budget: TokenBudget,
+    timer: StageTimer,
+) -> Dict:
+    latest = await run_blocking(store.latest, project)
+    revision = revision or f"rev{(latest['seq'] if latest else 0) + 1}"
+    if await run_blocking(store.exists, project, revision):
+        raise PipelineError(
+            "revision_exists", f"La revisión {revision} del proyecto {project} ya existe", 409
+        )
+
+    chunks = await run_blocking(
+        build_chunks, pages, True, context, lang, timer, REVISION_ANCHOR_EVERY
+    )
+    page_hashes = [{"page": p["page"], "hash": page_hash(p["text"])} for p in pages if p["text"]]
+
+    previous_chunks, previous_pages = [], []
+    if latest:
+        previous_chunks = await run_blocking(store.chunks, project, latest["revision"])
+        previous_pages = await run_blocking(store.page_hashes, project, latest["revision"])
+    reusable = {c["content_hash"]: c for c in previous_chunks}
+
+    # Chunks sin cambios: resultado de la revisión anterior. El resto, al modelo.
+    results: List[Optional[Dict]] = [None] * len(chunks)
+    pending = []
+    for i, chunk in enumerate(chunks):
+        chunk["content_hash"] = chunk_content_hash(chunk, context, lang)
+        previous = reusable.get(chunk["content_hash"])
+        if previous is None:
+            pending.append(i)
+            continue
+        results[i] = reuse_result(
+            previous["result"], previous["pages"], chunk, filename=filename, cache="revision"
+        )
+
+    queued_at = time.perf_counter()
+    analyzed = await map_chunks(
+        lambda _, i: analyze_chunk(
+            chunks[i],
+            filename=filename,
+            context=context,
+            lang=lang,
+            cache_mode=cache_mode,
+            queued_at=queued_at,
+            budget=budget,
+        ),
+        pending,
+    )
+    for i, result in zip(pending, analyzed):
+        results[i] = result
+
+    failed = check_failed_chunks(results)
+
+    # Un chunk saltado por presupuesto o fallido no se guarda como analizado: se reintentará en la siguiente revisión
+    stored = [
+        {
+            "chunk_id": chunk["chunk_id"],
+            "content_hash": chunk["content_hash"],
+            "pages": chunk_pages(chunk),
+            "result": {k: v for k, v in result.items() if k != "_debug"},
+        }
+        for chunk, result in zip(chunks, results)
+        if result["_debug"]["cache"] not in ("skipped", "failed")
+    ]
+    try:
+        await run_blocking(store.save, project, revision, filename, page_hashes, stored)
+    except sqlite3.IntegrityError:
+        raise PipelineError(
+            "revision_exists", f"La revisión {revision} del proyecto {project} ya existe", 409
+        )
+
+    merged = await run_blocking(consolidate_risks, results)
+    previous_merged = await run_blocking(consolidate_risks, [c["result"] for c in previous_chunks])
+    removed = await run_blocking(flag_risk_changes, previous_merged, merged)
+
+    return {
+        "project": project,
+        "revision": revision,
+        "previous_revision": latest["revision"] if latest else None,
+        "intuitive_risks": merged["intuitive_risks"],
+        "counterintuitive_risks": merged["counterintuitive_risks"],
+        "removed_risks": removed,
+        "chunks": results,
+        "failed_chunks": failed,
+        "usage": summarize_usage(results, usage_model(), budget),
+        "_debug": {
+            "filename": filename,
+            "pages": diff_pages(previous_pages, page_hashes),
+            "chunks": {
+                "total": len(chunks),
+                "reused": len(chunks) - len(pending),
+                "analyzed": len(pending),
+            },
+            "dedup": merged["_debug"],
+            "timings": timer.timings,
+        },
+    }
@@ -1,52 +1,94 @@
 # app/risk_engine.py
 
 import os
-import json
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
 from dotenv import load_dotenv
-from openai import OpenAI
 
-# Cargar .env
+# Cargar .env (antes de leer la configuración de los backends)
 load_dotenv()
 
-# Inicializar cliente con la clave
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise RuntimeError("OPENAI_API_KEY no está definida en .env ni en el entorno.")
+from app.llm_backends import Completion, LLMBackend, LLMTransientError, get_backend
+from app.llm_scheduler import get_scheduler
+from app.utils.analysis_cache import cache_key, get_cache
+from app.utils.chunking import count_tokens
+from app.utils.json_repair import JSONRepairError, repair_json
+from app.utils.metrics import Counter, observe_stage
+from app.utils.risk_stream import RISK_LISTS, RiskStreamParser
+from app.utils.usage import TokenBudget, TokenBudgetExhausted, add_usage, empty_usage, record_usage
 
-client = OpenAI(api_key=API_KEY)
+logger = logging.getLogger("uvicorn.error")
 
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
-USE_MOCK = False
 
+# Tokens máximos de la respuesta del modelo
+MAX_COMPLETION_TOKENS = 6000
+# Tokens que añade el formato de chat por mensaje (rol, separadores)
+CHAT_FORMAT_TOKENS = 12
 
-def generate_risks(text: str, context: str = "", lang: str = "es") -> dict:
-    """
-    Genera riesgos a partir de un fragmento de documento usando GPT.
-    Devuelve un JSON con dos listas: intuitive_risks y counterintuitive_risks.
-    """
+# Ventana de contexto por modelo (tokens); MODEL_CONTEXT_TOKENS en el entorno tiene prioridad
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 128000
+
+
+# JSON mode (response_format=json_object) en los modelos que lo admiten; LLM_JSON_MODE=0 lo desactiva
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1").lower() in ("1", "true", "yes")
+JSON_MODE_MODELS = ("gpt-4o", "gpt-4.1", "gpt-4-turbo", "gpt-3.5-turbo")
+
+JSON_OUTCOMES = Counter(
+    "risk_radar_llm_json_total",
+    "Respuestas del modelo por resultado del parseo (ok, repaired, reasked, failed)",
+    ("outcome",),
+)
+
+
+class TokenBudgetExceeded(ValueError):
+    """El texto no cabe en la ventana de contexto del modelo."""
+
+
+class RiskParseError(RuntimeError):
+    """La respuesta del modelo no se pudo convertir en riesgos, ni reparada ni repreguntando."""
+
+    def __init__(self, message: str, usage: Optional[dict] = None):
+        super().__init__(message)
+        self.usage = usage  # la llamada se pagó aunque no sirva
+
+
+def json_mode_enabled(model: str = MODEL_NAME) -> bool:
+    return LLM_JSON_MODE and model.startswith(JSON_MODE_MODELS)
+
+
+def context_window(model: str = MODEL_NAME) -> int:
+    override = os.getenv("MODEL_CONTEXT_TOKENS")
+    if override:
+        return int(override)
+    # Coincidencia por prefijo más largo (p. ej. "gpt-4o-mini-2024-07-18")
+    for name in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_CONTEXT_WINDOWS[name]
+    return DEFAULT_CONTEXT_WINDOW
+
+# Versión del prompt: súbela al cambiar los prompts para invalidar la caché
+PROMPT_VERSION = "2"
+
+
+SYSTEM_PROMPT = (
+    "Eres un comité interdisciplinario de expertos (ingeniería civil y ferroviaria, "
+    "abogados en normativa alemana, compras y logística) que analiza riesgos en proyectos de infraestructura."
+)
 
-    if USE_MOCK:
-        return {
-            "intuitive_risks": [
-                {
-                    "risk": "Retraso por clima",
-                    "justification": "Condiciones adversas",
-                    "countermeasure": "Plan de contingencia",
-                    "page": 1,
-                    "evidence": "Clima en zona de obra",
-                }
-            ],
-            "counterintuitive_risks": [
-                {
-                    "risk": "Exceso de presupuesto por ahorro mal planificado",
-                    "justification": "Decisiones apresuradas",
-                    "countermeasure": "Revisión independiente",
-                    "page": 2,
-                    "evidence": "Reportes financieros",
-                }
-            ],
-        }
 
+def build_prompt(text: str, context: str = "", lang: str = "es") -> str:
+    """Prompt de usuario multilingüe con el fragmento completo (sin recortes)."""
     # ======================
     # 🌐 Prompt multilingüe
     # ======================
@@ -81,7 +123,7 @@ Instrucciones:
 Solo usa contenido sustantivo.
 
 Texto analizado:
-{text[:16000]}
+{text}
 
 Contexto adicional:
 {context}
@@ -123,7 +165,7 @@ Instructions:
 Use only substantive content.
 
 Analyzed text:
-{text[:16000]}
+{text}
 
 Additional context:
 {context}
@@ -165,7 +207,7 @@ Anweisungen:
 Verwenden Sie nur wesentlichen Inhalt.
 
 Analysierter Text:
-{text[:16000]}
+{text}
 
 Zusätzlicher Kontext:
 {context}
@@ -177,35 +219,262 @@ Geben Sie NUR ein gültiges JSON mit genau zwei Listen zurück:
 }}
 """
     else:
-        prompt = f"Language not recognized. Defaulting to Spanish.\n\n{text[:16000]}"
+        prompt = f"Language not recognized. Defaulting to Spanish.\n\n{text}"
 
-    # ======================
-    # 🚀 Llamada a la API
-    # ======================
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "Eres un comité interdisciplinario de expertos (ingeniería civil y ferroviaria, "
-                    "abogados en normativa alemana, compras y logística) que analiza riesgos en proyectos de infraestructura."
-                ),
-            },
-            {"role": "user", "content": prompt},
-        ],
-        temperature=0.3,
-        max_tokens=6000,
+    return prompt
+
+
+def _message_tokens(prompt: str) -> int:
+    # system + user + relleno de formato de chat
+    return (
+        count_tokens(SYSTEM_PROMPT, MODEL_NAME)
+        + count_tokens(prompt, MODEL_NAME)
+        + CHAT_FORMAT_TOKENS
     )
 
-    raw_content = response.choices[0].message.content.strip()
 
-    # 🧹 Limpiar JSON si viene envuelto en ```json ... ```
-    if raw_content.startswith("```"):
-        raw_content = raw_content.strip("`")
-        raw_content = raw_content.replace("json", "", 1).strip()
+def count_prompt_tokens(text: str, context: str = "", lang: str = "es") -> int:
+    """Tokens de entrada de una llamada con este fragmento."""
+    return _message_tokens(build_prompt(text, context, lang))
+
 
+def input_token_budget(context: str = "", lang: str = "es") -> int:
+    """
+    Tokens de documento que caben en una llamada: ventana del modelo menos
+    la respuesta máxima, el prompt fijo y el contexto del usuario.
+    """
+    overhead = count_prompt_tokens("", context, lang)
+    return context_window() - MAX_COMPLETION_TOKENS - overhead
+
+
+def _parse_risks(raw_content: str) -> Tuple[dict, bool]:
+    """
+    (resultado, reparado). Tolera bloques ```json```, comas finales y respuestas cortadas;
+    valida la forma {intuitive_risks: [...], counterintuitive_risks: [...]}.
+    """
     try:
-        return json.loads(raw_content)
-    except Exception as e:
-        raise RuntimeError(f"No se pudo parsear JSON: {e}\nRespuesta cruda: {raw_content}")
+        data, repaired = repair_json(raw_content)
+    except JSONRepairError as e:
+        raise RiskParseError(f"No se pudo parsear JSON: {e}\nRespuesta cruda: {raw_content[:500]}")
+
+    if not isinstance(data, dict) or not any(name in data for name in RISK_LISTS):
+        raise RiskParseError(f"La respuesta no tiene el formato esperado: {raw_content[:500]}")
+    for name in RISK_LISTS:
+        risks = data.get(name) or []
+        if not isinstance(risks, list):
+            raise RiskParseError(f'"{name}" no es una lista: {raw_content[:500]}')
+        # Elementos que no son objetos (texto suelto, null) no son riesgos
+        data[name] = [risk for risk in risks if isinstance(risk, dict)]
+    return data, repaired
+
+
+def parse_risks_json(raw_content: str) -> dict:
+    """Limpia la respuesta del modelo y la convierte en dict (RiskParseError si no se puede)."""
+    return _parse_risks(raw_content)[0]
+
+
+def generate_risks(text: str, context: str = "", lang: str = "es") -> dict:
+    """
+    Genera riesgos a partir de un fragmento de documento usando el backend configurado.
+    Devuelve un JSON con dos listas: intuitive_risks y counterintuitive_risks.
+    """
+    return generate_risks_with_usage(text, context=context, lang=lang)[0]
+
+
+def usage_model() -> str:
+    """Modelo con el que se contabiliza (y cachea): el consumo simulado va aparte."""
+    namespace = get_backend().cache_namespace
+    return f"{namespace}:{MODEL_NAME}" if namespace else MODEL_NAME
+
+
+# Callback por riesgo en streaming: on_risk("intuitive_risks" | "counterintuitive_risks", riesgo)
+OnRisk = Callable[[str, dict], None]
+
+
+# Última oportunidad si la respuesta no se puede ni reparar: se repregunta solo por ese chunk
+REASK_PROMPT = (
+    "Tu respuesta anterior no se pudo leer como JSON ({error}). Devuelve únicamente el JSON, "
+    'sin texto adicional, con exactamente dos listas: "intuitive_risks" y "counterintuitive_risks". '
+    "Sé conciso para no superar la longitud máxima."
+)
+
+
+def _completion_params() -> dict:
+    return {
+        "model": MODEL_NAME,
+        "temperature": 0.3,
+        "max_tokens": MAX_COMPLETION_TOKENS,
+        "json_mode": json_mode_enabled(),
+    }
+
+
+def _stream_completion(backend: LLMBackend, messages: List[Dict], on_risk: OnRisk) -> Completion:
+    """
+    Llamada en streaming: cada riesgo se entrega a on_risk en cuanto llega su llave de cierre.
+    Devuelve el Completion completo (el JSON final sigue siendo la referencia).
+    """
+    started = time.perf_counter()
+    stream = backend.stream(messages, **_completion_params())
+    parser = RiskStreamParser()
+    emitted = 0
+    try:
+        for delta in stream:
+            for list_name, risk in parser.feed(delta):
+                if not emitted:
+                    observe_stage("llm_first_risk", time.perf_counter() - started)
+                emitted += 1
+                on_risk(list_name, risk)
+    except LLMTransientError as e:
+        if emitted:
+            # Reintentar duplicaría los riesgos ya entregados
+            raise RuntimeError(f"La respuesta se cortó tras {emitted} riesgos: {e}") from e
+        raise
+    return Completion(content=stream.content, usage=stream.usage)
+
+
+def _call_model(
+    messages: List[Dict], prompt_tokens: int, budget: TokenBudget, on_risk: Optional[OnRisk] = None
+) -> Tuple[Completion, dict]:
+    """Una llamada al modelo con reserva de presupuesto, planificador y contabilidad de tokens."""
+    budget.reserve(prompt_tokens)
+    usage = None
+    try:
+        # ======================
+        # 🚀 Llamada a la API
+        # ======================
+        # (OpenAI, fake o record/replay según LLM_BACKEND), pasando por el planificador:
+        # límites RPM/TPM del proceso y reintentos ante 429 y errores transitorios
+        started = time.perf_counter()
+        backend = get_backend()
+
+        def call() -> Completion:
+            if on_risk is not None:
+                return _stream_completion(backend, messages, on_risk)
+            return backend.complete(messages, **_completion_params())
+
+        # El proveedor descuenta del TPM la entrada más el máximo de salida
+        completion = get_scheduler().call(call, estimated_tokens=prompt_tokens + MAX_COMPLETION_TOKENS)
+        observe_stage("llm_call", time.perf_counter() - started)
+
+        # La llamada se cobra aunque la respuesta no se pueda parsear
+        usage = record_usage(usage_model(), completion.usage)
+    finally:
+        budget.settle(prompt_tokens, usage)
+    return completion, usage
+
+
+def generate_risks_with_usage(
+    text: str,
+    context: str = "",
+    lang: str = "es",
+    budget: Optional[TokenBudget] = None,
+    on_risk: Optional[OnRisk] = None,
+) -> Tuple[dict, dict]:
+    """Como generate_risks, pero devuelve (resultado, uso) con los tokens y el coste de la llamada."""
+    result, usage, _ = _generate_risks(text, context, lang, budget, on_risk)
+    return result, usage
+
+
+def _generate_risks(
+    text: str,
+    context: str = "",
+    lang: str = "es",
+    budget: Optional[TokenBudget] = None,
+    on_risk: Optional[OnRisk] = None,
+) -> Tuple[dict, dict, str]:
+    """
+    Devuelve (resultado, uso, outcome) con outcome en: ok, repaired, reasked.
+    Con `budget`, reserva los tokens de entrada antes de llamar (TokenBudgetExhausted si no caben).
+    Con `on_risk`, la llamada va en streaming y cada riesgo se entrega según llega.
+
+    La salida pasa por tres capas: JSON mode (si el modelo lo admite), parser tolerante
+    y, si aun así no se puede leer, una segunda pregunta solo para este fragmento.
+    RiskParseError si tampoco sirve.
+    """
+    prompt = build_prompt(text, context, lang)
+
+    # Nada de recortes silenciosos: si no cabe, es un error del chunking
+    prompt_tokens = _message_tokens(prompt)
+    if prompt_tokens + MAX_COMPLETION_TOKENS > context_window():
+        raise TokenBudgetExceeded(
+            f"El fragmento necesita {prompt_tokens} tokens de entrada y el modelo {MODEL_NAME} "
+            f"solo admite {context_window() - MAX_COMPLETION_TOKENS}."
+        )
+
+    budget = budget or TokenBudget(0)
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+    completion, usage = _call_model(messages, prompt_tokens, budget, on_risk)
+
+    parse_started = time.perf_counter()
+    try:
+        result, repaired = _parse_risks(completion.content)
+        outcome = "repaired" if repaired else "ok"
+    except RiskParseError as e:
+        logger.warning(f"Respuesta ilegible del modelo, se repregunta: {str(e)[:200]}")
+        reask = REASK_PROMPT.format(error=str(e).splitlines()[0][:200])
+        try:
+            # Sin streaming: lo que ya se entregó por on_risk no se duplica
+            completion, reask_usage = _call_model(
+                messages + [{"role": "user", "content": reask}],
+                prompt_tokens + count_tokens(reask, MODEL_NAME) + CHAT_FORMAT_TOKENS,
+                budget,
+            )
+        except TokenBudgetExhausted:
+            JSON_OUTCOMES.inc(outcome="failed")
+            raise RiskParseError(str(e), usage)
+        usage = add_usage(dict(usage), reask_usage)
+        try:
+            result, _ = _parse_risks(completion.content)
+        except RiskParseError as reask_error:
+            JSON_OUTCOMES.inc(outcome="failed")
+            reask_error.usage = usage
+            raise
+        outcome = "reasked"
+
+    JSON_OUTCOMES.inc(outcome=outcome)
+    if outcome != "ok":
+        logger.info(f"JSON del modelo recuperado ({outcome})")
+    observe_stage("json_parse", time.perf_counter() - parse_started)
+    return result, usage, outcome
+
+
+def generate_risks_cached(
+    text: str,
+    context: str = "",
+    lang: str = "es",
+    cache_mode: str = "use",
+    budget: Optional[TokenBudget] = None,
+    on_risk: Optional[OnRisk] = None,
+) -> tuple:
+    """
+    generate_risks con caché persistente por contenido delante.
+    Devuelve (resultado, estado, uso) con estado en: hit, miss, refresh, bypass, disabled
+    (un acierto de caché no consume tokens). Con `on_risk`, un acierto entrega sus riesgos de golpe.
+    """
+    cache = get_cache()
+    if cache is None:
+        result, usage = generate_risks_with_usage(text, context, lang, budget, on_risk)
+        return result, "disabled", usage
+    if cache_mode == "bypass":
+        result, usage = generate_risks_with_usage(text, context, lang, budget, on_risk)
+        return result, "bypass", usage
+
+    # Las respuestas simuladas se guardan aparte de las reales
+    key = cache_key(text, context, lang, usage_model(), PROMPT_VERSION)
+    if cache_mode != "refresh":
+        cached = cache.get(key)
+        if cached is not None:
+            if on_risk is not None:
+                for list_name in RISK_LISTS:
+                    for risk in cached.get(list_name) or []:
+                        on_risk(list_name, risk)
+            return cached, "hit", empty_usage()
+
+    result, usage, outcome = _generate_risks(text, context, lang, budget, on_risk)
+    # Una respuesta reparada puede venir truncada: no se guarda, la próxima vez se repite
+    if outcome != "repaired":
+        cache.put(key, result)
+    return result, "refresh" if cache_mode == "refresh" else "miss", usage
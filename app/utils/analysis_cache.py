@@ -0,0 +1,154 @@
+# app/utils/analysis_cache.py
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from typing import Optional
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+CACHE_ENABLED = os.getenv("RISK_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_PATH = os.getenv(
+    "RISK_CACHE_PATH", os.path.join(tempfile.gettempdir(), "ai_risk_radar_cache.sqlite3")
+)
+CACHE_MAX_MB = float(os.getenv("RISK_CACHE_MAX_MB", "200"))
+CACHE_MAX_AGE_DAYS = float(os.getenv("RISK_CACHE_MAX_AGE_DAYS", "30"))
+
+# Modos aceptados por el flag `cache` de /analyze
+#  - use:     lee de la caché y guarda lo que falte
+#  - bypass:  ignora la caché por completo (ni lee ni escribe)
+#  - refresh: vuelve a llamar al modelo y sobrescribe la entrada
+CACHE_MODES = ("use", "bypass", "refresh")
+
+
+def normalize_text(text: str) -> str:
+    """Colapsa espacios y saltos de línea para que cambios de formato no invaliden la caché."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def cache_key(text: str, context: str, lang: str, model: str, prompt_version: str) -> str:
+    """Hash SHA-256 de todo lo que determina la respuesta del modelo."""
+    payload = json.dumps(
+        [normalize_text(text), normalize_text(context), lang, model, prompt_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Caché persistente en SQLite de resultados de generate_risks.
+    Los valores se guardan como JSON comprimido; se expulsan por antigüedad
+    y, si se supera el tamaño máximo, por último acceso (LRU).
+    """
+
+    def __init__(self, path: str, max_bytes: int, max_age_seconds: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            with self._init_lock:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS analysis_cache (
+                        key TEXT PRIMARY KEY,
+                        value BLOB NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_analysis_cache_access "
+                    "ON analysis_cache(last_access)"
+                )
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT value, created FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if now - created > self.max_age_seconds:
+                conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE analysis_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            return json.loads(zlib.decompress(value).decode("utf-8"))
+        finally:
+            conn.close()
+
+    def put(self, key: str, value: dict) -> None:
+        now = time.time()
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._evict(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        # 1) Antigüedad
+        conn.execute(
+            "DELETE FROM analysis_cache WHERE created < ?", (now - self.max_age_seconds,)
+        )
+        # 2) Tamaño total: se borran primero las entradas menos usadas
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_delete = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM analysis_cache ORDER BY last_access ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM analysis_cache WHERE key = ?", to_delete)
+
+
+_cache: Optional[AnalysisCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[AnalysisCache]:
+    """Devuelve la caché del proceso (o None si está desactivada por entorno)."""
+    global _cache
+    if not CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache(
+                CACHE_PATH,
+                max_bytes=int(CACHE_MAX_MB * 1024 * 1024),
+                max_age_seconds=CACHE_MAX_AGE_DAYS * 86400,
+            )
+        return _cache
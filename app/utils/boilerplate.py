@@ -0,0 +1,106 @@
+# app/utils/boilerplate.py
+# Cabeceras, pies, bloques de revisión y números de página que se repiten en todas las
+# páginas: se detectan por hash de línea (normalizada y según su posición en la página)
+# y se quitan antes de trocear, para no pagarlos una vez por página.
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.utils.chunking import count_tokens
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# Líneas de cada borde de la página (arriba y abajo) donde se buscan cabeceras y pies
+BOILERPLATE_EDGE_LINES = int(os.getenv("BOILERPLATE_EDGE_LINES", "4"))
+# Proporción de páginas en las que debe repetirse una línea (0.4 cubre cabeceras
+# alternas de páginas pares/impares)
+BOILERPLATE_MIN_RATIO = float(os.getenv("BOILERPLATE_MIN_RATIO", "0.4"))
+# Con menos páginas no hay repetición fiable
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_line(line: str) -> str:
+    """Minúsculas, espacios colapsados y cada número como '#' ("Seite 3 von 40" -> "seite # von #")."""
+    return _SPACES.sub(" ", _DIGITS.sub("#", line.lower())).strip()
+
+
+def _edge_keys(lines: List[str], edge: int) -> List[Tuple[int, Tuple[str, int]]]:
+    """
+    [(índice de línea, clave)] de las primeras y últimas `edge` líneas con texto.
+    La clave es (zona, hash de la línea normalizada): una cabecera solo cuenta como
+    cabecera y un pie como pie, aunque se desplacen una línea entre páginas.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    edge = min(edge, len(filled) // 2)  # en páginas cortas, el centro nunca es borde
+    head = filled[:edge]
+    foot = filled[-edge:] if edge else []
+    keys = [(i, ("head", hash(normalize_line(lines[i])))) for i in head]
+    keys += [(i, ("foot", hash(normalize_line(lines[i])))) for i in foot if i not in head]
+    return keys
+
+
+def strip_repeated_lines(
+    pages: List[Dict],
+    min_ratio: float = BOILERPLATE_MIN_RATIO,
+    edge_lines: int = BOILERPLATE_EDGE_LINES,
+    min_pages: int = BOILERPLATE_MIN_PAGES,
+    known: Optional[Set] = None,
+) -> Tuple[List[Dict], Dict]:
+    """
+    Quita de cada página las líneas de cabecera/pie que se repiten en al menos
+    `min_ratio` de las páginas. Una sola pasada para calcular los hashes; luego solo se
+    tocan las páginas con algo que quitar. DOCX/TXT (una sola "página") no cambian.
+    Con `known` (documento leído por tramos), también se quitan los patrones ya vistos
+    en tramos anteriores, y los nuevos se añaden al conjunto.
+    Devuelve (páginas, informe con tokens_saved).
+    """
+    report = {"patterns": 0, "lines_removed": 0, "tokens_saved": 0}
+    if len(pages) < max(min_pages, 2) and not known:
+        return pages, report
+
+    page_lines, page_keys = [], []
+    seen: Counter = Counter()
+    for page in pages:
+        lines = page["text"].split("\n")
+        keys = _edge_keys(lines, edge_lines)
+        page_lines.append(lines)
+        page_keys.append(keys)
+        seen.update({key for _, key in keys})  # una vez por página
+
+    min_count = max(2, min_ratio * len(pages))
+    repeated = {key for key, count in seen.items() if count >= min_count}
+    if len(pages) < max(min_pages, 2):
+        repeated.clear()  # un tramo corto no basta para aprender patrones nuevos
+    if known is not None:
+        new = repeated - known
+        known |= repeated
+        repeated = set(known)
+    else:
+        new = repeated
+    if not repeated:
+        return pages, report
+
+    cleaned, removed = [], []
+    for page, lines, keys in zip(pages, page_lines, page_keys):
+        drop = {i for i, key in keys if key in repeated}
+        if not drop:
+            cleaned.append(page)
+            continue
+        removed.extend(lines[i] for i in sorted(drop))
+        text = "\n".join(line for i, line in enumerate(lines) if i not in drop)
+        cleaned.append({**page, "text": re.sub(r"\n{3,}", "\n\n", text).strip()})
+
+    report.update(
+        {
+            "patterns": len(new),
+            "lines_removed": len(removed),
+            "tokens_saved": count_tokens("\n".join(removed)),
+        }
+    )
+    return cleaned, report
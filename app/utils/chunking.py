@@ -1,57 +1,328 @@
 # app/utils/chunking.py
 
-# Importamos la librería oficial para contar tokens como GPT-4o los cuenta
-import tiktoken
+import hashlib
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Caracteres a cada lado de una unión que se re-tokenizan para corregir el conteo
+# (un separador puede fusionarse con la puntuación vecina, p. ej. ".\n\n")
+JOIN_WINDOW = 64
+
+# Si la estimación incremental queda a menos de este margen del límite,
+# se cuenta el bloque completo para decidir igual que el algoritmo original
+EXACT_MARGIN = 8
+
+# Sin red, tiktoken no puede descargar su vocabulario la primera vez.
+# TOKENIZER_OFFLINE=1 permite seguir con un conteo aproximado (por exceso)
+TOKENIZER_OFFLINE = os.getenv("TOKENIZER_OFFLINE", "").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+
+class ApproxEncoding:
+    """Tokenizador aproximado sin vocabulario: palabras de hasta 4 letras, números de hasta 3 cifras."""
+
+    _pattern = re.compile(r"[^\W\d_]{1,4}|\d{1,3}|[^\w\s]|\s+")
+
+    def encode(self, text: str) -> List[str]:
+        return self._pattern.findall(text)
+
+
+_offline_encoding: Optional[ApproxEncoding] = None
+
+
+# Cargar el encoding es caro: se hace una sola vez por modelo
+@lru_cache(maxsize=8)
+def get_encoding(model: str = "gpt-4o"):
+    global _offline_encoding
+    if _offline_encoding is not None:
+        return _offline_encoding  # ya sabemos que no hay red: no se reintenta la descarga
+    # Importamos la librería oficial para contar tokens como GPT-4o los cuenta
+    # (aquí y no al importar el módulo: acelera el arranque en frío)
+    import tiktoken
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)  # Usa el esquema de tokenización del modelo
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")  # Modelo desconocido: el de la familia GPT-4o
+    except Exception as e:
+        if not TOKENIZER_OFFLINE:
+            raise
+        logger.warning(f"Vocabulario de tiktoken no disponible ({e}); conteo aproximado")
+        _offline_encoding = ApproxEncoding()
+        return _offline_encoding
+
 
 # Función que cuenta cuántos tokens hay en un texto, usando el modelo especificado
 def count_tokens(text: str, model: str = "gpt-4o") -> int:
-    encoding = tiktoken.encoding_for_model(model)  # Usa el esquema de tokenización del modelo
-    return len(encoding.encode(text))              # Devuelve la cantidad de tokens
+    return len(get_encoding(model).encode(text))  # Devuelve la cantidad de tokens
+
+
+class _TokenPacker:
+    """
+    Acumula piezas unidas por `sep` llevando la cuenta de tokens de forma incremental:
+    cada pieza se tokeniza una sola vez y solo se re-tokeniza la zona de cada unión.
+    """
+
+    def __init__(self, encoding, sep: str, max_tokens: int):
+        self.encoding = encoding
+        self.sep = sep
+        self.sep_tokens = len(encoding.encode(sep))
+        self.max_tokens = max_tokens
+        self.parts: List[str] = []
+        self.tokens = 0
+
+    def _count(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def _join_correction(self, left: str, right: str) -> int:
+        # Diferencia entre tokenizar la unión junta o por separado (normalmente 0 o -1)
+        tail = left[-JOIN_WINDOW:]
+        head = right[:JOIN_WINDOW]
+        joined = self._count(tail + self.sep + head)
+        return joined - self._count(tail) - self.sep_tokens - self._count(head)
+
+    def text(self) -> str:
+        return self.sep.join(self.parts)
+
+    def reset(self, piece: str = "", piece_tokens: int = 0) -> None:
+        self.parts = [piece] if piece else []
+        self.tokens = piece_tokens if piece else 0
+
+    def try_add(self, piece: str, piece_tokens: int) -> bool:
+        """Añade la pieza si el bloque resultante no supera max_tokens."""
+        if not self.parts:
+            # Bloque vacío: la pieza sola es el bloque de prueba
+            if piece_tokens <= self.max_tokens:
+                self.reset(piece, piece_tokens)
+                return True
+            return False
+
+        estimate = (
+            self.tokens
+            + self.sep_tokens
+            + piece_tokens
+            + self._join_correction(self.parts[-1], piece)
+        )
+        # Cerca del límite no nos fiamos de la estimación: conteo exacto
+        if abs(estimate - self.max_tokens) <= EXACT_MARGIN:
+            estimate = self._count(self.text() + self.sep + piece)
+
+        if estimate <= self.max_tokens:
+            self.parts.append(piece)
+            self.tokens = estimate
+            return True
+        return False
+
 
 # Función que divide el texto largo en chunks basados en un máximo de tokens permitidos
 def split_into_chunks(text: str, max_tokens: int = 3000, model: str = "gpt-4o") -> list:
+    encoding = get_encoding(model)
     paragraphs = text.split("\n\n")  # Divide por párrafos usando saltos dobles de línea
     chunks = []                      # Lista para guardar los bloques finales
-    current_chunk = ""              # Acumulador temporal
+    current = _TokenPacker(encoding, "\n\n", max_tokens)  # Acumulador temporal
 
     for paragraph in paragraphs:
         paragraph = paragraph.strip()
         if not paragraph:
             continue  # Salta párrafos vacíos
 
-        # Simula agregar el párrafo al bloque actual
-        test_chunk = current_chunk + "\n\n" + paragraph if current_chunk else paragraph
+        # Cada párrafo se tokeniza una única vez
+        paragraph_tokens = len(encoding.encode(paragraph))
 
         # Si el bloque no supera el límite de tokens, lo agregamos al chunk actual
-        if count_tokens(test_chunk, model) <= max_tokens:
-            current_chunk = test_chunk
+        if current.try_add(paragraph, paragraph_tokens):
+            continue
+
+        # Si supera el límite, guardamos el chunk actual y evaluamos el nuevo párrafo por separado
+        if current.parts:
+            chunks.append(current.text().strip())
+
+        # Si el párrafo solo ya es demasiado largo, lo troceamos por oraciones
+        if paragraph_tokens > max_tokens:
+            temp = _TokenPacker(encoding, ". ", max_tokens)
+            for s in paragraph.split(". "):  # Rompe en oraciones simples
+                s = s.strip()
+                s_tokens = len(encoding.encode(s))
+                if not temp.try_add(s, s_tokens):
+                    if temp.parts:
+                        chunks.append(temp.text().strip())
+                    temp.reset(s, s_tokens)
+            if temp.parts:
+                chunks.append(temp.text().strip())
+            current.reset()
         else:
-            # Si supera el límite, guardamos el chunk actual y evaluamos el nuevo párrafo por separado
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-
-            # Si el párrafo solo ya es demasiado largo, lo troceamos por oraciones
-            if count_tokens(paragraph, model) > max_tokens:
-                sentences = paragraph.split(". ")  # Rompe en oraciones simples
-                temp = ""
-                for s in sentences:
-                    s = s.strip()
-                    test = temp + ". " + s if temp else s
-                    if count_tokens(test, model) <= max_tokens:
-                        temp = test
-                    else:
-                        if temp:
-                            chunks.append(temp.strip())
-                        temp = s
-                if temp:
-                    chunks.append(temp.strip())
-                current_chunk = ""
-            else:
-                # Si el párrafo entra bien solo, lo usamos como nuevo chunk
-                current_chunk = paragraph
+            # Si el párrafo entra bien solo, lo usamos como nuevo chunk
+            current.reset(paragraph, paragraph_tokens)
 
     # Agrega el último chunk si quedó algo sin cerrar
-    if current_chunk:
-        chunks.append(current_chunk.strip())
+    if current.parts:
+        chunks.append(current.text().strip())
 
     return chunks
+
+
+# ==========================================
+# 📑 Chunking por páginas (con trazabilidad)
+# ==========================================
+PAGE_SEPARATOR = "\n---\n"
+
+
+def page_marker(page: Optional[int]) -> str:
+    """Cabecera que precede al texto de cada página dentro de un chunk."""
+    return f"[Página {page}]\n" if page is not None else ""
+
+
+def _hard_split(text: str, budget: int, encoding) -> List[str]:
+    """Corta un texto sin saltos de línea en trozos de <= budget tokens (preferiblemente en un espacio)."""
+    parts = []
+    rest = text
+    while rest:
+        # Solo se tokeniza una ventana acotada, no el resto entero de la línea
+        window = budget * 32
+        if len(rest) <= window and len(encoding.encode(rest)) <= budget:
+            parts.append(rest)
+            break
+        # Cada token ocupa al menos un carácter: budget caracteres siempre caben
+        lo, hi = min(budget, len(rest)), min(len(rest), window)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if len(encoding.encode(rest[:mid])) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        cut = max(lo, 1)
+        space = rest.rfind(" ", int(cut * 0.9), cut)
+        if space > 0:
+            cut = space + 1
+        parts.append(rest[:cut])
+        rest = rest[cut:]
+    return parts
+
+
+def split_text_exact(text: str, budget: int, model: str = "gpt-4o") -> List[str]:
+    """
+    Trocea `text` en partes de como máximo `budget` tokens cuya concatenación
+    es exactamente `text` (no se pierde ni se repite ningún carácter).
+    Corta por líneas y, si una línea sola no cabe, dentro de la línea.
+    """
+    encoding = get_encoding(model)
+    if len(encoding.encode(text)) <= budget:
+        return [text]
+
+    parts: List[str] = []
+    current, current_tokens = "", 0
+    for line in re.split(r"(?<=\n)", text):  # cada línea conserva su salto
+        if not line:
+            continue
+        line_tokens = len(encoding.encode(line))
+        if line_tokens > budget:
+            if current:
+                parts.append(current)
+                current, current_tokens = "", 0
+            parts.extend(_hard_split(line, budget, encoding))
+        elif current and current_tokens + line_tokens > budget:
+            parts.append(current)
+            current, current_tokens = line, line_tokens
+        else:
+            current += line
+            current_tokens += line_tokens
+    if current:
+        parts.append(current)
+
+    # La suma por líneas es una estimación: se verifica cada parte y se re-trocea si hace falta
+    exact: List[str] = []
+    for part in parts:
+        if len(encoding.encode(part)) <= budget or "\n" not in part.rstrip("\n"):
+            exact.append(part)
+        else:
+            middle = part.rfind("\n", 0, len(part) // 2 + 1) + 1 or len(part) // 2
+            exact.extend(split_text_exact(part[:middle], budget, model))
+            exact.extend(split_text_exact(part[middle:], budget, model))
+    return exact
+
+
+def is_anchor_page(text: str, anchor_every: int) -> bool:
+    """Corte definido por contenido: depende solo del texto de la página (≈ 1 de cada anchor_every)."""
+    digest = hashlib.sha1(text.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % anchor_every == 0
+
+
+def split_pages_into_chunks(
+    pages: List[Dict], max_tokens: int = 3000, model: str = "gpt-4o", anchor_every: int = 0
+) -> List[Dict]:
+    """
+    Agrupa páginas [{page, text}] en chunks de como máximo max_tokens.
+    Cada página va precedida de su marcador [Página N]; una página que no cabe sola
+    se reparte en varios chunks (cada trozo repite el marcador).
+    Devuelve [{text, page_start, page_end, segments: [{page, text}]}]: la concatenación
+    de los segmentos de una página reproduce exactamente su texto.
+
+    Con anchor_every > 0 también se cierra el chunk tras cada página "ancla"
+    (is_anchor_page): al editar una página solo cambian los chunks entre las anclas
+    que la rodean, y el resto del documento se trocea igual que en la revisión anterior.
+    """
+    return list(iter_pages_into_chunks(pages, max_tokens, model, anchor_every))
+
+
+def iter_pages_into_chunks(
+    pages: Iterable[Dict], max_tokens: int = 3000, model: str = "gpt-4o", anchor_every: int = 0
+) -> Iterator[Dict]:
+    """
+    Igual que split_pages_into_chunks, pero consume las páginas según llegan y entrega
+    cada chunk en cuanto se cierra: en memoria solo está el chunk en curso.
+    """
+    encoding = get_encoding(model)
+    packer = _TokenPacker(encoding, PAGE_SEPARATOR, max_tokens)
+    segments: List[Dict] = []
+
+    def flush() -> Optional[Dict]:
+        chunk = None
+        if packer.parts:
+            numbers = [s["page"] for s in segments if s["page"] is not None]
+            chunk = {
+                "text": packer.text(),
+                "page_start": numbers[0] if numbers else None,
+                "page_end": numbers[-1] if numbers else None,
+                "segments": list(segments),
+            }
+        segments.clear()
+        return chunk
+
+    for page in pages:
+        text = page["text"]
+        if not text:
+            continue  # página sin texto: nada que enviar
+        marker = page_marker(page["page"])
+        block = marker + text
+        block_tokens = len(encoding.encode(block))
+        if block_tokens <= max_tokens:
+            pieces = [(text, block, block_tokens)]
+        else:
+            budget = max(1, max_tokens - len(encoding.encode(marker)) - 1)
+            pieces = []
+            for part in split_text_exact(text, budget, model):
+                part_block = marker + part
+                pieces.append((part, part_block, len(encoding.encode(part_block))))
+
+        for part, part_block, part_tokens in pieces:
+            if not packer.try_add(part_block, part_tokens):
+                chunk = flush()
+                if chunk is not None:
+                    yield chunk
+                packer.reset(part_block, part_tokens)
+            segments.append({"page": page["page"], "text": part})
+
+        if anchor_every and is_anchor_page(text, anchor_every):
+            chunk = flush()
+            if chunk is not None:
+                yield chunk
+            packer.reset()
+
+    chunk = flush()
+    if chunk is not None:
+        yield chunk
@@ -0,0 +1,107 @@
+# app/utils/concurrency.py
+
+import asyncio
+import os
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Máximo de llamadas simultáneas al modelo por request (configurable por entorno)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+
+
+async def run_blocking(fn: Callable[..., R], *args, **kwargs) -> R:
+    """
+    Ejecuta una función bloqueante (parser, cliente OpenAI síncrono...) en un hilo,
+    para no congelar el event loop de uvicorn mientras dura.
+    """
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+async def map_chunks(
+    fn: Callable[[int, T], R],
+    items: Sequence[T],
+    max_concurrency: Optional[int] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> List[R]:
+    """
+    Aplica fn(índice, item) a cada chunk en hilos, con como máximo
+    `max_concurrency` ejecuciones a la vez. Devuelve los resultados
+    en el mismo orden que `items`. Si un chunk falla, se cancelan los pendientes
+    y se propaga la excepción.
+    Con `semaphore`, el límite se comparte con otras llamadas (una cola común para varios documentos).
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or LLM_MAX_CONCURRENCY))
+
+    async def _run(index: int, item: T) -> R:
+        async with semaphore:
+            return await run_blocking(fn, index, item)
+
+    tasks = [asyncio.create_task(_run(i, item)) for i, item in enumerate(items)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def iter_chunks_as_completed(
+    fn: Callable[[int, T], R],
+    items: Sequence[T],
+    max_concurrency: Optional[int] = None,
+) -> AsyncIterator[R]:
+    """
+    Igual que map_chunks, pero entrega cada resultado en cuanto termina
+    (orden de finalización). Si el consumidor deja de iterar, se cancelan los pendientes.
+    """
+    limit = max(1, max_concurrency or LLM_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(index: int, item: T) -> R:
+        async with semaphore:
+            return await run_blocking(fn, index, item)
+
+    tasks = [asyncio.create_task(_run(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_lazy_as_completed(
+    fn: Callable[[int, T], R],
+    items: Iterator[T],
+    max_concurrency: Optional[int] = None,
+) -> AsyncIterator[R]:
+    """
+    Igual que iter_chunks_as_completed, pero los items salen de un iterador bloqueante
+    (extracción y chunking en streaming) que se avanza en un hilo solo cuando hay hueco:
+    nunca hay más de `max_concurrency` items en memoria esperando resultado.
+    """
+    limit = max(1, max_concurrency or LLM_MAX_CONCURRENCY)
+    end = object()
+    pending = set()
+    index = 0
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                item = await run_blocking(next, items, end)
+                if item is end:
+                    exhausted = True
+                else:
+                    pending.add(asyncio.create_task(run_blocking(fn, index, item)))
+                    index += 1
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
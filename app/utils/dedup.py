@@ -0,0 +1,226 @@
+# app/utils/dedup.py
+# Consolidación de riesgos repetidos entre chunks (modo longdoc)
+
+import os
+import re
+import time
+from typing import TYPE_CHECKING, Dict, List
+
+# numpy se importa al consolidar, no al arrancar la API
+if TYPE_CHECKING:
+    import numpy as np
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# Similitud coseno mínima (n-gramas de caracteres con TF-IDF) para fusionar dos riesgos
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.75"))
+# Tamaño del espacio de hashing de n-gramas (memoria = nº riesgos x DIMS x 4 bytes)
+DEDUP_DIMS = int(os.getenv("DEDUP_DIMS", "2048"))
+NGRAM = 3
+# Filas por bloque al buscar pares candidatos
+BLOCK_ROWS = 256
+# Columnas de los vectores plegados que acotan la similitud (ver _folded)
+BOUND_DIMS = 512
+
+RISK_LISTS = ("intuitive_risks", "counterintuitive_risks")
+
+
+def _normalize(text: str) -> str:
+    text = re.sub(r"[^\w\s]", " ", str(text or "").lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def tfidf_vectors(texts: List[str], n: int = NGRAM, dims: int = DEDUP_DIMS) -> "np.ndarray":
+    """
+    Vectores TF-IDF de n-gramas de caracteres, normalizados (L2), calculados
+    de una vez para todos los textos: los n-gramas se hashean con NumPy sobre
+    el array de code points de todos los textos concatenados.
+    """
+    import numpy as np
+
+    docs = [f" {_normalize(t)} " for t in texts]
+    n_docs = len(docs)
+    lengths = np.fromiter((len(d) for d in docs), dtype=np.int64, count=n_docs)
+    codes = np.frombuffer("".join(docs).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+
+    counts = np.zeros((n_docs, dims), dtype=np.float32)
+    if len(codes) >= n:
+        doc_of = np.repeat(np.arange(n_docs), lengths)
+        starts = np.arange(len(codes) - n + 1)
+        # Solo n-gramas que no cruzan de un texto al siguiente
+        valid = doc_of[starts] == doc_of[starts + n - 1]
+        starts = starts[valid]
+
+        h = np.zeros(len(starts), dtype=np.uint64)
+        for k in range(n):
+            h = h * np.uint64(1000003) + codes[starts + k]
+        h ^= h >> np.uint64(29)
+        cols = (h % np.uint64(dims)).astype(np.int64)
+        rows = doc_of[starts]
+        flat = np.bincount(rows * dims + cols, minlength=n_docs * dims)
+        counts = flat.reshape(n_docs, dims).astype(np.float32)
+
+    # TF sublineal x IDF suavizado
+    df = np.count_nonzero(counts, axis=0)
+    idf = np.log((1.0 + n_docs) / (1.0 + df)).astype(np.float32) + 1.0
+    weights = np.where(counts > 0, np.log(np.maximum(counts, 1.0)) + 1.0, 0.0) * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return weights / np.maximum(norms, 1e-12)
+
+
+def _folded(vectors: "np.ndarray", dims: int = BOUND_DIMS) -> "np.ndarray":
+    """
+    Pliega los vectores a `dims` columnas: la mitad de más peso se conserva tal cual y el
+    resto se suma por grupos. Como los pesos no son negativos, el producto de dos vectores
+    plegados nunca es menor que su coseno: si no llega al umbral, el par se descarta sin
+    compararlo entero.
+    """
+    import numpy as np
+
+    n_dims = vectors.shape[1]
+    if n_dims <= dims:
+        return vectors
+    kept = dims // 2
+    by_weight = np.argsort(-np.einsum("ij,ij->j", vectors, vectors), kind="stable")
+    column = np.empty(n_dims, dtype=np.int64)
+    column[by_weight[:kept]] = np.arange(kept)
+    column[by_weight[kept:]] = kept + np.arange(n_dims - kept) % (dims - kept)
+    order = np.argsort(column, kind="stable")
+    starts = np.searchsorted(column[order], np.arange(dims))
+    return np.add.reduceat(vectors[:, order], starts, axis=1)
+
+
+def _merge_labels(labels: "np.ndarray", src: "np.ndarray", dst: "np.ndarray") -> "np.ndarray":
+    """Une los grupos de cada par (src, dst); cada fila queda con el índice mínimo de su grupo."""
+    import numpy as np
+
+    n = len(labels)
+    pairs = np.unique(labels[src] * n + labels[dst])
+    src, dst = pairs // n, pairs % n
+    # Propagación de la etiqueta mínima entre raíces + saltos de puntero hasta converger
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, src, labels[dst])
+        np.minimum.at(labels, dst, labels[src])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def cluster_labels(vectors: "np.ndarray", threshold: float = DEDUP_THRESHOLD) -> "np.ndarray":
+    """
+    Grupos de riesgos con similitud >= threshold (componentes conexas).
+    Devuelve para cada fila la etiqueta (índice mínimo) de su grupo.
+
+    Los riesgos repetidos literalmente se comparan una sola vez. Los pares candidatos salen
+    de los vectores plegados (_folded), que cuestan una fracción de la comparación completa
+    y nunca descartan un par similar; solo se comparan enteros los candidatos que aún no
+    están en el mismo grupo. El resultado no depende del orden.
+    """
+    import numpy as np
+
+    if len(vectors) < 2:
+        return np.arange(len(vectors))
+
+    # Vectores distintos, en orden de primera aparición: su índice mínimo es el del grupo
+    distinct: Dict[bytes, int] = {}
+    position = np.fromiter(
+        (distinct.setdefault(row.tobytes(), i) for i, row in enumerate(vectors)),
+        dtype=np.int64,
+        count=len(vectors),
+    )
+    first = np.fromiter(distinct.values(), dtype=np.int64, count=len(distinct))
+    return first[_distinct_labels(vectors[first], threshold)][np.searchsorted(first, position)]
+
+
+def _distinct_labels(vectors: "np.ndarray", threshold: float) -> "np.ndarray":
+    """cluster_labels sobre vectores sin repetidos."""
+    import numpy as np
+
+    n = len(vectors)
+    labels = np.arange(n)
+    folded = _folded(vectors)
+    # Margen para el redondeo en float32: la cota no debe quedar por debajo del coseno
+    bound = threshold - 1e-4
+    for start in range(0, n, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n)
+        i, j = np.nonzero(folded[start:stop] @ folded[start:].T >= bound)
+        src, dst = i + start, j + start
+        keep = (dst > src) & (labels[src] != labels[dst])
+        src, dst = src[keep], dst[keep]
+        if len(src) == 0:
+            continue
+        rows, row_of = np.unique(src, return_inverse=True)
+        columns, column_of = np.unique(dst, return_inverse=True)
+        sims = vectors[rows] @ vectors[columns].T
+        similar = sims[row_of, column_of] >= threshold
+        if similar.any():
+            labels = _merge_labels(labels, src[similar], dst[similar])
+    return labels
+
+
+def _merge_cluster(members: List[Dict]) -> Dict:
+    """Un riesgo por grupo: el texto más completo y todas las referencias de página/evidencia."""
+    representative = max(members, key=lambda r: len(str(r["risk"].get("justification", ""))))
+    merged = dict(representative["risk"])
+
+    pages, references = [], []
+    for member in members:
+        risk = member["risk"]
+        page = risk.get("page")
+        if page not in (None, "") and page not in pages:
+            pages.append(page)
+        reference = {
+            "filename": member["filename"],
+            "chunk_id": member["chunk_id"],
+            "page": page,
+            "evidence": risk.get("evidence", ""),
+        }
+        if reference not in references:
+            references.append(reference)
+
+    merged["page"] = ", ".join(str(p) for p in pages)
+    merged["pages"] = pages
+    merged["references"] = references
+    merged["occurrences"] = len(members)
+    return merged
+
+
+def consolidate_risks(chunk_results: List[Dict], threshold: float = DEDUP_THRESHOLD) -> Dict:
+    """
+    Fusiona los riesgos casi duplicados de todos los chunks (por separado en cada lista).
+    Devuelve {"intuitive_risks": [...], "counterintuitive_risks": [...], "_debug": {...}}.
+    """
+    started = time.perf_counter()
+    consolidated = {}
+    total_in = 0
+    for list_name in RISK_LISTS:
+        items = []
+        for position, result in enumerate(chunk_results):
+            chunk_id = (result.get("_debug") or {}).get("chunk_id", position + 1)
+            filename = (result.get("_debug") or {}).get("filename")
+            for risk in result.get(list_name) or []:
+                if isinstance(risk, dict):
+                    items.append({"chunk_id": chunk_id, "filename": filename, "risk": risk})
+        total_in += len(items)
+        if not items:
+            consolidated[list_name] = []
+            continue
+
+        vectors = tfidf_vectors([item["risk"].get("risk", "") for item in items])
+        labels = cluster_labels(vectors, threshold)
+
+        # Grupos en orden de primera aparición
+        groups: Dict[int, List[Dict]] = {}
+        for label, item in zip(labels.tolist(), items):
+            groups.setdefault(label, []).append(item)
+        consolidated[list_name] = [_merge_cluster(members) for members in groups.values()]
+
+    consolidated["_debug"] = {
+        "input_risks": total_in,
+        "merged_risks": sum(len(consolidated[name]) for name in RISK_LISTS),
+        "threshold": threshold,
+        "elapsed_s": round(time.perf_counter() - started, 4),
+    }
+    return consolidated
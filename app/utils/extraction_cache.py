@@ -0,0 +1,278 @@
+# app/utils/extraction_cache.py
+# Caché en disco del texto extraído (páginas de PDF, texto de DOCX/TXT) por hash del archivo
+# y versión del parser: repetir un análisis con otro `context` o `lang` no vuelve a pasar
+# el PDF por pdfplumber. SQLite en WAL, compartida por todos los workers de uvicorn del host.
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.utils.metrics import Counter
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+EXTRACTION_CACHE_ENABLED = (
+    os.getenv("EXTRACTION_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+)
+EXTRACTION_CACHE_PATH = os.getenv(
+    "EXTRACTION_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "ai_risk_radar_extraction.sqlite3"),
+)
+EXTRACTION_CACHE_MAX_MB = float(os.getenv("EXTRACTION_CACHE_MAX_MB", "500"))
+
+HASH_BLOCK_SIZE = 1024 * 1024
+# Páginas por transacción al guardar una extracción en streaming
+STORE_BATCH_PAGES = 32
+
+EXTRACTION_CACHE_TOTAL = Counter(
+    "risk_radar_extraction_cache_total",
+    "Consultas a la caché de extracción (result: hit, miss)",
+    ("result",),
+)
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 del archivo, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extraction_key(content_hash: str, kind: str, parser_version: str) -> str:
+    """Lo que determina el texto extraído: contenido, tipo de archivo y versión del parser."""
+    return f"{content_hash}:{kind}:{parser_version}"
+
+
+def _writer_alive(partial_key: str) -> bool:
+    """¿Sigue vivo el proceso que escribe la clave provisional `key#pid-uuid`?"""
+    try:
+        pid = int(partial_key.rsplit("#", 1)[1].split("-", 1)[0])
+    except (IndexError, ValueError):
+        return False
+    if pid == os.getpid():
+        return False  # este proceso acaba de arrancar: no tiene extracciones en curso
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _page(number: Optional[int], text: bytes, engine: Optional[str]) -> Dict:
+    page = {"page": number, "text": zlib.decompress(text).decode("utf-8")}
+    if engine is not None:  # solo PDF: motor que extrajo la página
+        page["engine"] = engine
+    return page
+
+
+class ExtractionCache:
+    """
+    Una fila por documento (nº de páginas, tamaño, último acceso) y una fila por página
+    con su texto comprimido: se puede leer una sola página sin cargar el resto.
+    Cuando el total supera `max_bytes` se expulsan los documentos menos usados (LRU).
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        # Los generadores (iter_pages, store_pages) pueden avanzar desde distintos hilos
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=check_same_thread)
+        if not self._initialized:
+            with self._init_lock:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS extraction_documents (
+                        key TEXT PRIMARY KEY,
+                        n_pages INTEGER NOT NULL,
+                        size INTEGER NOT NULL,
+                        created REAL NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS extraction_pages (
+                        key TEXT NOT NULL,
+                        position INTEGER NOT NULL,
+                        page INTEGER,
+                        text BLOB NOT NULL,
+                        engine TEXT,
+                        PRIMARY KEY (key, position)
+                    )
+                    """
+                )
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(extraction_pages)")}
+                if "engine" not in columns:  # cachés creadas antes de guardar el motor por página
+                    conn.execute("ALTER TABLE extraction_pages ADD COLUMN engine TEXT")
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_extraction_documents_access "
+                    "ON extraction_documents(last_access)"
+                )
+                self._purge_orphans(conn)
+                conn.commit()
+                self._initialized = True
+        return conn
+
+    def page_count(self, key: str) -> Optional[int]:
+        """Nº de páginas guardadas (y marca el acceso), o None si el documento no está."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT n_pages FROM extraction_documents WHERE key = ?", (key,)
+            ).fetchone()
+            EXTRACTION_CACHE_TOTAL.inc(result="miss" if row is None else "hit")
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE extraction_documents SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            conn.commit()
+            return row[0]
+        finally:
+            conn.close()
+
+    def load_page(self, key: str, position: int) -> Optional[Dict]:
+        """Una sola página {page, text[, engine]} (position empieza en 0)."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT page, text, engine FROM extraction_pages WHERE key = ? AND position = ?",
+                (key, position),
+            ).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else _page(*row)
+
+    def iter_pages(self, key: str) -> Iterator[Dict]:
+        """Páginas en orden, descomprimidas de una en una según se consumen."""
+        conn = self._connect(check_same_thread=False)
+        try:
+            for row in conn.execute(
+                "SELECT page, text, engine FROM extraction_pages WHERE key = ? ORDER BY position",
+                (key,),
+            ):
+                yield _page(*row)
+        finally:
+            conn.close()
+
+    def put(self, key: str, pages: List[Dict]) -> None:
+        for _ in self.store_pages(key, pages):
+            pass
+
+    def store_pages(self, key: str, pages: Iterable[Dict]) -> Iterator[Dict]:
+        """
+        Guarda las páginas según pasan (extracción en streaming) y las vuelve a entregar.
+        Se escriben bajo una clave provisional y el documento solo aparece en la caché
+        cuando están todas: nadie lee un documento a medias, y si la extracción se
+        interrumpe, lo escrito se borra.
+        """
+        partial = f"{key}#{os.getpid()}-{uuid.uuid4().hex}"
+        conn = self._connect(check_same_thread=False)
+        position = size = 0
+        complete = False
+        try:
+            rows = []
+            for page in pages:
+                blob = zlib.compress(page["text"].encode("utf-8"))
+                rows.append((partial, position, page["page"], blob, page.get("engine")))
+                position += 1
+                size += len(blob)
+                if len(rows) >= STORE_BATCH_PAGES:
+                    self._insert_pages(conn, rows)
+                    rows = []
+                yield page
+            self._insert_pages(conn, rows)
+
+            # Otro worker puede estar guardando el mismo archivo: la última escritura gana entera
+            conn.execute("DELETE FROM extraction_pages WHERE key = ?", (key,))
+            conn.execute("UPDATE extraction_pages SET key = ? WHERE key = ?", (key, partial))
+            conn.execute(
+                "INSERT OR REPLACE INTO extraction_documents "
+                "(key, n_pages, size, created, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, position, size, time.time(), time.time()),
+            )
+            self._evict(conn)
+            conn.commit()
+            complete = True
+        finally:
+            if not complete:
+                conn.rollback()
+                conn.execute("DELETE FROM extraction_pages WHERE key = ?", (partial,))
+                conn.commit()
+            conn.close()
+
+    @staticmethod
+    def _purge_orphans(conn: sqlite3.Connection) -> None:
+        # Al arrancar: páginas sin documento (extracciones a medias de un worker que murió).
+        # No cuentan en el tamaño de la caché, así que _evict no las borraría nunca.
+        # Las de workers vivos son extracciones en curso y se respetan.
+        orphans = [
+            (key,)
+            for (key,) in conn.execute(
+                "SELECT DISTINCT key FROM extraction_pages "
+                "WHERE key NOT IN (SELECT key FROM extraction_documents)"
+            )
+            if not _writer_alive(key)
+        ]
+        conn.executemany("DELETE FROM extraction_pages WHERE key = ?", orphans)
+
+    @staticmethod
+    def _insert_pages(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+        conn.executemany(
+            "INSERT INTO extraction_pages (key, position, page, text, engine) "
+            "VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()  # por tandas: no se bloquea al resto de workers durante toda la extracción
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        # Tamaño total: se borran primero los documentos menos usados
+        total = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM extraction_documents"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_delete = []
+        for key, size in conn.execute(
+            "SELECT key, size FROM extraction_documents ORDER BY last_access ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM extraction_pages WHERE key = ?", to_delete)
+        conn.executemany("DELETE FROM extraction_documents WHERE key = ?", to_delete)
+
+
+_cache: Optional[ExtractionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache() -> Optional[ExtractionCache]:
+    """Devuelve la caché de extracción del proceso (o None si está desactivada por entorno)."""
+    global _cache
+    if not EXTRACTION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache(
+                EXTRACTION_CACHE_PATH, max_bytes=int(EXTRACTION_CACHE_MAX_MB * 1024 * 1024)
+            )
+        return _cache
@@ -0,0 +1,98 @@
+# app/utils/json_repair.py
+# Parser tolerante para la salida del modelo: bloques ```json```, texto alrededor,
+# comas finales y respuestas cortadas (max_tokens) a mitad de un array.
+
+import json
+import re
+from typing import Any, List, Tuple
+
+_FENCE = re.compile(r"```[a-zA-Z]*\s*(.*?)\s*(?:```|$)", re.DOTALL)
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONRepairError(ValueError):
+    """La respuesta no contiene JSON recuperable."""
+
+
+def strip_fences(text: str) -> str:
+    """Contenido del primer bloque ``` (con o sin etiqueta de lenguaje); si no hay, el texto tal cual."""
+    match = _FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def _rebuild(text: str) -> str:
+    """
+    Recorre el JSON desde su primera llave: quita comas finales, ignora cierres sobrantes
+    y lo que venga después del valor raíz. Si el texto se corta, lo recorta al último
+    punto seguro (entre elementos de un array o entre claves del objeto raíz) y cierra
+    lo que quede abierto: así se pierde como mucho el último elemento incompleto.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escaped = False
+    safe = (0, [])  # (longitud de out, pila) donde se puede cortar
+
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+            out.append(char)
+            if char == "[" or len(stack) == 1:
+                safe = (len(out), list(stack))
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                continue  # cierre sobrante o cruzado
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()  # coma final: [1, 2,] -> [1, 2]
+            stack.pop()
+            out.append(char)
+            if not stack:
+                return "".join(out)
+            if stack[-1] == "]" or len(stack) == 1:
+                safe = (len(out), list(stack))
+        elif char == ",":
+            if stack and (stack[-1] == "]" or len(stack) == 1):
+                safe = (len(out), list(stack))
+            out.append(char)
+        else:
+            out.append(char)
+
+    # Texto cortado: volver al último punto seguro y cerrar lo abierto
+    length, open_stack = safe
+    out = out[:length]
+    while out and (out[-1].isspace() or out[-1] == ","):
+        out.pop()
+    return "".join(out) + "".join(reversed(open_stack))
+
+
+def repair_json(text: str) -> Tuple[Any, bool]:
+    """
+    Devuelve (valor, reparado). Primero json.loads tal cual (sin bloques ```);
+    si falla, reconstruye desde la primera llave. JSONRepairError si no hay nada que salvar.
+    """
+    body = strip_fences(text.strip()).strip()
+    try:
+        return json.loads(body), False
+    except json.JSONDecodeError:
+        pass
+
+    starts = [i for i in (body.find("{"), body.find("[")) if i >= 0]
+    if not starts:
+        raise JSONRepairError("La respuesta no contiene JSON")
+    rebuilt = _rebuild(body[min(starts):])
+    try:
+        return json.loads(rebuilt), True
+    except json.JSONDecodeError as e:
+        raise JSONRepairError(f"JSON irrecuperable: {e}") from e
@@ -0,0 +1,143 @@
+# app/utils/near_duplicates.py
+# Detección de chunks casi idénticos (pliegos de condiciones, anexos legales o tablas que se
+# repiten en varios documentos del paquete o varias veces en un PDF) con MinHash + LSH:
+# cada copia se analiza una sola vez y su resultado se reparte entre todas.
+
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Hashable, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# 0 = desactivado: todos los chunks van al modelo
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "1").lower() in ("1", "true", "yes")
+# Similitud de Jaccard (estimada) a partir de la cual dos chunks son el mismo texto
+CHUNK_DUP_THRESHOLD = float(os.getenv("CHUNK_DUP_THRESHOLD", "0.9"))
+# Máximo de chunks indexados: al superarlo se olvidan los más antiguos (~300 B por chunk)
+CHUNK_DUP_MAX_ENTRIES = int(os.getenv("CHUNK_DUP_MAX_ENTRIES", "50000"))
+
+# 64 permutaciones en 8 bandas de 8 filas: pares con Jaccard 0.9 son candidatos el 99 % de
+# las veces y pares con 0.5, el 3 %; los candidatos se confirman con la firma completa
+NUM_PERM = 64
+BANDS = 8
+SHINGLE_WORDS = 5
+
+_WORD = re.compile(r"\w+")
+_MARKER = re.compile(r"^\[Página \d+\]$", re.MULTILINE)
+# Cifras, fechas, importes y porcentajes: "5 %", "1.200.000 EUR", "14.02.2024", "km 12,5"
+_FIGURE = re.compile(r"\d+(?:[.,:/-]\d+)*")
+
+
+@lru_cache(maxsize=1)
+def _permutations():
+    import numpy as np
+
+    # Hashing multiply-shift: h(x) = ((a·x + b) mod 2^64) >> 32, con `a` impar
+    rng = np.random.default_rng(20240611)  # fijas: firmas comparables entre peticiones
+    top = np.iinfo(np.uint64).max
+    a = rng.integers(0, top, size=NUM_PERM, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, top, size=NUM_PERM, dtype=np.uint64, endpoint=True)
+    return a, b
+
+
+def minhash_signature(text: str) -> "np.ndarray":
+    """
+    Firma MinHash (NUM_PERM uint32) de los shingles de SHINGLE_WORDS palabras del texto.
+    Los marcadores [Página N] no cuentan: la misma cláusula en otra página es la misma cláusula.
+    """
+    import numpy as np
+
+    a, b = _permutations()
+
+    words = _WORD.findall(_MARKER.sub(" ", text).lower())
+    if not words:
+        return np.zeros(NUM_PERM, dtype=np.uint32)
+    vocabulary: Dict[str, int] = {}
+    word_hashes = np.array(
+        [vocabulary.setdefault(w, zlib.crc32(w.encode("utf-8"))) for w in words], dtype=np.uint64
+    )
+    # Hash de cada shingle = combinación polinómica de los hashes de sus palabras (vectorizado)
+    width = min(SHINGLE_WORDS, len(words))
+    count = len(words) - width + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(width):
+        shingles = shingles * np.uint64(1000003) + word_hashes[offset:offset + count]
+        shingles &= np.uint64(0xFFFFFFFF)
+    shingles = np.unique(shingles)
+    hashed = (a[:, None] * shingles[None, :] + b[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def figures_digest(text: str) -> int:
+    """
+    Huella de las cifras del texto, en orden. Dos cláusulas que solo difieren en un plazo,
+    un importe o un porcentaje no son la misma cláusula: sus riesgos no se pueden reutilizar.
+    """
+    return zlib.crc32("|".join(_FIGURE.findall(_MARKER.sub(" ", text))).encode("utf-8"))
+
+
+def similarity(first: "np.ndarray", second: "np.ndarray") -> float:
+    """Jaccard estimado: proporción de permutaciones con el mismo mínimo."""
+    return float((first == second).mean())
+
+
+class MinHashIndex:
+    """
+    Índice LSH en memoria, acotado a `max_entries` firmas (FIFO) y seguro entre hilos.
+    Cada cubeta guarda un único representante: buscar es O(BANDS) aunque haya decenas de miles de chunks.
+    Las cubetas incluyen la huella de cifras: solo son candidatos los chunks con las mismas cifras.
+    """
+
+    def __init__(
+        self, threshold: float = CHUNK_DUP_THRESHOLD, max_entries: int = CHUNK_DUP_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self._signatures: "OrderedDict[Hashable, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._buckets: Dict[Tuple[int, int, bytes], Hashable] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @staticmethod
+    def _bands(signature: "np.ndarray", figures: int):
+        rows = NUM_PERM // BANDS
+        for band in range(BANDS):
+            yield band, figures, signature[band * rows:(band + 1) * rows].tobytes()
+
+    def find_or_add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """
+        Clave del chunk ya indexado del que `text` es casi copia (con las mismas cifras);
+        si no hay ninguno, indexa `text` con `key` y devuelve None.
+        """
+        signature = minhash_signature(text)
+        figures = figures_digest(text)
+        with self._lock:
+            for band in self._bands(signature, figures):
+                candidate = self._buckets.get(band)
+                if candidate is None:
+                    continue
+                if similarity(signature, self._signatures[candidate][0]) >= self.threshold:
+                    return candidate
+
+            self._signatures[key] = (signature, figures)
+            for band in self._bands(signature, figures):
+                self._buckets.setdefault(band, key)
+            while len(self._signatures) > self.max_entries:
+                self._evict()
+        return None
+
+    def _evict(self) -> None:
+        old_key, (old_signature, old_figures) = self._signatures.popitem(last=False)
+        for band in self._bands(old_signature, old_figures):
+            if self._buckets.get(band) == old_key:
+                del self._buckets[band]
@@ -0,0 +1,166 @@
+# app/utils/relevance.py
+# Prefiltro local de relevancia: antes de trocear, se puntúa cada página (o párrafo, en
+# DOCX/TXT) y se descartan portadas, índices, hojas de firmas y leyendas sin pagar por enviarlas.
+#
+# Puntuación = léxico de riesgos ferroviarios (es/en/de) ponderado por TF-IDF dentro del
+# documento × densidad de texto (proporción de letras, líneas de prosa, sin puntos de relleno).
+
+import os
+import re
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+# Valor por defecto del flag `prefilter` de los endpoints. Desactivado: sin pedirlo, todas las
+# páginas llegan al modelo (cada carácter se envía una vez)
+RELEVANCE_PREFILTER = os.getenv("RELEVANCE_PREFILTER", "0").lower() in ("1", "true", "yes")
+# Por debajo de esta puntuación la página/párrafo no se envía al modelo
+RELEVANCE_THRESHOLD = float(os.getenv("RELEVANCE_THRESHOLD", "0.3"))
+# Unidades con menos palabras pesan proporcionalmente menos (portadas, sellos);
+# un párrafo corto con riesgo ("no se contempla la indexación del acero") debe pasar
+MIN_WORDS = {"page": 40, "paragraph": 8}
+
+# Raíces en minúsculas: una palabra cuenta si empieza por alguna (retras -> retraso, retrasos...)
+RISK_LEXICON = {
+    "es": (
+        "retras", "demora", "plazo", "cronogram", "sobrecost", "coste", "presupuest", "riesgo",
+        "penaliz", "reclamaci", "contrat", "licitaci", "adjudic", "permiso", "licencia",
+        "autorizaci", "expropiaci", "geotécn", "terreno", "suelo", "túnel", "puente", "viaducto",
+        "vía", "corte", "catenaria", "electrific", "señaliz", "enclavamiento", "interfaz",
+        "interferenc", "suministr", "subcontrat", "proveedor", "normativ", "seguridad", "obra",
+        "ejecuci", "tramitaci", "alegaci", "indexaci", "incumpl", "modificad", "desvío",
+    ),
+    "en": (
+        "delay", "schedule", "deadline", "cost", "overrun", "budget", "risk", "penalt", "claim",
+        "contract", "tender", "procure", "permit", "approv", "consent", "expropriat", "geotechn",
+        "ground", "soil", "tunnel", "bridge", "viaduct", "track", "possession", "catenary",
+        "electrif", "signal", "interlock", "etcs", "interface", "supplier", "supply", "subcontract",
+        "regulat", "safety", "construct", "works", "depend", "conflict", "escalat", "variation",
+    ),
+    "de": (
+        "verzög", "verzug", "frist", "termin", "kosten", "mehrkosten", "budget", "risik",
+        "vertragsstraf", "nachtrag", "vertrag", "vergabe", "ausschreib", "genehmig",
+        "planfeststell", "einwend", "baugrund", "boden", "tunnel", "brücke", "überführung", "gleis",
+        "sperrpause", "oberleitung", "elektrifiz", "signal", "stellwerk", "schnittstell",
+        "liefer", "nachunternehm", "vorschrift", "sicherheit", "bauarbeit", "oberbau", "abschnitt",
+        "anlieger", "eisenbahn-bundesamt", "indexier", "behinder",
+    ),
+}
+_STEMS = tuple(sorted({stem for stems in RISK_LEXICON.values() for stem in stems}))
+
+_WORD = re.compile(r"[^\W\d_][\w-]*")
+_LEADER = re.compile(r"(\.\s?){4,}|…{2,}|_{4,}")
+
+
+def _term_index(word: str, cache: Dict[str, int]) -> int:
+    """Índice de la raíz más larga del léxico con la que empieza `word`, o -1."""
+    index = cache.get(word)
+    if index is None:
+        index = -1
+        for i, stem in enumerate(_STEMS):
+            if word.startswith(stem) and (index < 0 or len(stem) > len(_STEMS[index])):
+                index = i
+        cache[word] = index
+    return index
+
+
+def density_score(text: str) -> float:
+    """
+    0..1: cuánto se parece el texto a prosa. Baja con muchos números y símbolos (tablas,
+    leyendas), con líneas cortas (índices, firmas, portadas) y con puntos de relleno (índices).
+    """
+    chars = [c for c in text if not c.isspace()]
+    if not chars:
+        return 0.0
+    alpha_ratio = sum(c.isalpha() for c in chars) / len(chars)
+    lines = [line for line in text.splitlines() if line.strip()]
+    prose_lines = sum(1 for line in lines if len(_WORD.findall(line)) >= 6)
+    leader_lines = sum(1 for line in lines if _LEADER.search(line))
+    prose_ratio = prose_lines / len(lines)
+    leader_ratio = leader_lines / len(lines)
+    return alpha_ratio * (0.3 + 0.7 * prose_ratio) * (1 - leader_ratio)
+
+
+def score_units(texts: List[str], min_words: int = MIN_WORDS["page"]) -> "np.ndarray":
+    """
+    Puntuación de cada texto: TF-IDF del léxico de riesgos (aciertos por cada 100 palabras,
+    ponderados por lo poco frecuente que es el término en el documento) × densidad.
+    """
+    import numpy as np
+
+    cache: Dict[str, int] = {}
+    counts = np.zeros((len(texts), len(_STEMS)), dtype=np.float32)
+    n_words = np.zeros(len(texts), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        n_words[row] = len(words)
+        indexes = [i for i in (_term_index(w, cache) for w in words) if i >= 0]
+        if indexes:
+            np.add.at(counts[row], indexes, 1)
+
+    # IDF suavizado dentro del documento: un término que aparece en todas las páginas aporta menos
+    df = (counts > 0).sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + df)) + 1
+    keyword = 100 * (counts * idf).sum(axis=1) / np.maximum(n_words, 1)
+    # Saturación: a partir de ~10 aciertos ponderados por 100 palabras no suma más
+    keyword = np.minimum(keyword / 10, 1.0)
+
+    density = np.array([density_score(text) for text in texts], dtype=np.float32)
+    length = np.minimum(n_words / min_words, 1.0)
+    return keyword * density * length
+
+
+def _split_paragraphs(text: str) -> List[str]:
+    return [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def prefilter_pages(
+    pages: List[Dict], threshold: float = RELEVANCE_THRESHOLD, min_chars: int = 0
+) -> Tuple[List[Dict], Dict]:
+    """
+    Quita las páginas (PDF) o los párrafos (DOCX/TXT, una sola "página") por debajo del umbral.
+    Si lo que queda no llega a `min_chars`, no se quita nada (mejor pagar que perder el documento).
+    Devuelve (páginas filtradas, informe con skip_ratio).
+    """
+    if len(pages) == 1 and pages[0]["page"] is None:
+        unit = "paragraph"
+        texts = _split_paragraphs(pages[0]["text"])
+    else:
+        unit = "page"
+        texts = [page["text"] for page in pages]
+
+    report = {"enabled": True, "unit": unit, "threshold": threshold, "units": len(texts)}
+    if not texts:
+        return pages, {**report, "skipped_units": 0, "skip_ratio": 0.0, "skipped_chars_ratio": 0.0}
+
+    keep = score_units(texts, MIN_WORDS[unit]) >= threshold
+    total_chars = sum(len(t) for t in texts)
+    kept_chars = sum(len(t) for t, k in zip(texts, keep) if k)
+    if kept_chars < min_chars:
+        keep[:] = True
+        kept_chars = total_chars
+
+    if unit == "page":
+        filtered = [page for page, k in zip(pages, keep) if k]
+        report["skipped_pages"] = [page["page"] for page, k in zip(pages, keep) if not k]
+    else:
+        kept = [t for t, k in zip(texts, keep) if k]
+        filtered = [{"page": None, "text": "\n\n".join(kept)}]
+
+    skipped = int((~keep).sum())
+    report.update(
+        {
+            "skipped_units": skipped,
+            "skip_ratio": round(skipped / len(texts), 3),
+            "skipped_chars_ratio": round(1 - kept_chars / max(total_chars, 1), 3),
+        }
+    )
+    return filtered, report
+
+
+def disabled_report() -> Dict:
+    return {"enabled": False}
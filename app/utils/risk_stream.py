@@ -0,0 +1,101 @@
+# app/utils/risk_stream.py
+# Parser incremental de la respuesta del modelo: entrega cada riesgo de
+# intuitive_risks / counterintuitive_risks en cuanto llega su llave de cierre,
+# sin esperar al JSON completo.
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+RISK_LISTS = ("intuitive_risks", "counterintuitive_risks")
+
+
+class RiskStreamParser:
+    """
+    Recorre el texto a medida que llega (feed) llevando la cuenta de cadenas y anidamiento.
+    Los objetos completos dentro de los arrays de riesgos se devuelven como (lista, riesgo).
+    Solo se guarda en memoria el riesgo que se está recibiendo, no la respuesta entera.
+    El JSON completo (parse_risks_json) sigue siendo la referencia al terminar.
+    """
+
+    def __init__(self, lists: Tuple[str, ...] = RISK_LISTS):
+        self.lists = lists
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.key: Optional[str] = None  # última cadena vista en el objeto raíz
+        self.current_list: Optional[str] = None  # array de riesgos en el que estamos
+        self._buffer = ""  # texto desde el inicio de la cadena o el objeto en curso
+        self._capturing = False
+        self._key_start = 0
+        self._object_start = 0
+
+    def feed(self, text: str) -> List[Tuple[str, Dict]]:
+        risks = []
+        start = len(self._buffer)
+        self._buffer += text
+        buffer = self._buffer
+        cut = None  # hasta dónde se puede descartar el buffer
+
+        for pos in range(start, len(buffer)):
+            char = buffer[pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self._capturing:
+                        # Clave del objeto raíz: "intuitive_risks", etc.
+                        self.key = buffer[self._key_start + 1:pos]
+                        self._capturing = False
+                        cut = pos + 1
+                continue
+
+            if char == '"':
+                self.in_string = True
+                if self.depth == 1:
+                    self._key_start = pos
+                    self._capturing = True
+            elif char in "{[":
+                if self.depth == 1 and char == "[":
+                    self.current_list = self.key if self.key in self.lists else None
+                elif self.depth == 2 and char == "{" and self.current_list:
+                    self._object_start = pos
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 2 and char == "}" and self.current_list:
+                    risk = self._load(buffer[self._object_start:pos + 1])
+                    if risk is not None:
+                        risks.append((self.current_list, risk))
+                    cut = pos + 1
+                elif self.depth == 1 and char == "]":
+                    self.current_list = None
+                    cut = pos + 1
+            elif self.depth <= 2 and not self._capturing:
+                cut = pos + 1
+
+        if cut is not None:
+            self._rebase(cut)
+        return risks
+
+    def _rebase(self, cut: int) -> None:
+        # Se descarta lo ya procesado; las posiciones pendientes se desplazan
+        if self.depth > 2 and self.current_list:
+            cut = min(cut, self._object_start)
+        if self._capturing:
+            cut = min(cut, self._key_start)
+        self._buffer = self._buffer[cut:]
+        if self.depth > 2 and self.current_list:
+            self._object_start -= cut
+        if self._capturing:
+            self._key_start -= cut
+
+    @staticmethod
+    def _load(raw: str) -> Optional[Dict]:
+        try:
+            risk = json.loads(raw)
+        except json.JSONDecodeError:
+            return None  # el JSON final decidirá; aquí no se emite nada dudoso
+        return risk if isinstance(risk, dict) else None
@@ -0,0 +1,149 @@
+# app/utils/uploads.py
+
+import json
+import os
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from fastapi import UploadFile
+
+# ==========================================
+# ⚙️ Límites de subida (por entorno)
+# ==========================================
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Paquetes (/analyze/batch): límite del total de la petición; cada archivo sigue con MAX_UPLOAD_MB
+MAX_BATCH_UPLOAD_MB = float(os.getenv("MAX_BATCH_UPLOAD_MB", "2000"))
+MAX_BATCH_UPLOAD_BYTES = int(MAX_BATCH_UPLOAD_MB * 1024 * 1024)
+# Holgura para los campos del formulario y las cabeceras multipart
+FORM_OVERHEAD_BYTES = 64 * 1024
+# Tamaño de bloque al copiar la subida a disco
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """La subida supera MAX_UPLOAD_MB."""
+
+
+def too_large_content() -> dict:
+    return {
+        "error_code": "file_too_large",
+        "message": f"El archivo supera el tamaño máximo permitido ({MAX_UPLOAD_MB:g} MB).",
+    }
+
+
+def batch_too_large_content() -> dict:
+    return {
+        "error_code": "batch_too_large",
+        "message": f"El paquete supera el tamaño total máximo permitido ({MAX_BATCH_UPLOAD_MB:g} MB).",
+    }
+
+
+async def spool_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> str:
+    """
+    Copia la subida a un fichero temporal en disco, bloque a bloque,
+    sin tener nunca el archivo entero en memoria. Devuelve la ruta;
+    quien llama debe borrarla al terminar.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge()
+
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix)
+    total = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                total += len(block)
+                if total > max_bytes:
+                    raise UploadTooLarge()
+                out.write(block)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI que rechaza con 413 las peticiones cuyo cuerpo supera el límite
+    antes de que FastAPI lea el formulario: por Content-Length si viene,
+    o contando bytes al vuelo si la subida es chunked.
+    El límite por defecto es el de un archivo; `path_limits` da a algunas rutas
+    (p. ej. paquetes con varios archivos) su propio límite y mensaje: {ruta: (bytes, contenido)}.
+    Cada archivo se limita además a MAX_UPLOAD_MB en spool_upload.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_body_bytes: int = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES,
+        path_limits: Optional[Dict[str, Tuple[int, dict]]] = None,
+    ):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+
+        max_body_bytes, content = self.path_limits.get(
+            scope["path"], (self.max_body_bytes, too_large_content())
+        )
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit():
+            if int(content_length) > max_body_bytes:
+                return await self._reject(send, content)
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes and not response_started:
+                    # Respondemos ya y cortamos la lectura: la app ve una desconexión
+                    rejected = True
+                    await self._reject(send, content)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected:
+                return  # la respuesta 413 ya se envió
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _reject(send, content: dict):
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,256 @@
+# app/utils/usage.py
+# Consumo de tokens y coste estimado: por llamada, chunk, petición y día
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from app.utils.metrics import Counter
+
+logger = logging.getLogger("uvicorn.error")
+
+# ==========================================
+# ⚙️ Configuración (por entorno)
+# ==========================================
+USAGE_DB_PATH = os.getenv(
+    "USAGE_DB_PATH", os.path.join(tempfile.gettempdir(), "ai_risk_radar_usage.sqlite3")
+)
+# Tokens (entrada + salida) máximos por petición; 0 = sin límite
+REQUEST_TOKEN_BUDGET = int(os.getenv("REQUEST_TOKEN_BUDGET", "0"))
+
+# Qué hacer al agotar el presupuesto:
+#  - degrade: los chunks restantes no se envían al modelo (se devuelven vacíos y marcados)
+#  - abort:   la petición falla con token_budget_exceeded
+BUDGET_MODES = ("degrade", "abort")
+
+# USD por millón de tokens: entrada, entrada cacheada y salida.
+# MODEL_PRICES (JSON con la misma forma) añade o sustituye modelos.
+DEFAULT_MODEL_PRICES = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+}
+MODEL_PRICES = {**DEFAULT_MODEL_PRICES, **json.loads(os.getenv("MODEL_PRICES", "{}"))}
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+TOKENS_TOTAL = Counter(
+    "risk_radar_llm_tokens_total", "Tokens consumidos (kind: prompt, completion, cached)", ("model", "kind")
+)
+COST_USD_TOTAL = Counter("risk_radar_llm_cost_usd_total", "Coste estimado en USD", ("model",))
+
+
+def model_prices(model: str) -> Optional[Dict[str, float]]:
+    # "fake:gpt-4o-mini" se valora como gpt-4o-mini; coincidencia por prefijo más largo
+    base = model.split(":")[-1]
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if base.startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+def estimate_cost(usage: Dict, model: str) -> Optional[float]:
+    """Coste en USD de un uso {prompt_tokens, completion_tokens, cached_tokens}; None si no hay precio."""
+    prices = model_prices(model)
+    if prices is None:
+        return None
+    cached = usage.get("cached_tokens", 0)
+    fresh = usage.get("prompt_tokens", 0) - cached  # prompt_tokens incluye los cacheados
+    cost = (
+        fresh * prices["input"]
+        + cached * prices.get("cached_input", prices["input"])
+        + usage.get("completion_tokens", 0) * prices["output"]
+    ) / 1_000_000
+    return round(cost, 6)
+
+
+def empty_usage() -> Dict:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "cost_usd": 0.0}
+
+
+def add_usage(total: Dict, usage: Optional[Dict]) -> Dict:
+    """Suma `usage` sobre `total` (in place). Un coste desconocido deja el total como None."""
+    if not usage:
+        return total
+    total["calls"] += usage.get("calls", 0)
+    for field in USAGE_FIELDS:
+        total[field] += usage.get(field, 0)
+    if total["cost_usd"] is not None:
+        cost = usage.get("cost_usd", 0.0)
+        total["cost_usd"] = None if cost is None else round(total["cost_usd"] + cost, 6)
+    return total
+
+
+# ==========================================
+# 📅 Agregado diario (SQLite)
+# ==========================================
+class UsageStore:
+    """Totales por día (UTC) y modelo; compartidos por todos los workers."""
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS usage_daily (
+                    day TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    cached_tokens INTEGER NOT NULL DEFAULT 0,
+                    cost_usd REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, model)
+                )
+                """
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, model: str, usage: Dict) -> None:
+        day = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                INSERT INTO usage_daily (day, model, calls, prompt_tokens, completion_tokens, cached_tokens, cost_usd)
+                VALUES (?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT (day, model) DO UPDATE SET
+                    calls = calls + 1,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    cached_tokens = cached_tokens + excluded.cached_tokens,
+                    cost_usd = cost_usd + excluded.cost_usd
+                """,
+                (
+                    day,
+                    model,
+                    usage["prompt_tokens"],
+                    usage["completion_tokens"],
+                    usage["cached_tokens"],
+                    usage["cost_usd"] or 0.0,
+                ),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def daily(self, days: int = 30) -> List[Dict]:
+        since = (datetime.datetime.now(datetime.timezone.utc).date() - datetime.timedelta(days=days - 1)).isoformat()
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT day, model, calls, prompt_tokens, completion_tokens, cached_tokens, cost_usd "
+                "FROM usage_daily WHERE day >= ? ORDER BY day DESC, model",
+                (since,),
+            ).fetchall()
+        finally:
+            conn.close()
+        keys = ("day", "model", "calls", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+_store: Optional[UsageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_usage_store() -> UsageStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UsageStore(USAGE_DB_PATH)
+        return _store
+
+
+def record_usage(model: str, raw_usage: Dict) -> Dict:
+    """
+    Normaliza el uso de una llamada, le añade el coste y lo acumula en métricas y en el día.
+    Devuelve {calls, prompt_tokens, completion_tokens, cached_tokens, cost_usd}.
+    """
+    usage = {"calls": 1, **{field: int(raw_usage.get(field) or 0) for field in USAGE_FIELDS}}
+    usage["cost_usd"] = estimate_cost(usage, model)
+
+    TOKENS_TOTAL.inc(usage["prompt_tokens"], model=model, kind="prompt")
+    TOKENS_TOTAL.inc(usage["completion_tokens"], model=model, kind="completion")
+    TOKENS_TOTAL.inc(usage["cached_tokens"], model=model, kind="cached")
+    if usage["cost_usd"] is not None:
+        COST_USD_TOTAL.inc(usage["cost_usd"], model=model)
+    try:
+        get_usage_store().record(model, usage)
+    except sqlite3.Error as e:
+        # La contabilidad no debe tumbar un análisis ya pagado
+        logger.error(f"No se pudo guardar el consumo diario: {e}")
+    return usage
+
+
+# ==========================================
+# 🎟️ Presupuesto de tokens por petición
+# ==========================================
+class TokenBudgetExhausted(Exception):
+    """La siguiente llamada superaría el presupuesto de tokens de la petición."""
+
+
+class TokenBudget:
+    """
+    Presupuesto compartido por los chunks de una petición (limit=0: sin límite).
+    Antes de cada llamada se reservan sus tokens de entrada; al terminar se
+    sustituye la reserva por el consumo real (entrada + salida).
+    """
+
+    def __init__(self, limit: int = REQUEST_TOKEN_BUDGET, mode: str = "degrade"):
+        self.limit = max(0, int(limit or 0))
+        self.mode = mode
+        self.used = 0
+        self.reserved = 0
+        self.skipped_chunks = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> None:
+        with self._lock:
+            if self.limit and self.used + self.reserved + tokens > self.limit:
+                raise TokenBudgetExhausted(
+                    f"Presupuesto de {self.limit} tokens agotado ({self.used} usados, "
+                    f"la siguiente llamada necesita {tokens})"
+                )
+            self.reserved += tokens
+
+    def settle(self, reserved: int, usage: Optional[Dict]) -> None:
+        with self._lock:
+            self.reserved -= reserved
+            if usage:
+                self.used += usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+
+    def skip(self) -> None:
+        with self._lock:
+            self.skipped_chunks += 1
+
+    def summary(self) -> Dict:
+        return {
+            "limit": self.limit or None,
+            "mode": self.mode,
+            "used": self.used,
+            "skipped_chunks": self.skipped_chunks,
+        }
+
+
+def summarize_usage(chunk_results: List[Dict], model: str, budget: Optional[TokenBudget] = None) -> Dict:
+    """Total de la petición a partir del _debug.usage de cada chunk."""
+    total = empty_usage()
+    for result in chunk_results:
+        add_usage(total, (result.get("_debug") or {}).get("usage"))
+    total["model"] = model
+    if budget is not None:
+        total["budget"] = budget.summary()
+    return total
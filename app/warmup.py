@@ -0,0 +1,87 @@
+# app/warmup.py
+# Pre-calentamiento en segundo plano: carga lo caro antes de la primera petición
+#
+# Importar app.main ya no carga openai, tiktoken, numpy, pdfplumber ni python-docx:
+# cada uno se importa en el camino que lo usa. Con WARMUP=1, al arrancar se cargan
+# en un hilo aparte mientras /health responde al momento; /ready dice cuándo terminó.
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+WARMUP_ENABLED = os.getenv("WARMUP", "0").lower() in ("1", "true", "yes")
+
+
+def _load_encoding() -> None:
+    from app.risk_engine import MODEL_NAME
+    from app.utils.chunking import get_encoding
+
+    get_encoding(MODEL_NAME)
+
+
+def _load_llm_client() -> None:
+    from app.llm_backends import get_backend
+
+    get_backend().warm_up()
+
+
+def _import_parsers() -> None:
+    import docx  # noqa: F401
+    import pdfplumber  # noqa: F401
+
+
+def _import_numpy() -> None:
+    import numpy  # noqa: F401
+
+
+WARMUP_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("encoding", _load_encoding),
+    ("llm_client", _load_llm_client),
+    ("parsers", _import_parsers),
+    ("numpy", _import_numpy),
+]
+
+
+class Warmup:
+    """Estado del pre-calentamiento: disabled, pending, running, done."""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED):
+        self.status = "pending" if enabled else "disabled"
+        self.steps: Dict[str, Dict] = {}
+        self.elapsed_s = None
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("done", "disabled")
+
+    def start(self) -> None:
+        if self.status != "pending":
+            return
+        self.status = "running"
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        for name, step in WARMUP_STEPS:
+            step_started = time.perf_counter()
+            try:
+                step()
+                result = {"ok": True}
+            except Exception as e:
+                # Un paso fallido no bloquea el servicio: se reintentará en la primera petición
+                logger.warning(f"Warm-up '{name}' falló: {e}")
+                result = {"ok": False, "error": str(e)}
+            result["elapsed_s"] = round(time.perf_counter() - step_started, 3)
+            self.steps[name] = result
+        self.elapsed_s = round(time.perf_counter() - started, 3)
+        self.status = "done"
+        logger.info(f"Warm-up terminado en {self.elapsed_s}s")
+
+    def to_dict(self) -> Dict:
+        return {"status": self.status, "elapsed_s": self.elapsed_s, "steps": dict(self.steps)}
@@ -0,0 +1,183 @@
+# benchmarks/documents.py
+# Documentos sintéticos de proyectos ferroviarios (TXT, DOCX, PDF) para los benchmarks
+
+import json
+import random
+from typing import Collection, List
+
+LINES_PER_PAGE = 40
+
+_SUBJECTS = [
+    "Die Eisenbahnüberführung bei km 12,5",
+    "El tramo entre Fulda y Kassel",
+    "The ETCS Level 2 retrofit on section 3",
+    "Der Planfeststellungsbeschluss für den Abschnitt Nord",
+    "La licitación de la catenaria",
+    "The track possession plan for 2027",
+    "Die Baugrunderkundung im Bereich des Tunnels",
+    "El contrato marco con DB InfraGO AG",
+]
+_PREDICATES = [
+    "depends on approval by the Eisenbahn-Bundesamt",
+    "requiere cortes de vía nocturnos durante 14 semanas",
+    "muss vor Beginn der Oberbauarbeiten abgeschlossen sein",
+    "has an estimated cost of 1.200.000 EUR (Anlage 3)",
+    "presenta interferencias con líneas de 110 kV",
+    "wird durch Einwendungen der Anlieger verzögert",
+    "is scheduled in parallel with the station refurbishment",
+    "no contempla la indexación de precios del acero",
+]
+
+
+def page_lines(rng: random.Random, number: int) -> List[str]:
+    """Una página: cabecera, texto técnico y pie (como los PDFs reales de DB)."""
+    lines = [f"DB InfraGO AG - Erläuterungsbericht", ""]
+    for _ in range(LINES_PER_PAGE - 4):
+        lines.append(f"{rng.choice(_SUBJECTS)} {rng.choice(_PREDICATES)}.")
+    lines += ["", f"DB InfraGO AG Seite {number}"]
+    return lines
+
+
+def document_pages(n_pages: int, seed: int = 0) -> List[List[str]]:
+    rng = random.Random(seed)
+    return [page_lines(rng, number) for number in range(1, n_pages + 1)]
+
+
+# Tablas: celdas separadas por tabuladores; en el PDF cada celda va en su columna
+TABLE_COLUMNS = (40, 210, 60, 50, 80)
+_ITEMS = ["Schotter liefern", "Schwellen B70 einbauen", "Oberleitung demontieren", "Balasto", "Carriles 60E1"]
+
+
+def table_lines(rng: random.Random, number: int) -> List[str]:
+    """Una página de presupuesto (Leistungsverzeichnis): cabecera, filas y pie."""
+    lines = ["DB InfraGO AG - Leistungsverzeichnis", "", "Pos.\tLeistung\tMenge\tEinheit\tPreis EUR"]
+    for row in range(1, LINES_PER_PAGE - 6):
+        lines.append(
+            f"{number}.{row}\t{rng.choice(_ITEMS)} km {rng.randint(1, 60)},{rng.randint(0, 9)}"
+            f"\t{rng.randint(1, 9999)}\t{rng.choice(['t', 'm', 'Stk'])}\t{rng.randint(100, 99999)},00"
+        )
+    lines += ["", f"DB InfraGO AG Seite {number}"]
+    return lines
+
+
+def mixed_pages(n_pages: int, seed: int = 0, table_every: int = 4) -> List[List[str]]:
+    """Texto técnico con una página de tabla cada `table_every`."""
+    rng = random.Random(seed)
+    return [
+        (table_lines if number % table_every == 0 else page_lines)(rng, number)
+        for number in range(1, n_pages + 1)
+    ]
+
+
+def write_txt(path: str, pages: List[List[str]]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join("\n".join(lines) for lines in pages))
+
+
+def write_docx(path: str, pages: List[List[str]]) -> None:
+    from docx import Document
+    from docx.enum.text import WD_BREAK
+
+    document = Document()
+    for number, lines in enumerate(pages, start=1):
+        for line in lines:
+            document.add_paragraph(line)
+        if number < len(pages):
+            document.paragraphs[-1].add_run().add_break(WD_BREAK.PAGE)
+    document.save(path)
+
+
+def _pdf_string(line: str) -> bytes:
+    raw = line.encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _positioned(cells: List[str], y: int, widths) -> bytes:
+    """Cada trozo en su posición absoluta, sin espacios entre ellos (como en tablas o texto justificado)."""
+    ops, x = [], 50
+    for cell, width in zip(cells, widths):
+        ops.append(b"1 0 0 1 %d %d Tm %s Tj" % (x, y, _pdf_string(cell)))
+        x += width(cell) if callable(width) else width
+    return b" ".join(ops)
+
+
+def _page_stream(lines: List[str], word_by_word: bool) -> bytes:
+    if not word_by_word and not any("\t" in line for line in lines):
+        return b"BT /F1 10 Tf 50 800 Td 14 TL " + b" ".join(_pdf_string(l) + b" '" for l in lines) + b" ET"
+    ops = []
+    for row, line in enumerate(lines):
+        y = 800 - 14 * row
+        if "\t" in line:
+            ops.append(_positioned(line.split("\t"), y, TABLE_COLUMNS))
+        elif word_by_word and line:
+            # ~5,5 pt por carácter en Helvetica 10 + 4 pt de separación
+            words = line.split()
+            ops.append(_positioned(words, y, [lambda w: int(len(w) * 5.5) + 4] * len(words)))
+        elif line:
+            ops.append(b"1 0 0 1 50 %d Tm %s Tj" % (y, _pdf_string(line)))
+    return b"BT /F1 10 Tf " + b" ".join(ops) + b" ET"
+
+
+def write_pdf(path: str, pages: List[List[str]], word_by_word: Collection[int] = ()) -> None:
+    """
+    PDF mínimo (Helvetica, una línea de texto por renglón) sin dependencias externas.
+    Las líneas con tabuladores se dibujan como celdas de tabla; las páginas de
+    `word_by_word` (nº de página) colocan cada palabra por separado, sin espacios.
+    """
+    objects: List[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    # El objeto /Pages va justo después de las páginas (2 objetos por página)
+    pages_id = font + 2 * len(pages) + 1
+    kids = []
+    for number, lines in enumerate(pages, start=1):
+        stream = _page_stream(lines, number in word_by_word)
+        contents = add(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        kids.append(
+            add(
+                b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+                b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, contents, font)
+            )
+        )
+    add(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids)))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        catalog,
+        xref,
+    )
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def llm_response(n_risks: int, seed: int = 0) -> str:
+    """Respuesta típica del modelo: JSON con n_risks por lista, envuelto en ```json."""
+    rng = random.Random(seed)
+
+    def risk(i):
+        return {
+            "risk": f"{rng.choice(_SUBJECTS)} {rng.choice(_PREDICATES)}",
+            "justification": " ".join(rng.choice(_PREDICATES) for _ in range(3)),
+            "countermeasure": "Plan de contingencia y seguimiento mensual",
+            "page": i + 1,
+            "evidence": rng.choice(_SUBJECTS),
+        }
+
+    body = {
+        "intuitive_risks": [risk(i) for i in range(n_risks)],
+        "counterintuitive_risks": [risk(i) for i in range(n_risks)],
+    }
+    return "```json\n" + json.dumps(body, ensure_ascii=False, indent=2) + "\n```"
@@ -0,0 +1,210 @@
+# benchmarks/run.py
+# Microbenchmarks de extracción, chunking y post-proceso de la respuesta del modelo.
+#
+#   python -m benchmarks.run --output benchmarks/baseline.json        # guardar referencia
+#   python -m benchmarks.run --compare benchmarks/baseline.json        # detectar regresiones
+#
+# El resultado es JSON (stdout o --output); con --compare el proceso sale con código 1
+# si algún benchmark es más lento que la referencia por encima del umbral.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from benchmarks import documents
+
+DEFAULT_SIZES = (10, 100, 1000)
+FORMATS = ("txt", "docx", "pdf")
+# PDF mixto para comparar motores: una página de tabla cada 4 y una de cada 10
+# con las palabras colocadas una a una (como el texto justificado de muchos PDFs)
+MIXED_TABLE_EVERY = 4
+MIXED_WORD_BY_WORD_EVERY = 10
+# Una regresión es una mediana más lenta que la referencia en más de THRESHOLD...
+DEFAULT_THRESHOLD = 0.15
+# ...y en más de MIN_DELTA_S (por debajo es ruido del reloj)
+MIN_DELTA_S = 0.002
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int) -> Dict:
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return {
+        "median_s": round(statistics.median(runs), 6),
+        "min_s": round(min(runs), 6),
+        "mean_s": round(statistics.fmean(runs), 6),
+        "stdev_s": round(statistics.stdev(runs), 6) if len(runs) > 1 else 0.0,
+        "runs": [round(r, 6) for r in runs],
+    }
+
+
+def build_documents(directory: str, sizes: List[int]) -> Dict[int, Dict[str, str]]:
+    paths = {}
+    for size in sizes:
+        pages = documents.document_pages(size, seed=size)
+        paths[size] = {}
+        for fmt in FORMATS:
+            path = os.path.join(directory, f"rail_{size}p.{fmt}")
+            getattr(documents, f"write_{fmt}")(path, pages)
+            paths[size][fmt] = path
+        path = os.path.join(directory, f"rail_{size}p_mixed.pdf")
+        documents.write_pdf(
+            path,
+            documents.mixed_pages(size, seed=size, table_every=MIXED_TABLE_EVERY),
+            word_by_word=range(MIXED_WORD_BY_WORD_EVERY // 2, size + 1, MIXED_WORD_BY_WORD_EVERY),
+        )
+        paths[size]["mixed_pdf"] = path
+    return paths
+
+
+def run_benchmarks(sizes: List[int], repeat: int, warmup: int, only: List[str]) -> Dict:
+    from app.parsers import (
+        PDF_ENGINE,
+        PDF_WORKERS,
+        extract_text_from_docx,
+        extract_text_from_pdf,
+        extract_text_from_txt,
+    )
+    from app.risk_engine import MODEL_NAME, parse_risks_json
+    from app.utils.chunking import get_encoding, split_into_chunks
+
+    results = {}
+
+    def bench(name: str, size: int, fn: Callable[[], object], **info) -> None:
+        key = f"{name}/{size}"
+        if only and not any(key.startswith(prefix) for prefix in only):
+            return
+        print(f"⏱️  {key}", file=sys.stderr)
+        results[key] = {"size": size, **info, **measure(fn, repeat, warmup)}
+        if name.startswith("extract_pdf"):
+            results[key]["pages_per_s"] = round(size / results[key]["median_s"], 1)
+
+    with tempfile.TemporaryDirectory(prefix="bench_") as directory:
+        paths = build_documents(directory, sizes)
+        for size in sizes:
+            files = paths[size]
+            sizes_bytes = {fmt: os.path.getsize(path) for fmt, path in files.items()}
+
+            bench("extract_txt", size, lambda: extract_text_from_txt(files["txt"]), bytes=sizes_bytes["txt"])
+            bench("extract_docx", size, lambda: extract_text_from_docx(files["docx"]), bytes=sizes_bytes["docx"])
+            bench("extract_pdf", size, lambda: extract_text_from_pdf(files["pdf"]), bytes=sizes_bytes["pdf"])
+
+            # Motores PDF sobre texto + tablas: pdfplumber en todas las páginas frente a
+            # PyPDF2 con fallback por página (fallback_pages = páginas que pasan a pdfplumber)
+            mixed = files["mixed_pdf"]
+            bench(
+                "extract_pdf_pdfplumber",
+                size,
+                lambda: extract_text_from_pdf(mixed, engine="pdfplumber"),
+                bytes=sizes_bytes["mixed_pdf"],
+            )
+            fallback = sum(p["engine"] == "pdfplumber" for p in extract_text_from_pdf(mixed, engine="hybrid"))
+            bench(
+                "extract_pdf_hybrid",
+                size,
+                lambda: extract_text_from_pdf(mixed, engine="hybrid"),
+                bytes=sizes_bytes["mixed_pdf"],
+                fallback_pages=fallback,
+            )
+            plumber, hybrid = (results.get(f"extract_pdf_{e}/{size}") for e in ("pdfplumber", "hybrid"))
+            if plumber and hybrid:
+                hybrid["speedup_vs_pdfplumber"] = round(plumber["median_s"] / hybrid["median_s"], 2)
+
+            text = extract_text_from_txt(files["txt"])
+            get_encoding(MODEL_NAME)  # el vocabulario se carga fuera de la medida
+            bench("split_into_chunks", size, lambda: split_into_chunks(text, 3000, MODEL_NAME), chars=len(text))
+
+            raw = documents.llm_response(size, seed=size)
+            bench("parse_risks_json", size, lambda: parse_risks_json(raw), chars=len(raw), risks=2 * size)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pdf_workers": PDF_WORKERS,
+            "pdf_engine": PDF_ENGINE,
+            "encoding": type(get_encoding(MODEL_NAME)).__name__,
+            "repeat": repeat,
+            "warmup": warmup,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> Dict:
+    """Compara medianas con la referencia; devuelve el detalle y la lista de regresiones."""
+    rows, regressions = [], []
+    for key, result in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        ratio = result["median_s"] / base["median_s"] if base["median_s"] else float("inf")
+        regression = (
+            ratio > 1 + threshold and result["median_s"] - base["median_s"] > MIN_DELTA_S
+        )
+        row = {
+            "benchmark": key,
+            "baseline_s": base["median_s"],
+            "current_s": result["median_s"],
+            "ratio": round(ratio, 3),
+            "regression": regression,
+        }
+        rows.append(row)
+        if regression:
+            regressions.append(key)
+    return {"threshold": threshold, "rows": rows, "regressions": regressions}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks de AI Risk Radar")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="nº de páginas, p. ej. 10,100")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", default="", help="prefijos de benchmark, p. ej. extract_pdf,parse")
+    parser.add_argument("--output", help="fichero JSON de salida (por defecto stdout)")
+    parser.add_argument("--compare", help="JSON de referencia para detectar regresiones")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = [p for p in args.only.split(",") if p]
+
+    report = run_benchmarks(sizes, args.repeat, args.warmup, only)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.threshold)
+        for row in report["comparison"]["rows"]:
+            flag = "❌ REGRESIÓN" if row["regression"] else "ok"
+            print(
+                f"{row['benchmark']:<28} {row['baseline_s']:>10.4f}s {row['current_s']:>10.4f}s "
+                f"x{row['ratio']:<6} {flag}",
+                file=sys.stderr,
+            )
+        exit_code = 1 if report["comparison"]["regressions"] else 0
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
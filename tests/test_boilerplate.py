@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from app import pipeline
+from app.utils import chunking, extraction_cache
+from app.utils.boilerplate import strip_repeated_lines
+from benchmarks import documents
+
+
+SENTENCES = [
+    "Die Sperrpause verschiebt die Oberbauarbeiten.",
+    "El corte de vía nocturno requiere autorización previa.",
+    "The ETCS retrofit depends on the interlocking supplier.",
+]
+
+
+def make_page(number):
+    body = [f"{number}.1 {SENTENCES[number % 3]}", f"{number}.2 {SENTENCES[(number + 1) % 3]}"]
+    if number % 4 == 0:
+        body.append("DB InfraGO AG")  # en el cuerpo no es cabecera: se queda
+    return {
+        "page": number,
+        "text": "\n".join(
+            ["DB InfraGO AG - Erläuterungsbericht", f"Rev. 03 vom 1{number % 2}.02.2024", ""]
+            + body
+            + ["", f"Seite {number} von 12"]
+        ),
+    }
+
+
+def test_repeated_headers_and_page_numbers_are_removed(monkeypatch):
+    monkeypatch.setattr(chunking, "_offline_encoding", chunking.ApproxEncoding())
+    pages = [make_page(n) for n in range(1, 13)]
+
+    cleaned, report = strip_repeated_lines(pages)
+
+    assert cleaned[0]["text"] == "\n".join(make_page(1)["text"].split("\n")[3:5])
+    assert cleaned[3]["text"].endswith("\nDB InfraGO AG")
+    assert report["patterns"] == 3
+    assert report["lines_removed"] == 36
+    assert report["tokens_saved"] > 0
+
+
+def test_single_page_documents_are_untouched():
+    pages = [{"page": None, "text": "Seite 1\nTexto\nSeite 2"}]
+
+    assert strip_repeated_lines(pages) == (pages, {"patterns": 0, "lines_removed": 0, "tokens_saved": 0})
+
+
+def test_document_made_only_of_repeated_lines_is_rejected_as_empty(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunking, "_offline_encoding", chunking.ApproxEncoding())
+    monkeypatch.setattr(extraction_cache, "EXTRACTION_CACHE_ENABLED", False)
+    lines = [f"Anlage {n}: Lageplan Abschnitt Nord, Maßstab 1:1000" for n in range(1, 9)]
+    path = str(tmp_path / "plaene.pdf")
+    documents.write_pdf(path, [lines] * 5)
+
+    async def analyze():
+        results = pipeline.iter_document_results(
+            path,
+            "plaene.pdf",
+            context="",
+            lang="de",
+            longdoc=False,
+            cache_mode="bypass",
+            budget=None,
+            prefilter=False,
+            report={},
+        )
+        return [result async for result in results]
+
+    with pytest.raises(pipeline.PipelineError) as error:
+        asyncio.run(analyze())
+    assert (error.value.error_code, error.value.status_code) == ("empty_or_too_short", 422)
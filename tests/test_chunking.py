@@ -0,0 +1,185 @@
+import random
+import re
+
+import pytest
+
+from app.utils import chunking
+
+
+class RegexEncoding:
+    """Tokenizador de juguete: la puntuación absorbe los saltos de línea, como en BPE."""
+
+    _pattern = re.compile(r"[^\W\d_]{1,6}|\d{1,3}|[^\w\s]+[\r\n]*|\s+")
+
+    def encode(self, text):
+        return self._pattern.findall(text)
+
+
+def _tiktoken_encoding():
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model("gpt-4o")
+    except Exception as exc:  # sin red no se puede descargar el vocabulario
+        pytest.skip(f"encoding de tiktoken no disponible: {exc}")
+
+
+def reference_split(text, max_tokens, encoding):
+    """Implementación original (cuadrática) de split_into_chunks."""
+
+    def count(t):
+        return len(encoding.encode(t))
+
+    paragraphs = text.split("\n\n")
+    chunks = []
+    current_chunk = ""
+    for paragraph in paragraphs:
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        test_chunk = current_chunk + "\n\n" + paragraph if current_chunk else paragraph
+        if count(test_chunk) <= max_tokens:
+            current_chunk = test_chunk
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            if count(paragraph) > max_tokens:
+                sentences = paragraph.split(". ")
+                temp = ""
+                for s in sentences:
+                    s = s.strip()
+                    test = temp + ". " + s if temp else s
+                    if count(test) <= max_tokens:
+                        temp = test
+                    else:
+                        if temp:
+                            chunks.append(temp.strip())
+                        temp = s
+                if temp:
+                    chunks.append(temp.strip())
+                current_chunk = ""
+            else:
+                current_chunk = paragraph
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def synthetic_document(seed, n_paragraphs=400):
+    rng = random.Random(seed)
+    words = [
+        "Planfeststellung", "Gleis", "Brücke", "Verzögerung", "riesgo", "contrato",
+        "Bauzeit", "km", "12,5", "DB", "InfraGO", "AG", "Seite", "§", "obra", "risk",
+        "(Anlage", "3)", "–", "Baugrund", "...", "Kosten:", "1.200", "€", "Signal",
+    ]
+    paragraphs = []
+    for _ in range(n_paragraphs):
+        kind = rng.random()
+        if kind < 0.05:
+            paragraphs.append("   ")  # párrafo vacío
+            continue
+        n_sentences = rng.randint(1, 60 if kind > 0.9 else 6)
+        sentences = []
+        for _ in range(n_sentences):
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(0, 25)))
+            sentences.append(sentence)
+        ending = rng.choice(["", ".", ":", ";", " ", "\n"])
+        paragraphs.append(". ".join(sentences) + ending)
+    return "\n\n".join(paragraphs)
+
+
+@pytest.mark.parametrize("encoding_name", ["regex", "tiktoken"])
+@pytest.mark.parametrize("max_tokens", [20, 120, 3000])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_split_matches_reference_boundaries(monkeypatch, encoding_name, max_tokens, seed):
+    encoding = RegexEncoding() if encoding_name == "regex" else _tiktoken_encoding()
+    monkeypatch.setattr(chunking, "get_encoding", lambda model="gpt-4o": encoding)
+
+    text = synthetic_document(seed)
+    expected = reference_split(text, max_tokens, encoding)
+
+    assert chunking.split_into_chunks(text, max_tokens=max_tokens) == expected
+
+
+def synthetic_pages(seed, n_pages=60):
+    rng = random.Random(seed)
+    pages = []
+    for number in range(1, n_pages + 1):
+        kind = rng.random()
+        if kind < 0.1:
+            text = ""  # página sin texto
+        elif kind < 0.2:
+            text = "x" * rng.randint(500, 3000)  # línea enorme sin espacios
+        else:
+            text = synthetic_document(seed * 1000 + number, n_paragraphs=rng.randint(1, 40))
+        pages.append({"page": number, "text": text})
+    return pages
+
+
+@pytest.mark.parametrize("max_tokens", [40, 300, 3000])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_split_pages_sends_every_character_once(monkeypatch, max_tokens, seed):
+    encoding = RegexEncoding()
+    monkeypatch.setattr(chunking, "get_encoding", lambda model="gpt-4o": encoding)
+    pages = synthetic_pages(seed)
+
+    chunks = chunking.split_pages_into_chunks(pages, max_tokens=max_tokens)
+
+    rebuilt = {}
+    for chunk in chunks:
+        assert len(encoding.encode(chunk["text"])) <= max_tokens
+        numbers = [s["page"] for s in chunk["segments"]]
+        assert (chunk["page_start"], chunk["page_end"]) == (numbers[0], numbers[-1])
+        assert chunk["text"] == chunking.PAGE_SEPARATOR.join(
+            chunking.page_marker(s["page"]) + s["text"] for s in chunk["segments"]
+        )
+        for segment in chunk["segments"]:
+            rebuilt[segment["page"]] = rebuilt.get(segment["page"], "") + segment["text"]
+
+    assert rebuilt == {p["page"]: p["text"] for p in pages if p["text"]}
+
+
+def short_pages(seed, n_pages=200):
+    rng = random.Random(seed)
+    words = ["Gleis", "Brücke", "riesgo", "contrato", "Bauzeit", "km", "12,5", "Signal", "obra"]
+    return [
+        {"page": number, "text": " ".join(rng.choice(words) for _ in range(rng.randint(20, 60)))}
+        for number in range(1, n_pages + 1)
+    ]
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_anchor_pages_keep_unchanged_chunks_stable(monkeypatch, seed):
+    encoding = RegexEncoding()
+    monkeypatch.setattr(chunking, "get_encoding", lambda model="gpt-4o": encoding)
+    pages = short_pages(seed)
+    revised = [dict(p) for p in pages]
+    revised[20]["text"] += " Sperrpause verschoben" * 20
+
+    def segment_texts(chunks):
+        return ["|".join(s["text"] for s in c["segments"]) for c in chunks]
+
+    before = segment_texts(chunking.split_pages_into_chunks(pages, max_tokens=1000, anchor_every=3))
+    after = segment_texts(chunking.split_pages_into_chunks(revised, max_tokens=1000, anchor_every=3))
+
+    # Solo cambian los chunks entre las anclas que rodean la página editada
+    # (sin anclas, el desplazamiento se propaga a casi todos los chunks siguientes)
+    assert len(set(after) - set(before)) <= 3
+
+
+def test_chunks_are_emitted_before_the_last_page_is_read(monkeypatch):
+    encoding = RegexEncoding()
+    monkeypatch.setattr(chunking, "get_encoding", lambda model="gpt-4o": encoding)
+    pages = short_pages(0)
+    read = []
+
+    def parser():
+        for page in pages:
+            read.append(page["page"])
+            yield page
+
+    stream = chunking.iter_pages_into_chunks(parser(), max_tokens=300)
+    first = next(stream)
+
+    assert len(read) < 10  # solo las páginas del primer chunk (y la que lo cierra)
+    assert [first, *stream] == chunking.split_pages_into_chunks(pages, max_tokens=300)
@@ -0,0 +1,40 @@
+from app.utils import dedup
+
+
+def test_thousands_of_near_identical_risks_collapse_into_their_groups():
+    variants = ["", " nocturnos", " (Anlage 3)", "s"]
+    results = [
+        {
+            "intuitive_risks": [
+                {"risk": "Retraso en la disponibilidad de cortes de vía" + variants[k % 4], "page": c},
+                {"risk": "Sobrecoste del acero por falta de indexación de precios", "page": c},
+            ],
+            "counterintuitive_risks": [],
+            "_debug": {"chunk_id": c, "filename": "pliego.pdf"},
+        }
+        for c in range(1, 751)
+        for k in range(2)
+    ]
+
+    merged = dedup.consolidate_risks(results)
+
+    assert [risk["occurrences"] for risk in merged["intuitive_risks"]] == [1500, 1500]
+    assert merged["intuitive_risks"][0]["pages"][:3] == [1, 2, 3]
+
+
+def test_near_duplicates_in_different_blocks_are_merged(monkeypatch):
+    monkeypatch.setattr(dedup, "BLOCK_ROWS", 2)
+    texts = [
+        "Retraso en la disponibilidad de cortes de vía nocturnos",
+        "Retraso en la disponibilidad de cortes de vía nocturnos en el tramo norte",
+        "Sobrecoste del acero por falta de indexación de precios",
+        "Falta de personal cualificado para la señalización ETCS",
+        "Permisos medioambientales pendientes para el vertedero de tierras",
+        "Interferencias con servicios afectados no inventariados",
+        # Se parece al segundo (primer bloque), pero no al primero
+        "Retraso en los cortes de vía nocturnos en el tramo norte",
+    ]
+
+    labels = dedup.cluster_labels(dedup.tfidf_vectors(texts))
+
+    assert labels.tolist() == [0, 0, 2, 3, 4, 5, 0]
@@ -0,0 +1,75 @@
+import os
+import random
+import sqlite3
+import zlib
+
+from app import pipeline
+from app.utils import extraction_cache
+from app.utils.extraction_cache import ExtractionCache
+
+
+def pages(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"page": i + 1, "text": " ".join(str(rng.random()) for _ in range(200))} for i in range(n)
+    ]
+
+
+def test_pages_are_stored_one_per_row_and_read_lazily(tmp_path):
+    cache = ExtractionCache(str(tmp_path / "extraction.sqlite3"), max_bytes=10 * 1024 * 1024)
+    document = pages(5)
+    cache.put("doc", document)
+
+    assert cache.page_count("doc") == 5
+    assert cache.load_page("doc", 3) == document[3]
+    assert list(cache.iter_pages("doc")) == document
+    assert cache.page_count("other") is None
+
+
+def test_least_recently_used_documents_are_evicted_by_size(tmp_path):
+    size = sum(len(zlib.compress(page["text"].encode("utf-8"))) for page in pages(4))
+    cache = ExtractionCache(str(tmp_path / "extraction.sqlite3"), max_bytes=int(size * 2.5))
+    for name in ("a", "b"):
+        cache.put(name, pages(4))
+    cache.page_count("a")  # "a" pasa a ser el más reciente
+    cache.put("c", pages(4))
+
+    assert cache.page_count("b") is None
+    assert cache.page_count("a") == 4 and cache.page_count("c") == 4
+
+
+def test_second_extraction_skips_the_parser(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / "extraction.sqlite3"), max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(extraction_cache, "_cache", cache)
+    calls = []
+    monkeypatch.setattr(pipeline, "extract_text_from_txt", lambda path: calls.append(path) or "Texto")
+    upload = tmp_path / "pliego.txt"
+    upload.write_text("Texto")
+
+    first = pipeline._extract_pages(str(upload), "pliego.txt")
+    second = pipeline._extract_pages(str(upload), "pliego.txt")
+
+    assert first == second == [{"page": None, "text": "Texto"}]
+    assert len(calls) == 1
+    assert os.path.exists(upload)
+
+
+def test_pages_left_by_a_dead_worker_are_purged_at_startup(tmp_path):
+    path = str(tmp_path / "extraction.sqlite3")
+    cache = ExtractionCache(path, max_bytes=10 * 1024 * 1024)
+    cache.put("doc", pages(2))
+    conn = cache._connect()
+    # Extracción a medias de un proceso que ya no existe (pid fuera de rango)
+    conn.executemany(
+        "INSERT INTO extraction_pages (key, position, page, text) VALUES (?, ?, ?, ?)",
+        [("other#99999999-abc", i, i + 1, zlib.compress(b"texto")) for i in range(3)],
+    )
+    conn.commit()
+    conn.close()
+
+    ExtractionCache(path, max_bytes=10 * 1024 * 1024).page_count("doc")
+
+    conn = sqlite3.connect(path)
+    keys = {key for (key,) in conn.execute("SELECT DISTINCT key FROM extraction_pages")}
+    conn.close()
+    assert keys == {"doc"}
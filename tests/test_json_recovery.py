@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from app import risk_engine
+from app.llm_backends import Completion, LLMBackend, set_backend
+from app.pipeline import analyze_chunk
+from app.utils import chunking
+from app.utils.json_repair import JSONRepairError, repair_json
+
+VALID = json.dumps(
+    {
+        "intuitive_risks": [{"risk": "Retraso en la entrega de traviesas", "page": 2}],
+        "counterintuitive_risks": [{"risk": "Conflicto con el suministro de tracción", "page": 3}],
+    },
+    ensure_ascii=False,
+)
+
+
+class ScriptedBackend(LLMBackend):
+    """Devuelve las respuestas indicadas, en orden, y guarda los mensajes recibidos."""
+
+    name = "scripted"
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def complete(self, messages, **kwargs):
+        self.requests.append(messages)
+        return Completion(content=self.responses.pop(0), usage={"prompt_tokens": 100, "completion_tokens": 50})
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    # Conteo de tokens sin descargar el vocabulario de tiktoken
+    monkeypatch.setattr(chunking, "_offline_encoding", chunking.ApproxEncoding())
+
+    def install(*responses):
+        scripted = ScriptedBackend(*responses)
+        set_backend(scripted)
+        return scripted
+
+    yield install
+    set_backend(None)
+
+
+def test_repair_handles_fences_prose_and_trailing_commas():
+    raw = 'Claro, aquí está:\n```json\n{"intuitive_risks": [{"risk": "a",},], "counterintuitive_risks": [],}\n```'
+
+    assert repair_json(raw) == ({"intuitive_risks": [{"risk": "a"}], "counterintuitive_risks": []}, True)
+    assert repair_json(f"```\n{VALID}\n```") == (json.loads(VALID), False)
+
+
+def test_repair_truncated_response_keeps_complete_risks_only():
+    cut = VALID.index('"page": 3')  # cortado dentro del último riesgo
+
+    data, repaired = repair_json(VALID[:cut])
+
+    assert repaired
+    assert data == {"intuitive_risks": json.loads(VALID)["intuitive_risks"], "counterintuitive_risks": []}
+
+
+def test_repair_gives_up_without_json():
+    with pytest.raises(JSONRepairError):
+        repair_json("Lo siento, no puedo ayudar con eso.")
+
+
+def test_unreadable_answer_is_asked_again_once(backend):
+    scripted = backend("Lo siento, no puedo ayudar con eso.", VALID)
+
+    result, usage = risk_engine.generate_risks_with_usage("Texto del fragmento")
+
+    assert result == json.loads(VALID)
+    assert usage["calls"] == 2
+    assert len(scripted.requests) == 2
+    assert scripted.requests[1][:2] == scripted.requests[0]
+    assert "JSON" in scripted.requests[1][-1]["content"]
+
+
+def test_failed_chunk_is_reported_without_raising(backend):
+    backend("no es json", "tampoco")
+    chunk = {"chunk_id": 4, "text": "Texto del fragmento", "page_start": 7, "page_end": 9}
+
+    result = analyze_chunk(chunk, filename="lote.pdf", context="", lang="es", cache_mode="bypass")
+
+    assert result["intuitive_risks"] == [] and result["counterintuitive_risks"] == []
+    assert result["_debug"]["cache"] == "failed"
+    assert result["_debug"]["error"]["error_code"] == "invalid_model_output"
+    assert result["_debug"]["usage"]["calls"] == 2  # las dos llamadas se pagaron
+
+
+def test_repaired_answer_is_not_cached(backend, monkeypatch, tmp_path):
+    from app.utils.analysis_cache import AnalysisCache
+
+    cache = AnalysisCache(str(tmp_path / "cache.sqlite3"), max_bytes=10**7, max_age_seconds=3600)
+    monkeypatch.setattr(risk_engine, "get_cache", lambda: cache)
+    backend(VALID[: VALID.index('"page": 3')], VALID)  # la primera respuesta llega cortada
+
+    first, first_status, _ = risk_engine.generate_risks_cached("Texto del fragmento")
+    second, second_status, _ = risk_engine.generate_risks_cached("Texto del fragmento")
+
+    assert first["counterintuitive_risks"] == [] and first_status == "miss"
+    assert second == json.loads(VALID) and second_status == "miss"
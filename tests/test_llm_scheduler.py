@@ -0,0 +1,119 @@
+import json
+import random
+
+import pytest
+
+from app.llm_backends import FakeBackend, FakeBackendError, LLMRateLimitError
+from app.llm_scheduler import LLMScheduler
+
+MESSAGES = [{"role": "user", "content": "[Página 1]\nRetraso en la entrega de traviesas."}]
+
+
+class FakeClock:
+    """Reloj manual: sleep() avanza el tiempo en lugar de esperar."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FlakyBackend(FakeBackend):
+    """Backend fake que falla con `errors` antes de responder."""
+
+    def __init__(self, errors):
+        super().__init__(latency_s=0, jitter_s=0, error_rate=0)
+        self.errors = list(errors)
+        self.calls = 0
+
+    def complete(self, messages, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().complete(messages, **kwargs)
+
+
+def make_scheduler(clock, **kwargs):
+    return LLMScheduler(clock=clock, sleep=clock.sleep, rng=random.Random(0), **kwargs)
+
+
+def complete(backend):
+    return lambda: backend.complete(MESSAGES, model="gpt-4o-mini", temperature=0.3, max_tokens=100)
+
+
+def test_rpm_limit_spaces_calls_once_the_bucket_is_empty():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=60)
+
+    for _ in range(60):
+        scheduler.call(lambda: None)
+    assert clock.sleeps == []
+
+    scheduler.call(lambda: None)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_tpm_limit_uses_the_estimate_before_sending():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, tpm=6000)
+
+    scheduler.call(lambda: None, estimated_tokens=4000)
+    scheduler.call(lambda: None, estimated_tokens=4000)
+
+    # Faltaban 2000 tokens a 100 tokens/s
+    assert sum(clock.sleeps) == pytest.approx(20.0)
+
+
+def test_rate_limit_honours_retry_after_and_then_succeeds():
+    clock = FakeClock()
+    backend = FlakyBackend([LLMRateLimitError("429", retry_after=7.5)])
+    scheduler = make_scheduler(clock)
+
+    completion = scheduler.call(complete(backend))
+
+    assert backend.calls == 2
+    assert clock.sleeps == [pytest.approx(7.5)]
+    assert set(json.loads(completion.content)) == {"intuitive_risks", "counterintuitive_risks"}
+
+
+def test_transient_errors_back_off_exponentially_with_jitter():
+    clock = FakeClock()
+    backend = FlakyBackend([FakeBackendError("500")] * 3)
+    scheduler = make_scheduler(clock, backoff_base_s=1.0, backoff_max_s=60)
+
+    scheduler.call(complete(backend))
+
+    assert backend.calls == 4
+    assert len(clock.sleeps) == 3
+    for attempt, delay in enumerate(clock.sleeps):
+        assert 0 <= delay <= 2 ** attempt
+
+
+def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    backend = FlakyBackend([FakeBackendError("500")] * 5)
+    scheduler = make_scheduler(clock, max_retries=2)
+
+    with pytest.raises(FakeBackendError):
+        scheduler.call(complete(backend))
+    assert backend.calls == 3
+
+
+def test_fake_backend_rate_limit_is_retried_transparently(monkeypatch):
+    clock = FakeClock()
+    backend = FakeBackend(latency_s=0, jitter_s=0, error_rate=0, rpm_limit=2)
+    # El límite simulado usa el reloj real del backend: se sustituye por el del test
+    monkeypatch.setattr("app.llm_backends.time.monotonic", clock)
+    scheduler = make_scheduler(clock)
+
+    for _ in range(3):
+        scheduler.call(complete(backend))
+
+    # La tercera llamada esperó lo que pedía el Retry-After (a que saliera la primera del minuto)
+    assert clock.sleeps == [pytest.approx(60.0)]
@@ -0,0 +1,79 @@
+import random
+
+from app.pipeline import fan_out_duplicates, find_duplicate_chunks
+from app.utils.near_duplicates import MinHashIndex
+
+WORDS = (
+    "vía corte catenaria plazo contrato obra túnel puente suministro señalización "
+    "Gleis Sperrpause Oberleitung Frist Vertrag track possession signalling supplier"
+).split()
+
+
+def clause(seed, n_words=400):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 99)) for _ in range(n_words))
+
+
+def make_chunk(chunk_id, page, text):
+    return {
+        "chunk_id": chunk_id,
+        "text": f"[Página {page}]\n{text}",
+        "page_start": page,
+        "page_end": page,
+        "segments": [{"page": page, "text": text}],
+    }
+
+
+def test_near_copy_is_found_and_other_text_is_not():
+    index = MinHashIndex(threshold=0.8)
+    annex = clause(1)
+    word = annex.split()[10]
+    edited = annex.replace(word, "modificado" + word.lstrip("abcdefghijklmnopqrstuvwxyzäöüßíóúñ"), 1)
+
+    assert index.find_or_add("a", f"[Página 3]\n{annex}") is None
+    assert index.find_or_add("b", clause(2)) is None
+    assert index.find_or_add("c", f"[Página 40]\n{edited}") == "a"
+
+
+def test_index_forgets_oldest_entries_beyond_its_limit():
+    index = MinHashIndex(max_entries=3)
+    for i in range(10):
+        index.find_or_add(i, clause(i))
+
+    assert len(index) == 3
+    assert index.find_or_add("again", clause(0)) is None  # olvidado
+    assert index.find_or_add("again-2", clause(9)) == 9
+
+
+def test_duplicates_get_the_original_result_with_their_own_pages():
+    chunks = [make_chunk(1, 2, clause(1)), make_chunk(2, 5, clause(2)), make_chunk(3, 9, clause(1))]
+    unique, duplicates = find_duplicate_chunks(chunks, MinHashIndex())
+    results = [
+        {
+            "intuitive_risks": [{"risk": "Corte de vía", "page": chunk["page_start"]}],
+            "counterintuitive_risks": [],
+            "_debug": {"filename": "pliego.pdf", "chunk_id": chunk["chunk_id"], "cache": "miss"},
+        }
+        for chunk in unique
+    ]
+
+    merged = fan_out_duplicates(chunks, results, duplicates, "pliego.pdf")
+
+    assert [chunk["chunk_id"] for chunk in unique] == [1, 2]
+    assert merged[2]["intuitive_risks"] == [{"risk": "Corte de vía", "page": 9}]
+    assert merged[2]["_debug"]["cache"] == "duplicate"
+    assert merged[2]["_debug"]["duplicate_of"] == {"filename": "pliego.pdf", "chunk_id": 1}
+    assert merged[0]["intuitive_risks"] == [{"risk": "Corte de vía", "page": 2}]
+
+
+def test_clauses_that_differ_only_in_a_figure_are_both_analysed():
+    penalty = clause(3, 350)
+    chunks = [
+        make_chunk(1, 4, f"{penalty} Vertragsstrafe 5 % der Auftragssumme."),
+        make_chunk(2, 7, f"{penalty} Vertragsstrafe 50 % der Auftragssumme."),
+    ]
+
+    unique, duplicates = find_duplicate_chunks(chunks, MinHashIndex())
+
+    assert [chunk["chunk_id"] for chunk in unique] == [1, 2]
+    assert duplicates == {}
@@ -0,0 +1,29 @@
+import pytest
+
+from app.parsers import extract_text_from_pdf, fast_text_problem
+from benchmarks import documents
+
+
+@pytest.mark.parametrize(
+    "text, problem",
+    [
+        ("Der Planfeststellungsbeschluss für den Abschnitt Nord liegt seit Mai 2024 vor.", None),
+        ("", "empty"),
+        ("Die (cid:12)(cid:7)(cid:31)(cid:4) Oberleitung wird im Abschnitt 3 erneuert.", "garbled"),
+        ("DieSperrpause verschiebt dieOberbauarbeiten umdreiWochen bis zumEnde desJahres.", "no_spaces"),
+    ],
+)
+def test_fast_text_quality_heuristics(text, problem):
+    assert fast_text_problem(text) == problem
+
+
+def test_hybrid_falls_back_to_pdfplumber_only_where_needed(tmp_path):
+    path = str(tmp_path / "mixed.pdf")
+    # Páginas 1-3 texto, 4 tabla (celdas pegadas en PyPDF2), 5 palabra a palabra
+    documents.write_pdf(path, documents.mixed_pages(5, seed=1), word_by_word=[5])
+
+    hybrid = extract_text_from_pdf(path, workers=1, engine="hybrid")
+    plumber = extract_text_from_pdf(path, workers=1, engine="pdfplumber")
+
+    assert [page["engine"] for page in hybrid] == ["pypdf2"] * 3 + ["pdfplumber"] * 2
+    assert [page["text"] for page in hybrid] == [page["text"] for page in plumber]
@@ -0,0 +1,36 @@
+from app.utils.relevance import prefilter_pages
+
+RISK_PAGE = (
+    "El plazo de ejecución de la obra depende de la autorización del corte de vía por parte del "
+    "administrador. Cualquier retraso en la tramitación de los permisos genera sobrecostes y "
+    "penalizaciones contractuales para el contratista.\n"
+    "La catenaria existente debe mantenerse en servicio durante la ejecución, lo que limita las "
+    "ventanas de trabajo nocturnas y aumenta el riesgo de interferencias con la señalización.\n"
+    "El suministro de carril y traviesas no está garantizado por el proveedor en los plazos del "
+    "cronograma, y el contrato no contempla la indexación del acero."
+)
+TITLE_PAGE = "ADIF\n\nProyecto constructivo\n\nTomo 1\n\nMadrid, 2024"
+TOC_PAGE = "Índice\n" + "\n".join(f"{i}. Capítulo {i} ........................ {4 * i}" for i in range(1, 15))
+
+
+def test_boilerplate_pages_are_skipped_and_risk_prose_kept():
+    pages = [
+        {"page": 1, "text": TITLE_PAGE},
+        {"page": 2, "text": TOC_PAGE},
+        {"page": 3, "text": RISK_PAGE},
+    ]
+
+    kept, report = prefilter_pages(pages)
+
+    assert [page["page"] for page in kept] == [3]
+    assert report["skipped_pages"] == [1, 2]
+    assert report["skip_ratio"] == round(2 / 3, 3)
+
+
+def test_nothing_is_skipped_when_too_little_text_would_remain():
+    pages = [{"page": 1, "text": TITLE_PAGE}, {"page": 2, "text": TOC_PAGE}]
+
+    kept, report = prefilter_pages(pages, min_chars=100)
+
+    assert kept == pages
+    assert report["skipped_units"] == 0
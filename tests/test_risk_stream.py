@@ -0,0 +1,65 @@
+import json
+import random
+
+import pytest
+
+from app.llm_backends import FakeBackend
+from app.utils.risk_stream import RiskStreamParser
+
+RESPONSE = {
+    "intuitive_risks": [
+        {"risk": 'Retraso "crítico" en la entrega {traviesas}', "page": 3, "evidence": "]}"},
+        {"risk": "Kostensteigerung \\ Stahl", "page": None, "extra": {"k": [1, {"z": "}"}]}},
+    ],
+    "notes": [{"ignored": True}],
+    "counterintuitive_risks": [{"risk": "Signalling interface mismatch", "page": 12}],
+}
+
+
+def feed_in_pieces(raw, seed):
+    rng = random.Random(seed)
+    parser = RiskStreamParser()
+    risks, i = [], 0
+    while i < len(raw):
+        size = rng.randint(1, 16)
+        risks += parser.feed(raw[i:i + size])
+        i += size
+    return risks, parser
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("seed", range(5))
+def test_emits_each_risk_once_whatever_the_split(indent, seed):
+    raw = "```json\n" + json.dumps(RESPONSE, ensure_ascii=False, indent=indent) + "\n```"
+
+    risks, parser = feed_in_pieces(raw, seed)
+
+    expected = [(name, risk) for name in ("intuitive_risks", "counterintuitive_risks") for risk in RESPONSE[name]]
+    assert risks == expected
+    # Lo ya entregado no se queda en memoria
+    assert len(parser._buffer) < 32
+
+
+def test_risk_is_emitted_before_the_response_ends():
+    raw = json.dumps(RESPONSE)
+    first_close = raw.index('"]}"}') + len('"]}"}')
+    parser = RiskStreamParser()
+
+    assert parser.feed(raw[:first_close - 1]) == []
+    assert parser.feed(raw[first_close - 1:first_close]) == [("intuitive_risks", RESPONSE["intuitive_risks"][0])]
+
+
+def test_fake_backend_stream_matches_complete():
+    backend = FakeBackend(latency_s=0, jitter_s=0, error_rate=0)
+    messages = [{"role": "user", "content": "[Página 4]\nLa vía no estará disponible."}]
+    kwargs = {"model": "gpt-4o-mini", "temperature": 0.3, "max_tokens": 100}
+
+    stream = backend.stream(messages, **kwargs)
+    parser = RiskStreamParser()
+    risks = [risk for delta in stream for risk in parser.feed(delta)]
+    completion = backend.complete(messages, **kwargs)
+
+    assert stream.content == completion.content
+    assert stream.usage == completion.usage
+    full = json.loads(completion.content)
+    assert [risk for _, risk in risks] == full["intuitive_risks"] + full["counterintuitive_risks"]
@@ -29,6 +29,7 @@ lang_code = LANGUAGES[lang]
 # ==========================
 BASE_URL = os.environ.get("API_URL", "http://localhost:10000")
 API_URL = f"{BASE_URL}/analyze"
+STREAM_URL = f"{BASE_URL}/analyze/stream"
 
 # ==========================
 # 📂 Configuración de Google Sheets
@@ -87,8 +88,35 @@ if not st.session_state["authorized"]:
 # ==========================
 # 🔄 Función para renderizar tabla combinada
 # ==========================
-def render_combined_table(df1: pd.DataFrame, df2: pd.DataFrame, title: str, lang_code: str):
-    """Combina riesgos intuitivos y contraintuitivos en una sola tabla, con salto de línea y exportación a Excel."""
+TABLE_CSS = """
+<style>
+  table.wraptable {
+    table-layout: fixed;
+    width: 100%;
+    border-collapse: collapse;
+    word-break: break-word;
+  }
+  table.wraptable th, table.wraptable td {
+    white-space: normal !important;
+    word-wrap: break-word !important;
+    overflow-wrap: anywhere !important;
+    text-align: left;
+    vertical-align: top;
+    padding: 0.6rem;
+    line-height: 1.4;
+  }
+  table.wraptable thead th {
+    position: sticky;
+    top: 0;
+    background-color: #222;
+    color: #fff;
+  }
+</style>
+"""
+
+
+def combine_risks(df1: pd.DataFrame, df2: pd.DataFrame) -> pd.DataFrame:
+    """Une riesgos intuitivos y contraintuitivos con columnas renombradas y ordenadas."""
 
     # Evita errores de ambigüedad
     df1 = df1.copy() if isinstance(df1, pd.DataFrame) else pd.DataFrame()
@@ -102,8 +130,7 @@ def render_combined_table(df1: pd.DataFrame, df2: pd.DataFrame, title: str, lang
 
     combined = pd.concat([df1, df2], ignore_index=True)
     if combined.empty:
-        st.info("No hay datos para mostrar.")
-        return
+        return combined
 
     # Renombrar columnas
     rename_map = {
@@ -117,35 +144,20 @@ def render_combined_table(df1: pd.DataFrame, df2: pd.DataFrame, title: str, lang
     combined.rename(columns={k: v for k, v in rename_map.items() if k in combined.columns}, inplace=True)
 
     ordered = [c for c in ["🔎 Tipo", "🟠 Riesgo", "📖 Justificación", "🛠️ Contramedida", "📑 Página", "📄 Evidencia"] if c in combined.columns]
-    combined = combined[ordered]
+    return combined[ordered]
+
+
+def render_combined_table(df1: pd.DataFrame, df2: pd.DataFrame, title: str, lang_code: str):
+    """Combina riesgos intuitivos y contraintuitivos en una sola tabla, con salto de línea y exportación a Excel."""
+
+    combined = combine_risks(df1, df2)
+    if combined.empty:
+        st.info("No hay datos para mostrar.")
+        return
 
     # 💅 CSS para salto de línea real
     st.subheader(title)
-    st.markdown("""
-    <style>
-      table.wraptable {
-        table-layout: fixed;
-        width: 100%;
-        border-collapse: collapse;
-        word-break: break-word;
-      }
-      table.wraptable th, table.wraptable td {
-        white-space: normal !important;
-        word-wrap: break-word !important;
-        overflow-wrap: anywhere !important;
-        text-align: left;
-        vertical-align: top;
-        padding: 0.6rem;
-        line-height: 1.4;
-      }
-      table.wraptable thead th {
-        position: sticky;
-        top: 0;
-        background-color: #222;
-        color: #fff;
-      }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(TABLE_CSS, unsafe_allow_html=True)
 
     # Renderizar tabla HTML con salto de línea
     st.markdown(
@@ -193,34 +205,54 @@ if st.session_state["authorized"]:
         if not uploaded_file:
             st.warning(t["no_file_warning"][lang_code])
         else:
-            with st.spinner(t["analyzing"][lang_code]):
-                files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                data = {"context": context, "lang": lang_code, "longdoc": longdoc_mode}
+            files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
+            data = {"context": context, "lang": lang_code, "longdoc": longdoc_mode}
 
-                try:
-                    r = requests.post(API_URL, files=files, data=data, timeout=1200)
-                    r.raise_for_status()
-                    result = r.json()
-                    st.success(t["analysis_done"][lang_code])
-
-                    df1 = pd.DataFrame(result.get("intuitive_risks", []))
-                    df2 = pd.DataFrame(result.get("counterintuitive_risks", []))
-
-                    # Modo Longdoc
-                    if "chunks" in result:
-                        all_intuitive, all_counter = [], []
-                        for chunk in result["chunks"]:
-                            all_intuitive.extend(chunk.get("intuitive_risks", []))
-                            all_counter.extend(chunk.get("counterintuitive_risks", []))
-                        df1 = pd.DataFrame(all_intuitive)
-                        df2 = pd.DataFrame(all_counter)
-
-                    render_combined_table(df1, df2, "Riesgos combinados", lang_code)
-
-                    if result.get("source") == "modo simulado (mock)":
-                        st.info(t["mock_notice"][lang_code])
-
-                except requests.exceptions.RequestException as e:
-                    st.error(f"🌐 Error de red: {e}")
-                except Exception as e:
-                    st.error(f"⚠️ Error inesperado: {e}")
+            # 📡 Los riesgos llegan por chunk (NDJSON) y se pintan según van llegando
+            all_intuitive, all_counter = [], []
+            st.markdown(TABLE_CSS, unsafe_allow_html=True)
+            progress = st.progress(0.0, text=t["analyzing"][lang_code])
+            live_table = st.empty()
+
+            try:
+                with requests.post(STREAM_URL, files=files, data=data, stream=True, timeout=(30, 1200)) as r:
+                    if r.status_code >= 400:
+                        error = r.json()
+                        raise RuntimeError(error.get("message", r.text))
+
+                    for line in r.iter_lines():
+                        if not line:
+                            continue
+                        event = json.loads(line)
+
+                        if event["event"] == "chunk":
+                            all_intuitive.extend(event.get("intuitive_risks", []))
+                            all_counter.extend(event.get("counterintuitive_risks", []))
+                            progress.progress(
+                                event["done"] / max(event["total_chunks"], 1),
+                                text=f'{t["analyzing"][lang_code]} {event["done"]}/{event["total_chunks"]}',
+                            )
+                            partial = combine_risks(pd.DataFrame(all_intuitive), pd.DataFrame(all_counter))
+                            if not partial.empty:
+                                live_table.markdown(
+                                    partial.to_html(classes="wraptable", index=False, escape=False, justify="left"),
+                                    unsafe_allow_html=True,
+                                )
+                        elif event["event"] == "summary":
+                            # Lista final ya consolidada (riesgos repetidos fusionados)
+                            all_intuitive = event.get("intuitive_risks", all_intuitive)
+                            all_counter = event.get("counterintuitive_risks", all_counter)
+                        elif event["event"] == "error":
+                            raise RuntimeError(event.get("message", ""))
+
+                progress.empty()
+                live_table.empty()
+                st.success(t["analysis_done"][lang_code])
+                render_combined_table(
+                    pd.DataFrame(all_intuitive), pd.DataFrame(all_counter), "Riesgos combinados", lang_code
+                )
+
+            except requests.exceptions.RequestException as e:
+                st.error(f"🌐 Error de red: {e}")
+            except Exception as e:
+                st.error(f"⚠️ Error inesperado: {e}")